@@ -0,0 +1,159 @@
+import hashlib
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import common as rt_args
+from database import update_file_stamps
+
+# gpx exports are verbose xml that compresses about 10:1.  Files not modified for ARCHIVE_AFTER_DAYS are rewritten
+# compressed, checked by decompressing them again, and only then is the original removed.  Every reader goes through
+# common.open_gpx, so an archived file is used exactly as before.
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_FORMATS = ['gz', 'zst']
+ARCHIVE_CHUNK_BYTES = 1024 * 1024
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+
+@dataclass()
+class ArchiveResult:
+    file_name: str
+    raw_size: int
+    archived_size: int
+    seconds: float
+    error: Optional[str] = None
+
+    def summary_str(self) -> str:
+        if self.error:
+            return '{}: not archived, {}'.format(self.file_name, self.error)
+
+        return '{}: {:.1f} MB -> {:.1f} MB ({:.1f}:1) in {:.2f}s'.format(
+            self.file_name, self.raw_size / 1e6, self.archived_size / 1e6,
+            self.raw_size / self.archived_size if self.archived_size else 0.0, self.seconds)
+
+
+def compressed_writer(file_loc: str, fmt: str):
+    if fmt == 'gz':
+        import gzip
+        return gzip.open(file_loc, 'wb', compresslevel=GZIP_LEVEL)
+
+    import zstandard
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(file_loc, 'wb'), closefd=True)
+
+
+def compressed_reader(file_loc: str, fmt: str):
+    if fmt == 'gz':
+        import gzip
+        return gzip.open(file_loc, 'rb')
+
+    import zstandard
+    return zstandard.ZstdDecompressor().stream_reader(open(file_loc, 'rb'), closefd=True)
+
+
+def file_digest(f) -> str:
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(ARCHIVE_CHUNK_BYTES), b''):
+        digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def archive_file(fn: str, fmt: str) -> ArchiveResult:
+    # runs in a worker process.  The compressed copy is written and checked under a temporary name, so a crash or
+    # failed check leaves the original in place and nothing the readers would pick up.
+    start = time.perf_counter()
+    raw_loc = rt_args.GPX_FILES_DIR + os.sep + fn
+    archived_loc = raw_loc + '.' + fmt
+    partial_loc = archived_loc + '.partial'
+
+    try:
+        raw_size = os.stat(raw_loc).st_size
+        raw_digest = hashlib.sha256()
+
+        with open(raw_loc, 'rb') as src, compressed_writer(partial_loc, fmt) as dst:
+            for chunk in iter(lambda: src.read(ARCHIVE_CHUNK_BYTES), b''):
+                raw_digest.update(chunk)
+                dst.write(chunk)
+
+        with compressed_reader(partial_loc, fmt) as f:
+            verified = file_digest(f) == raw_digest.hexdigest()
+
+        if not verified:
+            os.remove(partial_loc)
+            return ArchiveResult(fn, raw_size, 0, time.perf_counter() - start, 'decompressed copy does not match')
+
+        os.replace(partial_loc, archived_loc)
+        os.remove(raw_loc)
+    except OSError as e:
+        if os.path.exists(partial_loc):
+            os.remove(partial_loc)
+        return ArchiveResult(fn, 0, 0, time.perf_counter() - start, str(e))
+
+    return ArchiveResult(fn, raw_size, os.stat(archived_loc).st_size, time.perf_counter() - start)
+
+
+def files_to_archive(older_than_days: float) -> list[str]:
+    # raw gpx files not modified for older_than_days
+    cutoff = time.time() - older_than_days * 86400
+
+    with os.scandir(rt_args.GPX_FILES_DIR) as scanner:
+        return sorted(f.name for f in scanner
+                      if f.name.endswith(rt_args.GPX_SUFFIX) and f.stat().st_mtime < cutoff)
+
+
+def archive_files(file_names: list[str], fmt: str = 'gz', workers: Optional[int] = None) -> list[ArchiveResult]:
+    from concurrent.futures import ProcessPoolExecutor
+
+    results = []
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for r in executor.map(archive_file, file_names, [fmt] * len(file_names)):
+                print(r.summary_str())
+                results.append(r)
+
+                # the content is unchanged, so the catalog and segment index only need the new file's stamps
+                if r.error is None:
+                    st = os.stat(rt_args.get_file_loc(r.file_name))
+                    update_file_stamps(r.file_name, st.st_mtime_ns, st.st_size, con)
+    finally:
+        con.close()
+
+    return results
+
+
+def main():
+    import argparse
+    import importlib.util
+
+    parser = argparse.ArgumentParser(description='Compress old gpx files in place.  They stay readable by every tool.')
+    parser.add_argument('files', nargs='*', help='gpx file names (default: files not modified for --days)')
+    parser.add_argument('--days', type=float, default=ARCHIVE_AFTER_DAYS,
+                        help='archive files not modified for this many days (default {})'.format(ARCHIVE_AFTER_DAYS))
+    parser.add_argument('--format', choices=ARCHIVE_FORMATS, default='gz',
+                        help='gz, or zst which needs the zstandard package')
+    parser.add_argument('--workers', type=int, help='files compressed in parallel (default: all cores)')
+    args = parser.parse_args()
+
+    if args.format == 'zst' and importlib.util.find_spec('zstandard') is None:
+        parser.error('--format zst needs the zstandard package (pip install zstandard)')
+
+    file_names = args.files if args.files else files_to_archive(args.days)
+
+    start = time.perf_counter()
+    results = archive_files(file_names, args.format, args.workers)
+    elapsed = time.perf_counter() - start
+
+    archived = [r for r in results if r.error is None]
+    raw_size = sum(r.raw_size for r in archived)
+    archived_size = sum(r.archived_size for r in archived)
+    print('\t\tArchived {} of {} files, {:.1f} MB -> {:.1f} MB, {:.1f} MB/s'.format(
+        len(archived), len(results), raw_size / 1e6, archived_size / 1e6, raw_size / 1e6 / elapsed if elapsed else 0.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+import gpxpy
+
+import common as rt_args
+from synthetic_gpx import generate_gpx_file
+
+BENCHMARK_SIZES = [1000, 10000, 100000]
+BENCHMARK_REPEATS = 3
+BENCHMARK_DIR = rt_args.OUTPUT_DIR + 'benchmarks'
+
+# a benchmark slower than the previous run by more than this fraction is reported as a regression
+REGRESSION_THRESHOLD = 0.2
+
+# compact SegmentChannels must hold a segment in at most this fraction of the memory of gpxpy points and their
+# PointExtensions
+MEMORY_TARGET_RATIO = 5.0
+
+# modules the GUI must not load before its main window is shown
+GUI_DEFERRED_MODULES = ['gpxpy', 'PIL', 'staticmap3', 'numpy', 'openpyxl', 'track_stats', 'log_entry', 'images']
+
+
+def time_call(fn: Callable, repeats: int = BENCHMARK_REPEATS) -> dict:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    return {'min': min(timings), 'median': statistics.median(timings)}
+
+
+def first_segment(file_loc: str):
+    with open(file_loc) as f:
+        gpx = gpxpy.parse(f)
+
+    seg = gpx.tracks[0].segments[0]
+    if seg.points[0].time > seg.points[1].time:
+        seg.points.reverse()
+
+    return seg
+
+
+def populate_database(num_trips: int):
+    # num_trips log entries with stats and engine hours, inserted one row at a time as the GUI does
+    from database import create_database, add_to_database, LogEntryRecord, TrackStats, EngineHoursRecord, \
+        MaintenanceRecord
+
+    create_database()
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+
+    for i in range(num_trips):
+        start_timestamp = 1600000000 + i * 86400
+        date = str(datetime.fromtimestamp(start_timestamp).date())
+
+        entry = LogEntryRecord(start_timestamp, 'Trip ' + str(i), date, 'Crew', 'trip.gpx', 'A', 'B', 'Notes')
+        stats = TrackStats(start_timestamp, 0.0, 3600, 600, 5.0, 0.1, 4.5, 6.0, 4.4, 6.2, 10.0, 15.0, 180.0, 9.0)
+        add_to_database(entry.table_name(), entry.values_str(), con)
+        add_to_database(stats.table_name(), stats.values_str(), con)
+
+        if i % 5 == 0:
+            hours = EngineHoursRecord(date, 100.0 + i)
+            add_to_database(hours.table_name(), hours.values_str(), con)
+        if i % 10 == 0:
+            rec = MaintenanceRecord(None, date, 1 + i % 9, 1, 'Notes', 'Summary')
+            add_to_database(rec.table_name(), rec.values_str(), con)
+
+    con.close()
+
+
+def gpx_benchmarks(file_loc: str, skip: list[str]) -> dict:
+    from track_stats import get_segment_stats, calculate_wind_averages, PointExtension
+
+    results = {}
+
+    def parse():
+        with open(file_loc) as f:
+            gpxpy.parse(f)
+
+    results['parse'] = time_call(parse)
+
+    # the same file archived, which should parse at least as fast where the disk is slower than gzip
+    import gzip
+    gz_loc = file_loc + '.gz'
+    with open(file_loc, 'rb') as src, gzip.open(gz_loc, 'wb') as dst:
+        dst.write(src.read())
+
+    def parse_gz():
+        with gzip.open(gz_loc, 'rt') as f:
+            gpxpy.parse(f)
+
+    results['parse_gz'] = time_call(parse_gz)
+
+    seg = first_segment(file_loc)
+    results['get_segment_stats'] = time_call(lambda: get_segment_stats(seg, 0.05))
+
+    p_extensions = [PointExtension(p) for p in seg.points]
+    tw_data = [pe for pe in p_extensions if pe.tws is not None and pe.twd is not None]
+    results['calculate_wind_averages'] = time_call(lambda: calculate_wind_averages(tw_data))
+
+    # renders fetch map tiles, so are only meaningful with network access
+    if 'segment_image' not in skip:
+        from images import segment_image
+        results['segment_image'] = time_call(lambda: segment_image(seg), repeats=1)
+
+    return results
+
+
+def memory_benchmarks(file_loc: str) -> dict:
+    # bytes still allocated once each representation of the segment is built, so transient objects aren't counted
+    import tracemalloc
+    from track_stats import PointExtension, segment_channels
+
+    def allocated(build: Callable) -> int:
+        tracemalloc.start()
+        try:
+            held = build()
+            size, _ = tracemalloc.get_traced_memory()
+            del held
+        finally:
+            tracemalloc.stop()
+
+        return size
+
+    def gpxpy_points():
+        seg = first_segment(file_loc)
+        return seg, [PointExtension(p) for p in seg.points]
+
+    seg = first_segment(file_loc)
+    gpxpy_bytes = allocated(gpxpy_points)
+    compact_bytes = allocated(lambda: segment_channels(seg, compact=True))
+
+    return {'gpxpy_bytes': gpxpy_bytes, 'compact_bytes': compact_bytes, 'ratio': gpxpy_bytes / compact_bytes}
+
+
+def database_benchmarks(num_trips: int) -> dict:
+    from database import add_to_database, get_entry_summaries, get_maintenance_views, select_log_entry_and_hours, \
+        select_log_entry_stats, LogEntryRecord
+
+    results = {}
+    results['populate_database'] = time_call(lambda: populate_database(num_trips), repeats=1)
+
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    try:
+        next_timestamp = [2000000000]
+
+        def add_entry():
+            next_timestamp[0] += 1
+            entry = LogEntryRecord(next_timestamp[0], 'T', '2033-05-18', 'C', 'f.gpx', 'A', 'B', 'N')
+            add_to_database(entry.table_name(), entry.values_str(), con)
+
+        middle = 1600000000 + (num_trips // 2) * 86400
+
+        results['add_to_database'] = time_call(add_entry)
+        results['get_entry_summaries'] = time_call(lambda: get_entry_summaries(con))
+        results['get_maintenance_views'] = time_call(lambda: get_maintenance_views(con, 'Change engine oil'))
+        results['select_log_entry_and_hours'] = time_call(lambda: select_log_entry_and_hours(middle, con))
+        results['select_log_entry_stats'] = time_call(lambda: select_log_entry_stats(middle, con))
+    finally:
+        con.close()
+
+    return results
+
+
+def import_benchmarks() -> (dict, list[str]):
+    # each import is timed in a fresh interpreter, since modules are only ever imported once per process
+    import subprocess
+    import sys
+
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    check = ('import sys, time; t = time.perf_counter(); import gui; elapsed = time.perf_counter() - t; '
+             'print(elapsed); print(",".join(m for m in {} if m in sys.modules))'.format(GUI_DEFERRED_MODULES))
+
+    timings = []
+    loaded = []
+    for _ in range(BENCHMARK_REPEATS):
+        out = subprocess.run([sys.executable, '-c', check], cwd=package_dir, capture_output=True, text=True,
+                             check=True).stdout.splitlines()
+        timings.append(float(out[0]))
+        loaded = [m for m in out[1].split(',') if m] if len(out) > 1 else []
+
+    return {'import gui': {'min': min(timings), 'median': statistics.median(timings)}}, loaded
+
+
+def run_benchmarks(sizes: list[int], skip: list[str]) -> dict:
+    results = {}
+    saved_db_loc = rt_args.DATABASE_LOC
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            file_loc = os.path.join(tmp_dir, 'synthetic_{}.gpx'.format(size))
+            generate_gpx_file(file_loc, size, num_segments=1, reverse_every=0)
+
+            size_results = gpx_benchmarks(file_loc, skip)
+
+            # archives are sized at one trip per 100 points, so 10, 100 and 1000 trips for the default sizes
+            rt_args.DATABASE_LOC = os.path.join(tmp_dir, 'boat_log_{}.db'.format(size))
+            try:
+                size_results.update(database_benchmarks(max(size // 100, 1)))
+            finally:
+                rt_args.DATABASE_LOC = saved_db_loc
+
+            for name, timing in size_results.items():
+                print('{:>8} {:<30} min {:10.4f}s  median {:10.4f}s'.format(size, name, timing['min'],
+                                                                          timing['median']))
+
+            results[str(size)] = size_results
+
+            memory = memory_benchmarks(file_loc)
+            print('{:>8} {:<30} gpxpy {:10.1f}MB  compact {:8.1f}MB  {:.0f}x'.format(
+                size, 'segment memory', memory['gpxpy_bytes'] / 1e6, memory['compact_bytes'] / 1e6, memory['ratio']))
+            if memory['ratio'] < MEMORY_TARGET_RATIO:
+                print('\tREGRESSION compact segments are less than {:.0f}x smaller'.format(MEMORY_TARGET_RATIO))
+
+            results.setdefault('memory', {})[str(size)] = memory
+
+    return results
+
+
+def latest_results_file(results_dir: str = BENCHMARK_DIR) -> Optional[str]:
+    if not os.path.isdir(results_dir):
+        return None
+
+    files = sorted(f for f in os.listdir(results_dir) if f.endswith('.json'))
+    return os.path.join(results_dir, files[-1]) if files else None
+
+
+def save_results(results: dict, results_dir: str = BENCHMARK_DIR) -> str:
+    os.makedirs(results_dir, exist_ok=True)
+    file_loc = os.path.join(results_dir, datetime.now().strftime('%Y%m%d_%H%M%S') + '.json')
+
+    with open(file_loc, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    return file_loc
+
+
+def compare_results(previous: dict, current: dict) -> list[str]:
+    regressions = []
+    for size, size_results in current.items():
+        if size == 'memory':
+            continue
+
+        for name, timing in size_results.items():
+            before = previous.get(size, {}).get(name)
+            if before and before['min'] > 0.0 and timing['min'] > before['min'] * (1.0 + REGRESSION_THRESHOLD):
+                regressions.append('{} @ {} points: {:.4f}s -> {:.4f}s (+{:.0f}%)'.format(
+                    name, size, before['min'], timing['min'], (timing['min'] / before['min'] - 1.0) * 100.0))
+
+    return regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark ingest and query functions on synthetic data.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=BENCHMARK_SIZES, help='points per gpx segment')
+    parser.add_argument('--skip', nargs='*', default=[], help='benchmarks to skip, e.g. segment_image offline')
+    args = parser.parse_args()
+
+    previous_file = latest_results_file()
+    results = run_benchmarks(args.sizes, args.skip)
+
+    import_results, loaded = import_benchmarks()
+    results['imports'] = import_results
+    print('{:>8} {:<30} min {:10.4f}s  median {:10.4f}s'.format('', 'import gui', import_results['import gui']['min'],
+                                                              import_results['import gui']['median']))
+    if loaded:
+        print('\tREGRESSION gui startup imports deferred modules: ' + ', '.join(loaded))
+    print('\t\tSaved results to ' + save_results(results))
+
+    if previous_file:
+        with open(previous_file) as f:
+            regressions = compare_results(json.load(f), results)
+
+        print('Compared with ' + previous_file + ':')
+        for r in regressions:
+            print('\tREGRESSION ' + r)
+        if not regressions:
+            print('\tno regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Optional
+
+import common as rt_args
+from database import GpxCatalogRecord, select_catalog_stamps, replace_catalog_records, delete_catalog_records, \
+    select_catalog, replace_segment_index_records, upgrade_database, Year
+from segment_index import index_gpx_files
+from timing import span, timed, count
+
+# GPX_FILES_DIR's mtime at the last refresh.  Adding, removing or renaming a file changes it, so while it is unchanged
+# the catalog is current and listing files needs neither a directory scan nor a parse.  A file overwritten in place
+# doesn't change it, which refresh_catalog(force=True) (or running this module) picks up.
+_refreshed_dir_mtime_ns: Optional[int] = None
+
+
+def scan_gpx_file(fn: str) -> GpxCatalogRecord:
+    # parses the file once to derive everything the GUI and CLI tools filter on
+    import gpxpy
+    from gpxpy.gpx import GPXException
+
+    file_loc = rt_args.get_file_loc(fn)
+    st = os.stat(file_loc)
+
+    try:
+        with span('parse'), rt_args.open_gpx(fn) as f:
+            gpx = gpxpy.parse(f)
+    except GPXException:
+        print('\t\tCould not parse ' + fn)
+        return GpxCatalogRecord(fn, st.st_mtime_ns, st.st_size, None, None, None, None, 0, 0, None, None, None, None)
+
+    segments = [s for t in gpx.tracks for s in t.segments]
+    num_points = sum(len(s.points) for s in segments)
+    count('points parsed', num_points)
+
+    # some exports write segments newest point first, so the bounds of each segment are in either order
+    times = [t for s in segments for t in s.get_time_bounds() if t is not None]
+    start_time = min(times) if times else None
+    end_time = max(times) if times else None
+
+    bounds = gpx.get_bounds()
+
+    return GpxCatalogRecord(fn, st.st_mtime_ns, st.st_size,
+                            int(start_time.timestamp()) if start_time else None,
+                            int(end_time.timestamp()) if end_time else None,
+                            str(start_time.date()) if start_time else None,
+                            str(end_time.date()) if end_time else None,
+                            len(segments), num_points,
+                            bounds.min_latitude if bounds else None, bounds.max_latitude if bounds else None,
+                            bounds.min_longitude if bounds else None, bounds.max_longitude if bounds else None)
+
+
+@timed('refresh_catalog')
+def refresh_catalog(force: bool = False, workers: int = 1) -> int:
+    # rescans only files that are new or whose mtime or size changed, and drops removed files.  Returns the number of
+    # files scanned.
+    global _refreshed_dir_mtime_ns
+
+    dir_mtime_ns = os.stat(rt_args.GPX_FILES_DIR).st_mtime_ns
+    if not force and dir_mtime_ns == _refreshed_dir_mtime_ns:
+        return 0
+
+    with os.scandir(rt_args.GPX_FILES_DIR) as scanner:
+        on_disk = {rt_args.gpx_name(f.name): (f.stat().st_mtime_ns, f.stat().st_size) for f in scanner
+                   if rt_args.is_gpx_file(f.name)}
+
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    try:
+        cataloged = select_catalog_stamps(con)
+
+        stale = sorted(fn for fn, stamp in on_disk.items() if cataloged.get(fn) != stamp)
+        removed = [fn for fn in cataloged if fn not in on_disk]
+
+        if workers > 1 and len(stale) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                recs = list(executor.map(scan_gpx_file, stale))
+        else:
+            recs = [scan_gpx_file(fn) for fn in stale]
+
+        replace_catalog_records(recs, con)
+        delete_catalog_records(removed, con)
+
+        # new files are indexed as they are cataloged, ready for their segments to be logged
+        index_gpx_files(stale, con)
+        replace_segment_index_records(removed, [], con)
+    finally:
+        con.close()
+
+    _refreshed_dir_mtime_ns = dir_mtime_ns
+
+    return len(stale)
+
+
+def is_year(s: str) -> bool:
+    return len(s) == 4 and s.isdigit()
+
+
+def catalog_entries(year: Optional[Year] = None, refresh: bool = True) -> list[GpxCatalogRecord]:
+    # refresh=False lists the catalog as it is, for callers refreshing it in the background
+    if refresh:
+        refresh_catalog()
+
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    try:
+        return select_catalog(con, year)
+    finally:
+        con.close()
+
+
+def catalog_file_names(year: Optional[Year] = None, refresh: bool = True) -> list[str]:
+    # replacement for get_data_files filtered by the year of the tracks in each file
+    return [r.file_name for r in catalog_entries(year, refresh)]
+
+
+def catalog_entry_str(r: GpxCatalogRecord) -> str:
+    if r.start_timestamp is None:
+        return '{}: no timed points'.format(r.file_name)
+
+    start = datetime.fromtimestamp(r.start_timestamp, timezone.utc)
+    end = datetime.fromtimestamp(r.end_timestamp, timezone.utc)
+
+    return '{}: {:%Y-%m-%d %H:%M} - {:%Y-%m-%d %H:%M}, {} segments, {} points, lat {:.3f}..{:.3f} lon {:.3f}..{:.3f}'\
+        .format(r.file_name, start, end, r.num_segments, r.num_points, r.min_lat, r.max_lat, r.min_lon, r.max_lon)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Catalog the gpx files directory and list its files.')
+    parser.add_argument('--year', type=int, help='only list files with a track in this year')
+    parser.add_argument('--workers', type=int, default=1, help='number of files scanned in parallel (default 1)')
+    args = parser.parse_args()
+
+    # the catalog tables are added by upgrade_database, which the GUI runs at startup but a database only ever
+    # opened by the command line tools may not have had yet
+    upgrade_database()
+
+    num_scanned = refresh_catalog(force=True, workers=args.workers)
+    print('\t\tScanned {} new or changed files'.format(num_scanned))
+
+    for r in catalog_entries(args.year):
+        print(catalog_entry_str(r))
+
+
+if __name__ == '__main__':
+    main()
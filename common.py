@@ -1,4 +1,6 @@
+import mmap
 import os
+from contextlib import contextmanager
 
 DATA_DIR = './data/'
 GPX_FILES_DIR = DATA_DIR + os.sep + 'gpx_files'
@@ -7,9 +9,23 @@ TRACK_IMAGES_DIR = DATA_DIR + os.sep + 'track_images'
 OUTPUT_DIR = './output/'
 DATABASE_LOC = 'boat_log.db'
 
+# gpx files archived by archive.py keep their name with one of these appended, and are read with streaming
+# decompression.  Everything else refers to them by their .gpx name.
+GPX_SUFFIX = '.gpx'
+GPX_COMPRESSED_SUFFIXES = ['.gz', '.zst']
+
+def gpx_name(fn: str) -> str:
+    for suffix in GPX_COMPRESSED_SUFFIXES:
+        if fn.endswith(GPX_SUFFIX + suffix):
+            return fn[:-len(suffix)]
+    return fn
+
+def is_gpx_file(fn: str) -> bool:
+    return gpx_name(fn).endswith(GPX_SUFFIX)
+
 def get_data_files() :
     scanner = os.scandir(GPX_FILES_DIR)
-    data_files = sorted([f.name for f in scanner if '.gpx' in f.name])
+    data_files = sorted({gpx_name(f.name) for f in scanner if is_gpx_file(f.name)})
     scanner.close()
 
     data_files.reverse()
@@ -17,11 +33,55 @@ def get_data_files() :
     return data_files
 
 def get_file_loc(fn: str) -> str:
-    if fn.endswith('.gpx'):
-        return GPX_FILES_DIR + os.sep + fn
+    if is_gpx_file(fn):
+        # the raw file if it is still there, otherwise its archived copy
+        file_loc = GPX_FILES_DIR + os.sep + fn
+        if not os.path.exists(file_loc) and fn.endswith(GPX_SUFFIX):
+            for suffix in GPX_COMPRESSED_SUFFIXES:
+                if os.path.exists(file_loc + suffix):
+                    return file_loc + suffix
+        return file_loc
     else:
         return TRACK_IMAGES_DIR + os.sep + fn
 
+def is_compressed(file_loc: str) -> bool:
+    return any(file_loc.endswith(suffix) for suffix in GPX_COMPRESSED_SUFFIXES)
+
+def open_gpx(fn: str, mode: str = 'r'):
+    # a gpx file for reading, decompressing as it is read if it has been archived.  mode is 'r' or 'rb'.
+    file_loc = get_file_loc(fn)
+
+    if file_loc.endswith('.gz'):
+        import gzip
+        return gzip.open(file_loc, mode if 'b' in mode else 'rt')
+
+    if file_loc.endswith('.zst'):
+        import io
+        import zstandard
+
+        reader = zstandard.ZstdDecompressor().stream_reader(open(file_loc, 'rb'), closefd=True)
+        return reader if 'b' in mode else io.TextIOWrapper(reader)
+
+    return open(file_loc, mode)
+
+@contextmanager
+def map_gpx(fn: str):
+    # the whole file as bytes for scanning: memory mapped when raw, decompressed into memory when archived
+    file_loc = get_file_loc(fn)
+
+    if is_compressed(file_loc):
+        with open_gpx(fn, 'rb') as f:
+            yield f.read()
+        return
+
+    with open(file_loc, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
 def select_data_file() -> str:
     data_files = get_data_files()
 
@@ -1,11 +1,16 @@
+import re
 from dataclasses import dataclass, astuple
 from sqlite3 import Connection
-from typing import Optional, List
+from typing import Optional, List, Tuple, Iterator, Union
 
 import common as rt_args
+from timing import timed
 
 import sqlite3
 
+# a year to filter by, as an int from the command line tools or as the 4 digit text typed into the GUI
+Year = Union[int, str]
+
 
 @dataclass
 class LogEntryRecord:
@@ -64,6 +69,89 @@ class TrackStats:
         return base_str.replace(', None', ', Null')
 
 
+@dataclass
+class BestEffortRecord:
+    start_timestamp: int
+    duration_seconds: int
+    sog_best: Optional[float]
+    stw_best: Optional[float]
+    tws_peak: Optional[float]
+
+    def table_name(self) -> str:
+        return 'TRACK_BEST_EFFORTS'
+
+    def values_str(self) -> str:
+        base_str = str(astuple(self))
+        return base_str.replace(', None', ', Null')
+
+
+@dataclass
+class ManeuverRecord:
+    start_timestamp: int
+    maneuver_timestamp: int
+    kind: str
+    twa_before: Optional[float]
+    twa_after: Optional[float]
+    stw_before: Optional[float]
+    stw_min: Optional[float]
+    speed_loss: Optional[float]
+
+    def table_name(self) -> str:
+        return 'MANEUVER'
+
+    def values_str(self) -> str:
+        base_str = str(astuple(self))
+        return base_str.replace(', None', ', Null')
+
+
+@dataclass
+class ManeuverAnalysisRecord:
+    start_timestamp: int
+    num_maneuvers: int
+
+    def table_name(self) -> str:
+        return 'MANEUVER_ANALYSIS'
+
+    def values_str(self) -> str:
+        return str(astuple(self))
+
+
+@dataclass
+class GpxCatalogRecord:
+    file_name: str
+    mtime_ns: int
+    size: int
+    start_timestamp: Optional[int]
+    end_timestamp: Optional[int]
+    start_date: Optional[str]
+    end_date: Optional[str]
+    num_segments: int
+    num_points: int
+    min_lat: Optional[float]
+    max_lat: Optional[float]
+    min_lon: Optional[float]
+    max_lon: Optional[float]
+
+    def table_name(self) -> str:
+        return 'GPX_FILE_CATALOG'
+
+
+@dataclass
+class SegmentIndexRecord:
+    # where a segment's <trkseg> element is in its gpx file, so it can be read without parsing the rest.  mtime_ns
+    # and size are the file's when indexed; the offsets are only trusted while they still match.
+    file_name: str
+    start_timestamp: int
+    offset: int
+    length: int
+    header_length: int
+    mtime_ns: int
+    size: int
+
+    def table_name(self) -> str:
+        return 'GPX_SEGMENT_INDEX'
+
+
 @dataclass
 class LogEntrySummary:
     start_timestamp: int
@@ -160,15 +248,32 @@ MAINTENANCE_VIEW_BASE_QRY = """
         LEFT OUTER JOIN ENGINE_HOURS on MAINTENANCE.service_date = ENGINE_HOURS.date
     """
 
-MAINTENANCE_EXPORT_QRY = """
+MAINTENANCE_EXPORT_BASE_QRY = """
         SELECT service_date, ifnull(hours, '') as engine_hours, description as action, name as provider, summary, notes
         FROM MAINTENANCE
             INNER JOIN provider on MAINTENANCE.provider_id = provider.id
             INNER JOIN UPKEEP_ACTION on MAINTENANCE.work_type_id = UPKEEP_ACTION.id
             LEFT OUTER JOIN ENGINE_HOURS on MAINTENANCE.service_date = ENGINE_HOURS.date
-        ORDER BY service_date, action
     """
 
+MAINTENANCE_EXPORT_QRY = MAINTENANCE_EXPORT_BASE_QRY + ' ORDER BY service_date, action'
+
+TRIP_EXPORT_BASE_QRY = """
+        SELECT L.date, L.title, L.crew, L.start_loc, L.end_loc, round(T.moving_time_seconds / 3600.0, 2) as moving_hours,
+            T.moving_distance, T.sog_avg, T.sog_max, T.stw_avg, T.stw_max, T.tws_avg, T.tws_max, T.avg_wind_dir,
+            ifnull(E.hours, '') as engine_hours, L.notes
+        FROM LOG_ENTRY as L
+            LEFT OUTER JOIN TRACK_STATS as T on L.start_timestamp = T.start_timestamp
+            LEFT OUTER JOIN ENGINE_HOURS as E on L.date = E.date
+    """
+
+# export name -> (base query, date column, order by)
+EXPORT_QRYS = {
+    'maintenance': (MAINTENANCE_EXPORT_BASE_QRY, 'service_date', 'service_date, action'),
+    'trips': (TRIP_EXPORT_BASE_QRY, 'L.date', 'L.date, L.start_timestamp'),
+}
+
+@timed('db.add_to_database', counter='queries issued')
 def add_to_database(tbl_name: str, values_str: str, con: Connection):
     stmt = "INSERT INTO " + tbl_name + " VALUES " + values_str
 
@@ -177,11 +282,30 @@ def add_to_database(tbl_name: str, values_str: str, con: Connection):
     con.commit()
 
 
+@timed('db.insert_all', counter='queries issued')
+def insert_all(tbl_name: str, values_strs: List[str], con: Connection):
+    # one multi-row insert, left uncommitted so inserts into several tables can share a transaction
+    if not values_strs:
+        return
+
+    stmt = "INSERT INTO " + tbl_name + " VALUES " + ', '.join(values_strs)
+
+    cur = con.cursor()
+    cur.execute(stmt)
+
+
+def add_all_to_database(tbl_name: str, values_strs: List[str], con: Connection):
+    # one multi-row insert and a single commit, for batches where a commit per row would dominate
+    insert_all(tbl_name, values_strs, con)
+    con.commit()
+
+
 LOG_ENTRY_SUMMARY_BASE_QRY = 'select * from LOG_ENTRY_SUMMARY'
 
 LOG_ENTRY_SUMMARIES_QRY = LOG_ENTRY_SUMMARY_BASE_QRY + ' Order By date, start_timestamp'
 
 
+@timed('db.get_entry_summaries', counter='queries issued')
 def get_entry_summaries(con: Connection) -> List[LogEntrySummary]:
     cur = con.cursor()
     res = cur.execute(LOG_ENTRY_SUMMARIES_QRY)
@@ -195,6 +319,7 @@ def get_entry_summaries(con: Connection) -> List[LogEntrySummary]:
     return return_val
 
 
+@timed('db.get_action_types', counter='queries issued')
 def get_action_types(con: Connection) -> List[UpkeepActionRecord]:
     cur = con.cursor()
 
@@ -210,6 +335,7 @@ def get_action_types(con: Connection) -> List[UpkeepActionRecord]:
     return return_val
 
 
+@timed('db.get_providers', counter='queries issued')
 def get_providers(con: Connection) -> List[ProviderRecord]:
     cur = con.cursor()
 
@@ -225,6 +351,28 @@ def get_providers(con: Connection) -> List[ProviderRecord]:
     return return_val
 
 
+@timed('db.select_engine_hours', counter='queries issued')
+def select_engine_hours(con: Connection) -> List[EngineHoursRecord]:
+    cur = con.cursor()
+    res = cur.execute('SELECT date, hours FROM ENGINE_HOURS ORDER BY date')
+
+    return [EngineHoursRecord(*r) for r in res.fetchall()]
+
+
+@timed('db.select_service_dates', counter='queries issued')
+def select_service_dates(con: Connection) -> dict[int, List[str]]:
+    # upkeep action id -> the dates it was done, oldest first, for every action in one query
+    cur = con.cursor()
+    res = cur.execute('SELECT work_type_id, service_date FROM MAINTENANCE ORDER BY service_date')
+
+    service_dates: dict[int, List[str]] = {}
+    for work_type_id, service_date in res.fetchall():
+        service_dates.setdefault(work_type_id, []).append(service_date)
+
+    return service_dates
+
+
+@timed('db.get_maintenance_views', counter='queries issued')
 def get_maintenance_views(con: Connection, action_desc: str) -> List[MaintenanceRecordView]:
     cur = con.cursor()
 
@@ -241,6 +389,16 @@ def get_maintenance_views(con: Connection, action_desc: str) -> List[Maintenance
     return return_val
 
 
+@timed('db.select_maintenance_view', counter='queries issued')
+def select_maintenance_view(an_id: int, con: Connection) -> Optional[MaintenanceRecordView]:
+    cur = con.cursor()
+    res = cur.execute(MAINTENANCE_VIEW_BASE_QRY + 'where MAINTENANCE.id = ?', (an_id,))
+    a_rec = res.fetchone()
+
+    return MaintenanceRecordView(*a_rec) if a_rec else None
+
+
+@timed('db.select_log_summary', counter='queries issued')
 def select_log_summary(an_id: int, con: Connection) -> Optional[LogEntrySummary]:
     qry_str = LOG_ENTRY_SUMMARY_BASE_QRY + ' WHERE start_timestamp=' + str(an_id)
     cur = con.cursor()
@@ -250,6 +408,7 @@ def select_log_summary(an_id: int, con: Connection) -> Optional[LogEntrySummary]
     return LogEntrySummary(*a_rec)
 
 
+@timed('db.select_log_entry', counter='queries issued')
 def select_log_entry(an_id: int, con: Connection) -> Optional[LogEntryRecord]:
     cur = con.cursor()
     res = cur.execute("select * from LOG_ENTRY WHERE start_timestamp=" + str(an_id))
@@ -258,6 +417,7 @@ def select_log_entry(an_id: int, con: Connection) -> Optional[LogEntryRecord]:
     return LogEntryRecord(*a_rec)
 
 
+@timed('db.select_log_entry_and_hours', counter='queries issued')
 def select_log_entry_and_hours(an_id: int, con: Connection) -> Optional[LogEntryAndHoursView]:
     cur = con.cursor()
     res = cur.execute("select * from LOG_ENTRY_HOURS_VIEW WHERE start_timestamp=" + str(an_id))
@@ -266,6 +426,7 @@ def select_log_entry_and_hours(an_id: int, con: Connection) -> Optional[LogEntry
     return LogEntryAndHoursView(*a_rec)
 
 
+@timed('db.select_log_entry_stats', counter='queries issued')
 def select_log_entry_stats(an_id: int, con: Connection) -> Optional[TrackStats]:
     cur = con.cursor()
     res = cur.execute("select * from TRACK_STATS WHERE start_timestamp=" + str(an_id))
@@ -274,6 +435,320 @@ def select_log_entry_stats(an_id: int, con: Connection) -> Optional[TrackStats]:
     return TrackStats(*a_rec)
 
 
+@timed('db.select_track_refs', counter='queries issued')
+def select_track_refs(con: Connection, year: Optional[Year] = None, min_tws: Optional[float] = None,
+                      max_tws: Optional[float] = None) -> List[Tuple[str, int]]:
+    qry_str = """
+        SELECT L.path_to_gpx_file, L.start_timestamp FROM LOG_ENTRY as L
+        LEFT JOIN TRACK_STATS as T ON L.start_timestamp = T.start_timestamp
+    """
+    conditions = []
+    params = []
+
+    # a date range rather than LIKE, so the LOG_ENTRY date index can be used
+    if year:
+        conditions.append('L.date >= ? AND L.date < ?')
+        params.extend([str(year) + '-', str(int(year) + 1) + '-'])
+    if min_tws is not None:
+        conditions.append('T.tws_avg >= ?')
+        params.append(min_tws)
+    if max_tws is not None:
+        conditions.append('T.tws_avg <= ?')
+        params.append(max_tws)
+
+    if conditions:
+        qry_str = qry_str + ' WHERE ' + ' AND '.join(conditions)
+
+    cur = con.cursor()
+    res = cur.execute(qry_str + ' ORDER BY L.path_to_gpx_file, L.start_timestamp', params)
+
+    return [(r[0], r[1]) for r in res.fetchall()]
+
+
+@timed('db.select_overlapping_entries', counter='queries issued')
+def select_overlapping_entries(start_timestamp: int, end_timestamp: int, con: Connection) -> List[int]:
+    # logged trips whose time span overlaps the given one.  A trip ends moving + stopped seconds after it starts.
+    cur = con.cursor()
+    res = cur.execute("""
+        SELECT L.start_timestamp FROM LOG_ENTRY as L
+        LEFT JOIN TRACK_STATS as T ON L.start_timestamp = T.start_timestamp
+        WHERE L.start_timestamp <= ?
+            AND L.start_timestamp + ifnull(T.moving_time_seconds, 0) + ifnull(T.stopped_time_seconds, 0) >= ?
+    """, (end_timestamp, start_timestamp))
+
+    return [r[0] for r in res.fetchall()]
+
+
+def select_best_effort_timestamps(con: Connection) -> set:
+    cur = con.cursor()
+    res = cur.execute('select distinct start_timestamp from TRACK_BEST_EFFORTS')
+
+    return set(r[0] for r in res.fetchall())
+
+
+def select_maneuver_timestamps(con: Connection) -> set:
+    # trips already analyzed.  Trips without a single maneuver only have their MANEUVER_ANALYSIS row, and trips
+    # analyzed before that table existed only have their MANEUVER rows.
+    cur = con.cursor()
+    res = cur.execute('select start_timestamp from MANEUVER_ANALYSIS union select start_timestamp from MANEUVER')
+
+    return set(r[0] for r in res.fetchall())
+
+
+@dataclass
+class TripRanking:
+    start_timestamp: int
+    date: str
+    title: str
+    crew: str
+    value: Optional[float]
+
+    def summary_string(self, units: str) -> str:
+        value = 'n/a' if self.value is None else '{:.2f}'.format(self.value)
+        return self.date + ': ' + self.title + ', ' + value + ' ' + units
+
+
+# metric name -> (column ranked on, units).  Sustained TWS comes from TRACK_BEST_EFFORTS for a chosen window.
+RANKING_METRICS = {
+    'fastest': ('T.stw_max', 'kts'),
+    'windiest': ('B.tws_peak', 'kts'),
+    'longest': ('T.moving_distance', 'nm'),
+    'avg-sog': ('T.sog_avg', 'kts'),
+}
+
+
+@timed('db.iter_top_trips', counter='queries issued')
+def iter_top_trips(con: Connection, metric: str, n: int = 10, year: Optional[Year] = None,
+                   crew: Optional[str] = None, sustained_seconds: int = 600) -> Iterator[TripRanking]:
+    column, _ = RANKING_METRICS[metric]
+
+    qry_str = """
+        SELECT L.start_timestamp, L.date, L.title, L.crew, """ + column + """ as value
+        FROM LOG_ENTRY as L
+        INNER JOIN TRACK_STATS as T ON L.start_timestamp = T.start_timestamp
+    """
+    conditions = [column + ' IS NOT NULL']
+    params = []
+
+    if metric == 'windiest':
+        qry_str = qry_str + """
+        INNER JOIN TRACK_BEST_EFFORTS as B ON L.start_timestamp = B.start_timestamp AND B.duration_seconds = ?
+        """
+        params.append(sustained_seconds)
+
+    # a date range rather than LIKE, so the LOG_ENTRY date index can be used
+    if year:
+        conditions.append('L.date >= ? AND L.date < ?')
+        params.extend([str(year) + '-', str(int(year) + 1) + '-'])
+    if crew:
+        conditions.append('L.crew LIKE ?')
+        params.append('%' + crew + '%')
+
+    qry_str = qry_str + ' WHERE ' + ' AND '.join(conditions) + ' ORDER BY value DESC LIMIT ?'
+    params.append(n)
+
+    cur = con.cursor()
+    for r in cur.execute(qry_str, params):
+        yield TripRanking(*r)
+
+
+@dataclass
+class SearchHit:
+    id: int
+    date: str
+    title: str
+    snippet: str
+    rank: float
+
+    def summary_string(self) -> str:
+        return self.date + ': ' + self.title + ' - ' + self.snippet
+
+
+# matched terms in a snippet are wrapped in these
+SEARCH_MATCH_MARKS = ('[', ']')
+SEARCH_SNIPPET_TOKENS = 10
+
+# bm25 weight of each indexed column, so a match in a title or summary outranks one buried in the notes
+LOG_ENTRY_SEARCH_WEIGHTS = (10.0, 2.0, 2.0, 2.0, 1.0)
+MAINTENANCE_SEARCH_WEIGHTS = (5.0, 1.0)
+
+
+def fts_query(text: str) -> str:
+    # each word of free text as a quoted prefix, so punctuation can't be read as FTS5 syntax and 'impel' finds
+    # 'impeller'.  Every word has to match.
+    return ' '.join('"' + w + '"*' for w in re.findall(r'\w+', text))
+
+
+@timed('db.search_log_entries', counter='queries issued')
+def search_log_entries(con: Connection, text: str, limit: int = 50) -> List[SearchHit]:
+    # log entries whose title, crew, locations or notes match text, best match first
+    query = fts_query(text)
+    if not query:
+        return []
+
+    cur = con.cursor()
+    res = cur.execute("""
+        SELECT L.start_timestamp, L.date, L.title, snippet(LOG_ENTRY_FTS, -1, ?, ?, '...', ?),
+            bm25(LOG_ENTRY_FTS, """ + ', '.join(map(str, LOG_ENTRY_SEARCH_WEIGHTS)) + """) as score
+        FROM LOG_ENTRY_FTS
+            INNER JOIN LOG_ENTRY as L ON L.start_timestamp = LOG_ENTRY_FTS.rowid
+        WHERE LOG_ENTRY_FTS MATCH ?
+        ORDER BY score LIMIT ?
+    """, (*SEARCH_MATCH_MARKS, SEARCH_SNIPPET_TOKENS, query, limit))
+
+    return [SearchHit(*r) for r in res.fetchall()]
+
+
+@timed('db.search_maintenance', counter='queries issued')
+def search_maintenance(con: Connection, text: str, limit: int = 50) -> List[SearchHit]:
+    # maintenance records whose summary or notes match text, best match first.  The title is the action.
+    query = fts_query(text)
+    if not query:
+        return []
+
+    cur = con.cursor()
+    res = cur.execute("""
+        SELECT M.id, M.service_date, UPKEEP_ACTION.description, snippet(MAINTENANCE_FTS, -1, ?, ?, '...', ?),
+            bm25(MAINTENANCE_FTS, """ + ', '.join(map(str, MAINTENANCE_SEARCH_WEIGHTS)) + """) as score
+        FROM MAINTENANCE_FTS
+            INNER JOIN MAINTENANCE as M ON M.id = MAINTENANCE_FTS.rowid
+            INNER JOIN UPKEEP_ACTION ON M.work_type_id = UPKEEP_ACTION.id
+        WHERE MAINTENANCE_FTS MATCH ?
+        ORDER BY score LIMIT ?
+    """, (*SEARCH_MATCH_MARKS, SEARCH_SNIPPET_TOKENS, query, limit))
+
+    return [SearchHit(*r) for r in res.fetchall()]
+
+
+@timed('db.iter_export_rows', counter='queries issued')
+def iter_export_rows(con: Connection, name: str, start_date: Optional[str] = None,
+                     end_date: Optional[str] = None) -> Iterator[tuple]:
+    # rows come straight off the cursor, so an export never holds more than one row.  Dates are inclusive
+    # YYYY-MM-DD strings, compared in SQL so the date indexes can be used.
+    base_qry, date_column, order_by = EXPORT_QRYS[name]
+
+    conditions = []
+    params = []
+    if start_date:
+        conditions.append(date_column + ' >= ?')
+        params.append(start_date)
+    if end_date:
+        conditions.append(date_column + ' <= ?')
+        params.append(end_date)
+
+    qry_str = base_qry
+    if conditions:
+        qry_str = qry_str + ' WHERE ' + ' AND '.join(conditions)
+    qry_str = qry_str + ' ORDER BY ' + order_by
+
+    cur = con.cursor()
+    for r in cur.execute(qry_str, params):
+        yield r
+
+
+@timed('db.select_catalog_stamps', counter='queries issued')
+def select_catalog_stamps(con: Connection) -> dict[str, Tuple[int, int]]:
+    # file name -> (mtime_ns, size) when it was cataloged
+    cur = con.cursor()
+    res = cur.execute('SELECT file_name, mtime_ns, size FROM GPX_FILE_CATALOG')
+
+    return {r[0]: (r[1], r[2]) for r in res.fetchall()}
+
+
+@timed('db.replace_catalog_records', counter='queries issued')
+def replace_catalog_records(recs: List[GpxCatalogRecord], con: Connection):
+    # parameters rather than values_str, as file names may contain quotes
+    if not recs:
+        return
+
+    stmt = 'INSERT OR REPLACE INTO GPX_FILE_CATALOG VALUES (' + ', '.join(['?'] * 13) + ')'
+
+    cur = con.cursor()
+    cur.executemany(stmt, [astuple(r) for r in recs])
+    con.commit()
+
+
+@timed('db.delete_catalog_records', counter='queries issued')
+def delete_catalog_records(file_names: List[str], con: Connection):
+    if not file_names:
+        return
+
+    cur = con.cursor()
+    cur.executemany('DELETE FROM GPX_FILE_CATALOG WHERE file_name = ?', [(fn,) for fn in file_names])
+    con.commit()
+
+
+@timed('db.select_catalog', counter='queries issued')
+def select_catalog(con: Connection, year: Optional[Year] = None) -> List[GpxCatalogRecord]:
+    # files with a track in the given year, newest file name first as get_data_files lists them.  A file spanning
+    # new year matches both years.  Files without point times fall back to matching the year in their name.
+    qry_str = 'SELECT * FROM GPX_FILE_CATALOG'
+    params = []
+
+    if year:
+        qry_str = qry_str + ' WHERE (start_date <= ? AND end_date >= ?) OR (start_date IS NULL AND file_name LIKE ?)'
+        params.extend([str(year) + '-12-31', str(year) + '-01-01', '%' + str(year) + '%'])
+
+    cur = con.cursor()
+    res = cur.execute(qry_str + ' ORDER BY file_name DESC', params)
+
+    return [GpxCatalogRecord(*r) for r in res.fetchall()]
+
+
+@timed('db.select_segment_index', counter='queries issued')
+def select_segment_index(file_name: str, start_timestamp: int, con: Connection) -> Optional[SegmentIndexRecord]:
+    cur = con.cursor()
+    res = cur.execute('SELECT * FROM GPX_SEGMENT_INDEX WHERE file_name = ? AND start_timestamp = ?',
+                      (file_name, start_timestamp))
+    r = res.fetchone()
+
+    return SegmentIndexRecord(*r) if r else None
+
+
+@timed('db.replace_segment_index_records', counter='queries issued')
+def replace_segment_index_records(file_names: List[str], recs: List[SegmentIndexRecord], con: Connection):
+    # every segment of the given files, replacing what was indexed for them before
+    if not file_names:
+        return
+
+    cur = con.cursor()
+    cur.executemany('DELETE FROM GPX_SEGMENT_INDEX WHERE file_name = ?', [(fn,) for fn in file_names])
+    cur.executemany('INSERT OR REPLACE INTO GPX_SEGMENT_INDEX VALUES (' + ', '.join(['?'] * 7) + ')',
+                    [astuple(r) for r in recs])
+    con.commit()
+
+
+@timed('db.update_file_stamps', counter='queries issued')
+def update_file_stamps(file_name: str, mtime_ns: int, size: int, con: Connection):
+    # for a file rewritten without changing its content, such as by archiving it, so the catalog and segment index
+    # stay current rather than being rebuilt
+    cur = con.cursor()
+    cur.execute('UPDATE GPX_FILE_CATALOG SET mtime_ns = ?, size = ? WHERE file_name = ?', (mtime_ns, size, file_name))
+    cur.execute('UPDATE GPX_SEGMENT_INDEX SET mtime_ns = ?, size = ? WHERE file_name = ?',
+                (mtime_ns, size, file_name))
+    con.commit()
+
+
+def create_ranking_indexes():
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    cur = con.cursor()
+
+    cur.executescript("""
+        BEGIN;
+
+        CREATE INDEX IF NOT EXISTS TRACK_STATS_STW_MAX_IDX ON TRACK_STATS (stw_max);
+        CREATE INDEX IF NOT EXISTS TRACK_STATS_MOVING_DISTANCE_IDX ON TRACK_STATS (moving_distance);
+        CREATE INDEX IF NOT EXISTS TRACK_STATS_SOG_AVG_IDX ON TRACK_STATS (sog_avg);
+        CREATE INDEX IF NOT EXISTS TRACK_BEST_EFFORTS_TWS_IDX ON TRACK_BEST_EFFORTS (duration_seconds, tws_peak);
+        CREATE INDEX IF NOT EXISTS LOG_ENTRY_DATE_IDX ON LOG_ENTRY (date);
+        CREATE INDEX IF NOT EXISTS MAINTENANCE_DATE_IDX ON MAINTENANCE (service_date);
+
+        COMMIT;
+    """)
+
+    con.close()
+
+
 def create_database():
     con = sqlite3.connect(rt_args.DATABASE_LOC)
     cur = con.cursor()
@@ -333,12 +808,45 @@ def create_database():
 
     create_maintenance_tables()
     create_engine_hours_table()
+    upgrade_database()
 
-def create_engine_hours_table():
+
+# tables added after the original schema.  Each is created only if missing, so this is safe to run on every startup.
+def upgrade_database():
+    create_best_efforts_table()
+    create_maneuver_table()
+    create_ranking_indexes()
+    create_gpx_catalog_table()
+    create_segment_index_table()
+    create_search_tables()
+
+
+def create_best_efforts_table():
     con = sqlite3.connect(rt_args.DATABASE_LOC)
     cur = con.cursor()
 
     cur.execute("""
+     CREATE TABLE IF NOT EXISTS TRACK_BEST_EFFORTS (
+        start_timestamp integer,
+        duration_seconds integer,
+        sog_best real,
+        stw_best real,
+        tws_peak real,
+        PRIMARY KEY (start_timestamp, duration_seconds),
+     FOREIGN KEY (start_timestamp)
+        REFERENCES LOG_ENTRY (start_timestamp)
+            ON DELETE CASCADE
+            ON UPDATE NO ACTION
+    )
+    """)
+
+    con.close()
+
+def create_engine_hours_table():
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    cur = con.cursor()
+
+    cur.executescript("""
         BEGIN;
 
         CREATE TABLE ENGINE_HOURS (
@@ -354,7 +862,7 @@ def create_maintenance_tables():
     con = sqlite3.connect(rt_args.DATABASE_LOC)
     cur = con.cursor()
 
-    cur.execute("""
+    cur.executescript("""
         BEGIN;
         
         CREATE TABLE UPKEEP_ACTION (
@@ -375,7 +883,7 @@ def create_maintenance_tables():
         COMMIT;   
     """)
 
-    cur.execute("""
+    cur.executescript("""
         BEGIN;
 
         CREATE TABLE PROVIDER (
@@ -391,7 +899,7 @@ def create_maintenance_tables():
         COMMIT;        
     """)
 
-    cur.execute("""
+    cur.executescript("""
         BEGIN;
         
         CREATE TABLE MAINTENANCE (
@@ -411,3 +919,179 @@ def create_maintenance_tables():
         
         COMMIT;                
      """)
+
+
+def create_maneuver_table():
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    cur = con.cursor()
+
+    cur.execute("""
+     CREATE TABLE IF NOT EXISTS MANEUVER (
+        start_timestamp integer,
+        maneuver_timestamp integer,
+        kind text,
+        twa_before real,
+        twa_after real,
+        stw_before real,
+        stw_min real,
+        speed_loss real,
+        PRIMARY KEY (start_timestamp, maneuver_timestamp),
+     FOREIGN KEY (start_timestamp)
+        REFERENCES LOG_ENTRY (start_timestamp)
+            ON DELETE CASCADE
+            ON UPDATE NO ACTION
+    )
+    """)
+
+    # one row per analyzed trip, so trips with no maneuvers aren't parsed again on every run
+    cur.execute("""
+     CREATE TABLE IF NOT EXISTS MANEUVER_ANALYSIS (
+        start_timestamp integer PRIMARY KEY,
+        num_maneuvers integer,
+     FOREIGN KEY (start_timestamp)
+        REFERENCES LOG_ENTRY (start_timestamp)
+            ON DELETE CASCADE
+            ON UPDATE NO ACTION
+    )
+    """)
+
+    con.close()
+
+
+def create_gpx_catalog_table():
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    cur = con.cursor()
+
+    cur.execute("""
+     CREATE TABLE IF NOT EXISTS GPX_FILE_CATALOG (
+        file_name text PRIMARY KEY,
+        mtime_ns integer,
+        size integer,
+        start_timestamp integer,
+        end_timestamp integer,
+        start_date text,
+        end_date text,
+        num_segments integer,
+        num_points integer,
+        min_lat real,
+        max_lat real,
+        min_lon real,
+        max_lon real
+    )
+    """)
+
+    con.close()
+
+
+def create_segment_index_table():
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    cur = con.cursor()
+
+    cur.execute("""
+     CREATE TABLE IF NOT EXISTS GPX_SEGMENT_INDEX (
+        file_name text,
+        start_timestamp integer,
+        offset integer,
+        length integer,
+        header_length integer,
+        mtime_ns integer,
+        size integer,
+        PRIMARY KEY (file_name, start_timestamp)
+    )
+    """)
+
+    con.close()
+
+
+# full text indexes over the logbook and maintenance notes.  They are external content tables, holding only the index
+# with the text read through a view of LOG_ENTRY and MAINTENANCE, and triggers keep them in step with every insert,
+# update and delete.  (table, rowid column, indexed columns)
+SEARCH_INDEXES = [
+    ('LOG_ENTRY', 'start_timestamp', ['title', 'crew', 'start_loc', 'end_loc', 'notes']),
+    ('MAINTENANCE', 'id', ['summary', 'notes']),
+]
+
+# values_str writes line breaks and tabs in a multi-line note as the escapes \n, \r and \t, which the tokenizer would
+# read as a letter joined onto the next word.  The views and triggers index every column through this, so the index,
+# its deletes and the snippets all see the same text.
+SEARCH_TEXT_SQL = "replace(replace(replace({}, '\\r', ' '), '\\n', ' '), '\\t', ' ')"
+
+
+def create_search_tables():
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    cur = con.cursor()
+
+    for tbl, rowid, columns in SEARCH_INDEXES:
+        fts = tbl + '_FTS'
+        view = tbl + '_SEARCH_VIEW'
+        new_values = ', '.join(['new.' + rowid] + [SEARCH_TEXT_SQL.format('new.' + c) for c in columns])
+        old_values = ', '.join(['old.' + rowid] + [SEARCH_TEXT_SQL.format('old.' + c) for c in columns])
+        view_columns = ', '.join([rowid] + [SEARCH_TEXT_SQL.format(c) + ' as ' + c for c in columns])
+        fts_columns = ', '.join(['rowid'] + columns)
+
+        exists = cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = ?", (view,)).fetchone()
+
+        # indexes from before the view read the text as stored, so they are dropped and built again
+        if not exists:
+            cur.executescript("""
+                DROP TRIGGER IF EXISTS {fts}_AI;
+                DROP TRIGGER IF EXISTS {fts}_AD;
+                DROP TRIGGER IF EXISTS {fts}_AU;
+                DROP TABLE IF EXISTS {fts};
+            """.format(fts=fts))
+
+        cur.executescript("""
+            BEGIN;
+
+            CREATE VIEW IF NOT EXISTS {view} AS SELECT {view_columns} FROM {tbl};
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{view}', content_rowid='{rowid}',
+                tokenize='porter unicode61 remove_diacritics 2');
+
+            CREATE TRIGGER IF NOT EXISTS {fts}_AI AFTER INSERT ON {tbl} BEGIN
+                INSERT INTO {fts}({fts_columns}) VALUES ({new});
+            END;
+            CREATE TRIGGER IF NOT EXISTS {fts}_AD AFTER DELETE ON {tbl} BEGIN
+                INSERT INTO {fts}({fts}, {fts_columns}) VALUES ('delete', {old});
+            END;
+            CREATE TRIGGER IF NOT EXISTS {fts}_AU AFTER UPDATE ON {tbl} BEGIN
+                INSERT INTO {fts}({fts}, {fts_columns}) VALUES ('delete', {old});
+                INSERT INTO {fts}({fts_columns}) VALUES ({new});
+            END;
+
+            COMMIT;
+        """.format(fts=fts, tbl=tbl, view=view, view_columns=view_columns, rowid=rowid, cols=', '.join(columns),
+                   fts_columns=fts_columns, new=new_values, old=old_values))
+
+        # rows logged before the index existed
+        if not exists:
+            cur.execute("INSERT INTO {0}({0}) VALUES ('rebuild')".format(fts))
+            con.commit()
+
+    con.close()
+
+
+def print_top_trips():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Rank logged trips.')
+    parser.add_argument('metric', choices=list(RANKING_METRICS.keys()))
+    parser.add_argument('-n', type=int, default=10, help='number of trips to list (default 10)')
+    parser.add_argument('--year', type=int, help='only rank trips logged in this year')
+    parser.add_argument('--crew', help='only rank trips whose crew includes this name')
+    parser.add_argument('--sustained', type=int, default=600,
+                        help='window in seconds for sustained TWS, used by windiest (default 600)')
+    args = parser.parse_args()
+
+    _, units = RANKING_METRICS[args.metric]
+
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    try:
+        for i, trip in enumerate(iter_top_trips(con, args.metric, args.n, args.year, args.crew, args.sustained)):
+            print('{:3}. {}'.format(i + 1, trip.summary_string(units)))
+    finally:
+        con.close()
+
+
+if __name__ == '__main__':
+    print_top_trips()
@@ -0,0 +1,261 @@
+import sqlite3
+import statistics
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional, Union
+
+import common as rt_args
+from database import EngineHoursRecord, select_engine_hours, select_service_dates, get_action_types
+
+# ENGINE_HOURS only has a reading on the days one was typed in.  Readings are kept sorted by day so the hours on any
+# day between two readings can be found by bisecting and interpolating linearly, which gives trips and services
+# without a reading of their own an estimate.  Days before the first reading or after the last have no estimate.
+
+# typical intervals as (engine hours, days), whichever comes first.  Adjust to the engine's manual.  Actions not listed
+# use the median interval between their past services.
+SERVICE_INTERVALS = {
+    'Change engine oil': (100.0, 365),
+    'Change engine fuel filters': (200.0, 365),
+    'Change engine air intake filter': (400.0, 730),
+    'Change water impeller': (300.0, 730),
+    'Change engine coolant': (1000.0, 1825),
+    'Touch up varnish': (None, 365),
+    'Bottom paint': (None, 730),
+}
+
+# one-off work, never due again
+UNSCHEDULED_ACTIONS = ['Project']
+
+# engine use is projected forward at the rate over this many days up to the latest reading
+USAGE_WINDOW_DAYS = 365
+
+Day = Union[str, date]
+
+
+def day_number(day: Day) -> Optional[int]:
+    # YYYY-MM-DD strings as stored in the database, or dates.  Dates typed in some other way are None.
+    if isinstance(day, date):
+        return day.toordinal()
+
+    try:
+        return date.fromisoformat(day.strip()).toordinal()
+    except (AttributeError, ValueError):
+        return None
+
+
+class EngineHoursIndex:
+    def __init__(self, recs: Optional[list[EngineHoursRecord]] = None):
+        self.days: list[int] = []
+        self.hours: list[float] = []
+
+        for rec in recs or []:
+            self.add(rec)
+
+    def __len__(self):
+        return len(self.days)
+
+    def add(self, rec: EngineHoursRecord):
+        # a reading for a day already held replaces it, as the date is ENGINE_HOURS's key.  Readings that aren't a
+        # number, such as a blank field saved from the GUI, are skipped.
+        d = day_number(rec.date)
+        try:
+            h = float(rec.hours)
+        except (TypeError, ValueError):
+            return
+        if d is None:
+            return
+
+        i = bisect_left(self.days, d)
+        if i < len(self.days) and self.days[i] == d:
+            self.hours[i] = h
+        else:
+            self.days.insert(i, d)
+            self.hours.insert(i, h)
+
+    def reading_on(self, day: Day) -> Optional[float]:
+        d = day_number(day)
+        i = bisect_left(self.days, d) if d is not None else len(self.days)
+
+        return self.hours[i] if i < len(self.days) and self.days[i] == d else None
+
+    def hours_at(self, day: Day) -> Optional[float]:
+        # the reading on day, or interpolated between the readings either side of it
+        d = day_number(day)
+        if d is None:
+            return None
+
+        i = bisect_left(self.days, d)
+        if i < len(self.days) and self.days[i] == d:
+            return self.hours[i]
+        if i == 0 or i == len(self.days):
+            return None
+
+        d0, d1 = self.days[i - 1], self.days[i]
+        h0, h1 = self.hours[i - 1], self.hours[i]
+
+        return h0 + (h1 - h0) * (d - d0) / (d1 - d0)
+
+    def latest(self) -> Optional[tuple[date, float]]:
+        return (date.fromordinal(self.days[-1]), self.hours[-1]) if self.days else None
+
+    def hours_per_day(self, window_days: int = USAGE_WINDOW_DAYS) -> Optional[float]:
+        # average use over the window_days up to the latest reading, or over every reading if they span less
+        if len(self.days) < 2:
+            return None
+
+        start = max(self.days[-1] - window_days, self.days[0])
+        elapsed = self.days[-1] - start
+        h = self.hours_at(date.fromordinal(start))
+        if elapsed <= 0 or h is None:
+            return None
+
+        return (self.hours[-1] - h) / elapsed
+
+
+# the GUI's index, built on first use and kept current by note_engine_hours
+_index: Optional[EngineHoursIndex] = None
+
+
+def engine_hours_index(con: sqlite3.Connection) -> EngineHoursIndex:
+    global _index
+    if _index is None:
+        _index = EngineHoursIndex(select_engine_hours(con))
+
+    return _index
+
+
+def note_engine_hours(rec: EngineHoursRecord):
+    # call once rec is in ENGINE_HOURS, so a built index has it without being rebuilt
+    if _index is not None:
+        _index.add(rec)
+
+
+def hours_str(index: EngineHoursIndex, day: Day, reading: Optional[float] = None) -> str:
+    # a reading as it was entered, otherwise an estimate marked with ~, or blank when there is neither
+    if reading is not None:
+        return '{:.1f}'.format(reading)
+
+    estimate = index.hours_at(day)
+    return '' if estimate is None else '~{:.1f}'.format(estimate)
+
+
+@dataclass
+class MaintenanceForecast:
+    action: str
+    last_service_date: Optional[str]
+    days_since: Optional[int]
+    hours_since: Optional[float]
+    hours_as_of: Optional[str]
+    interval_hours: Optional[float]
+    interval_days: Optional[float]
+    due_date: Optional[str]
+    days_until_due: Optional[int]
+
+    def summary_string(self) -> str:
+        if self.last_service_date is None:
+            return self.action + ': never done'
+
+        # days since run to today, but hours since only to the latest reading, so they say which day they are as of
+        since = '{} days ago'.format(self.days_since)
+        if self.hours_since is not None:
+            since = since + ', {:.1f} hours as of {}'.format(self.hours_since, self.hours_as_of)
+
+        due = ''
+        if self.due_date is not None:
+            due = ', overdue since ' if self.days_until_due < 0 else ', due '
+            due = due + self.due_date
+
+        return self.action + ': last ' + self.last_service_date + ' (' + since + ')' + due
+
+
+def median_intervals(service_days: list[int], index: EngineHoursIndex) -> (Optional[float], Optional[float]):
+    # (hours, days) between consecutive services, from the services with an estimate either side
+    day_gaps = [b - a for a, b in zip(service_days, service_days[1:]) if b > a]
+
+    service_hours = [index.hours_at(date.fromordinal(d)) for d in service_days]
+    hour_gaps = [b - a for a, b in zip(service_hours, service_hours[1:]) if a is not None and b is not None and b > a]
+
+    return (statistics.median(hour_gaps) if hour_gaps else None,
+            statistics.median(day_gaps) if day_gaps else None)
+
+
+def forecast_maintenance(con: sqlite3.Connection, today: Optional[date] = None,
+                         index: Optional[EngineHoursIndex] = None) -> list[MaintenanceForecast]:
+    # time and engine hours since each upkeep action was last done, and when it is next due, for every action from
+    # two queries.  Hours since are as of the latest reading, and hours based due dates assume the engine keeps being
+    # used at its recent rate.
+    if today is None:
+        today = date.today()
+    if index is None:
+        index = engine_hours_index(con)
+
+    service_dates = select_service_dates(con)
+    latest = index.latest()
+    rate = index.hours_per_day()
+
+    forecasts = []
+    for action in get_action_types(con):
+        if action.description in UNSCHEDULED_ACTIONS:
+            continue
+
+        dates = [s for s in service_dates.get(action.id, []) if day_number(s) is not None]
+        if not dates:
+            forecasts.append(MaintenanceForecast(action.description, None, None, None, None, None, None, None, None))
+            continue
+
+        service_days = [day_number(s) for s in dates]
+        last_day = service_days[-1]
+
+        if action.description in SERVICE_INTERVALS:
+            interval_hours, interval_days = SERVICE_INTERVALS[action.description]
+        else:
+            interval_hours, interval_days = median_intervals(service_days, index)
+
+        last_hours = index.hours_at(dates[-1])
+        hours_since = latest[1] - last_hours if latest is not None and last_hours is not None else None
+
+        due_days = []
+        if interval_days:
+            due_days.append(last_day + interval_days)
+        if interval_hours and hours_since is not None and rate:
+            due_days.append(latest[0].toordinal() + (interval_hours - hours_since) / rate)
+
+        due = date.fromordinal(int(min(due_days))) if due_days else None
+
+        forecasts.append(MaintenanceForecast(action.description, dates[-1], today.toordinal() - last_day, hours_since,
+                                             str(latest[0]) if hours_since is not None else None,
+                                             interval_hours, interval_days, str(due) if due else None,
+                                             (due - today).days if due else None))
+
+    return forecasts
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Engine hours on any date, and when each upkeep action is next due.')
+    parser.add_argument('dates', nargs='*', help='YYYY-MM-DD dates to show the engine hours on')
+    args = parser.parse_args()
+
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    try:
+        index = engine_hours_index(con)
+
+        for d in args.dates:
+            print('{}: {}'.format(d, hours_str(index, d, index.reading_on(d)) or 'no estimate'))
+
+        if not args.dates:
+            latest = index.latest()
+            if latest is not None:
+                print('{} readings, latest {:.1f} on {}'.format(len(index), latest[1], latest[0]))
+
+            forecasts = forecast_maintenance(con, index=index)
+            for f in sorted(forecasts, key=lambda f: (f.due_date is None, f.due_date or '')):
+                print('\t' + f.summary_string())
+    finally:
+        con.close()
+
+
+if __name__ == '__main__':
+    main()
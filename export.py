@@ -1,37 +1,257 @@
+import os
+
 import common as rt_args
 import sqlite3
+from typing import Optional
+
+from database import iter_export_rows
+
+PARQUET_DIR = rt_args.OUTPUT_DIR + 'parquet'
+PARQUET_BATCH_ROWS = 10000
+
+# decoded instrument channels only carry a decimal place or two, so float32 halves their size without losing data
+PARQUET_POINT_COLUMNS = [('time', 'float64'), ('latitude', 'float64'), ('longitude', 'float64'), ('sog', 'float32'),
+                         ('stw', 'float32'), ('cog', 'float32'), ('twd', 'float32'), ('tws', 'float32'),
+                         ('awa', 'float32'), ('aws', 'float32'), ('depth', 'float32')]
+
+# export name -> (source table, query).  Queries must be ordered by date, which is used for partitioning.
+PARQUET_TABLE_QRYS = {
+    'log_entry': ('LOG_ENTRY', 'SELECT * FROM LOG_ENTRY ORDER BY date, start_timestamp'),
+    'track_stats': ('TRACK_STATS', """
+        SELECT T.*, L.date FROM TRACK_STATS as T
+        INNER JOIN LOG_ENTRY as L ON T.start_timestamp = L.start_timestamp
+        ORDER BY L.date, T.start_timestamp
+    """),
+}
+
+# log name -> (default file name without extension, column headers), see database.EXPORT_QRYS
+LOG_EXPORTS = {
+    'maintenance': ('maintenanceLog', ["Service Date", "Engine Hours", "Action", "Provider", "Summary", "Notes"]),
+    'trips': ('tripLog', ["Date", "Title", "Crew", "Start", "End", "Moving Hours", "Moving Distance (nm)", "SOG Avg",
+                          "SOG Max", "STW Avg", "STW Max", "TWS Avg", "TWS Max", "Avg Wind Dir", "Engine Hours",
+                          "Notes"]),
+}
+EXPORT_FORMATS = ['xlsx', 'csv']
+
+
+def write_xlsx(file_loc: str, headers: list[str], rows) -> int:
+    # a write-only workbook streams each row to disk, where a regular one keeps every cell object until save
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(headers)
+
+    num_rows = 0
+    for row in rows:
+        ws.append(row)
+        num_rows += 1
+
+    wb.save(file_loc)
+
+    return num_rows
+
+
+def write_csv(file_loc: str, headers: list[str], rows) -> int:
+    import csv
+
+    with open(file_loc, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
 
-from openpyxl import Workbook
+        num_rows = 0
+        for row in rows:
+            writer.writerow(row)
+            num_rows += 1
 
-from database import MAINTENANCE_EXPORT_QRY
+    return num_rows
 
 
-def get_maintenance_recs() -> list:
+def export_log(name: str = 'maintenance', fmt: str = 'xlsx', start_date: Optional[str] = None,
+               end_date: Optional[str] = None, file_loc: Optional[str] = None) -> str:
+    # rows are written as they are read from the cursor, so memory use doesn't grow with the size of the log
+    default_name, headers = LOG_EXPORTS[name]
+    if file_loc is None:
+        file_loc = default_name + '.' + fmt
+
+    writer = write_xlsx if fmt == 'xlsx' else write_csv
+
     con = sqlite3.connect(rt_args.DATABASE_LOC)
-    cur = con.cursor()
-    res = cur.execute(MAINTENANCE_EXPORT_QRY)
+    try:
+        num_rows = writer(file_loc, headers, iter_export_rows(con, name, start_date, end_date))
+    finally:
+        con.close()
 
-    recs = res.fetchall()
-    con.close()
+    print('\t\tCreated {} with {} rows'.format(file_loc, num_rows))
 
-    return recs
+    return file_loc
 
 
 def export_maintenance_log():
-    wb = Workbook()
-    ws = wb.active
+    export_log('maintenance')
 
-    headers = ["Service Date", "Engine Hours", "Action", "Provider", "Summary", "Notes"]
-    ws.append(headers)
 
-    maintenance_recs = get_maintenance_recs()
-    for row in maintenance_recs:
-        ws.append(row)
+def partition_dir(out_dir: str, name: str, date: str) -> str:
+    # hive style year=YYYY/month=MM directories, understood by pyarrow, pandas, duckdb and spark
+    part_dir = os.path.join(out_dir, name, 'year=' + date[0:4], 'month=' + date[5:7])
+    os.makedirs(part_dir, exist_ok=True)
+
+    return part_dir
+
+
+def table_schema(con: sqlite3.Connection, table: str, columns: list[str]):
+    # parquet schema from the declared sqlite column types, so a batch of all Null values still gets the right type
+    import pyarrow as pa
+
+    arrow_types = {'integer': pa.int64(), 'real': pa.float64(), 'text': pa.string()}
+    declared = {r[1]: r[2].lower() for r in con.execute('pragma table_info(' + table + ')')}
+
+    return pa.schema([(c, arrow_types.get(declared.get(c, 'text'), pa.string())) for c in columns])
+
+
+def write_partitioned_query(con: sqlite3.Connection, name: str, table: str, qry: str, out_dir: str) -> int:
+    # rows arrive ordered by date, so each month's partition is written in turn and only one batch of rows is ever
+    # held in memory
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    cur = con.cursor()
+    cur.execute(qry)
+    columns = [d[0] for d in cur.description]
+    date_index = columns.index('date')
+    schema = table_schema(con, table, columns)
+
+    writer = None
+    partition = None
+    num_rows = 0
+
+    try:
+        while True:
+            rows = cur.fetchmany(PARQUET_BATCH_ROWS)
+            if not rows:
+                break
+
+            start = 0
+            while start < len(rows):
+                month = rows[start][date_index][0:7]
+                end = start
+                while end < len(rows) and rows[end][date_index][0:7] == month:
+                    end += 1
+
+                batch = pa.Table.from_pylist([dict(zip(columns, r)) for r in rows[start:end]], schema=schema)
+
+                if month != partition:
+                    if writer is not None:
+                        writer.close()
+
+                    file_loc = os.path.join(partition_dir(out_dir, name, month), name + '.parquet')
+                    writer = pq.ParquetWriter(file_loc, schema)
+                    partition = month
+
+                writer.write_table(batch)
+                num_rows += end - start
+                start = end
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return num_rows
+
+
+def channels_table(start_timestamp: int, ch):
+    import pyarrow as pa
+
+    arrays = {'start_timestamp': pa.array([start_timestamp] * len(ch), type=pa.int64())}
+    for c, dtype in PARQUET_POINT_COLUMNS:
+        arrays[c] = pa.array(getattr(ch, c).astype(dtype), from_pandas=True)
+
+    return pa.table(arrays)
+
+
+def export_points_parquet(con: sqlite3.Connection, out_dir: str) -> int:
+    # one parquet file per logged segment, so memory is bounded by the largest segment
+    import pyarrow.parquet as pq
+    from database import select_track_refs
+    from track_stats import iter_logged_segments, segment_channels
+
+    num_segments = 0
+    for seg in iter_logged_segments(select_track_refs(con)):
+        start_time = seg.get_time_bounds().start_time
+        start_timestamp = int(start_time.timestamp())
+
+        file_loc = os.path.join(partition_dir(out_dir, 'points', str(start_time.date())),
+                                str(start_timestamp) + '.parquet')
+        pq.write_table(channels_table(start_timestamp, segment_channels(seg)), file_loc)
+        num_segments += 1
+
+    return num_segments
+
+
+def export_parquet(out_dir: str = PARQUET_DIR):
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+
+    try:
+        for name, (table, qry) in PARQUET_TABLE_QRYS.items():
+            num_rows = write_partitioned_query(con, name, table, qry, out_dir)
+            print('\t\tExported {} {} rows'.format(num_rows, name))
+
+        num_segments = export_points_parquet(con, out_dir)
+        print('\t\tExported points for {} segments to {}'.format(num_segments, out_dir))
+    finally:
+        con.close()
+
+
+def load_parquet(name: str, out_dir: str = PARQUET_DIR, year: Optional[int] = None, month: Optional[int] = None):
+    # round trip loader for any exported table ('log_entry', 'track_stats' or 'points'), returned as a pyarrow
+    # Table.  Only the requested partitions are read.
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(os.path.join(out_dir, name), format='parquet', partitioning='hive')
+
+    condition = None
+    if year is not None:
+        condition = ds.field('year') == int(year)
+    if month is not None:
+        month_condition = ds.field('month') == int(month)
+        condition = month_condition if condition is None else condition & month_condition
+
+    return dataset.to_table(filter=condition)
+
+
+def load_segment_channels(start_timestamp: int, out_dir: str = PARQUET_DIR):
+    import numpy as np
+    import pyarrow.dataset as ds
+    from track_stats import SegmentChannels
+
+    dataset = ds.dataset(os.path.join(out_dir, 'points'), format='parquet', partitioning='hive')
+    table = dataset.to_table(filter=ds.field('start_timestamp') == start_timestamp)
+
+    values = {c: table.column(c).to_numpy(zero_copy_only=False).astype(np.float64)
+              for c, _ in PARQUET_POINT_COLUMNS}
+
+    return SegmentChannels(**values)
+
+
+def main():
+    import argparse
 
+    parser = argparse.ArgumentParser(description='Export the maintenance or trip log, or all track data as parquet.')
+    parser.add_argument('log', nargs='?', choices=list(LOG_EXPORTS), default='maintenance')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='xlsx')
+    parser.add_argument('--start', help='first date to export, YYYY-MM-DD')
+    parser.add_argument('--end', help='last date to export, YYYY-MM-DD')
+    parser.add_argument('-o', '--output', help='file name (default maintenanceLog or tripLog, with the format '
+                                               'extension)')
+    parser.add_argument('--parquet', nargs='?', const=PARQUET_DIR,
+                        help='export points and stats as parquet partitioned by year/month (default ' +
+                             PARQUET_DIR + ')')
+    args = parser.parse_args()
 
-    wb.save('maintenanceLog.xlsx')
-    print('\t\tCreated maintenanceLog.xlsx')
+    if args.parquet:
+        export_parquet(args.parquet)
+    else:
+        export_log(args.log, args.format, args.start, args.end, args.output)
 
 
 if __name__ == '__main__':
-    export_maintenance_log()
\ No newline at end of file
+    main()
@@ -1,4 +1,8 @@
-import os
+import math
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
 
 import gpxpy
 from gpxpy.gpx import GPX
@@ -6,34 +10,177 @@ from gpxpy.gpx import GPX
 import common as rt_args
 from track_stats import get_speed_pct_to_ignore, analyze_track_segments
 
+COPY_CHUNK_BYTES = 1024 * 1024
 
-def main():
-    reversed = False
 
-    fn = rt_args.select_data_file()
+@dataclass()
+class SegmentScan:
+    # byte offsets of each <trkpt> element in a segment, and each point's time.  Points are never decoded beyond
+    # their <time>, so the corrected file can be written by copying the original bytes in a new order.
+    pt_starts: array = field(default_factory=lambda: array('q'))
+    pt_ends: array = field(default_factory=lambda: array('q'))
+    times: array = field(default_factory=lambda: array('d'))
+
+    def point_order(self) -> Optional[list[int]]:
+        # None when the points are already in ascending time order (or can't be ordered because of missing times)
+        pairs = list(zip(self.times, self.times[1:]))
+        if any(math.isnan(t) for t in self.times) or all(a <= b for a, b in pairs):
+            return None
+
+        if all(a >= b for a, b in pairs):
+            return list(range(len(self.times) - 1, -1, -1))
+
+        return sorted(range(len(self.times)), key=lambda i: self.times[i])
+
+
+def parse_time(b: bytes) -> float:
+    try:
+        return datetime.fromisoformat(b.decode().strip()).timestamp()
+    except ValueError:
+        return math.nan
+
+
+def is_self_closing(data, tag_start: int) -> (bool, int):
+    # whether the element starting at tag_start is written as <tag .../>, and the offset just past its opening tag
+    tag_end = data.find(b'>', tag_start)
+    if tag_end == -1:
+        return False, len(data)
+    return data[tag_end - 1:tag_end] == b'/', tag_end + 1
+
+
+def scan_segments(data) -> list[SegmentScan]:
+    scans = []
+
+    pos = 0
+    while True:
+        seg_start = data.find(b'<trkseg', pos)
+        if seg_start == -1:
+            break
+
+        # an empty <trkseg/> has no closing tag, searching for one would take in the next segment's points
+        empty, tag_end = is_self_closing(data, seg_start)
+        if empty:
+            scans.append(SegmentScan())
+            pos = tag_end
+            continue
+
+        seg_end = data.find(b'</trkseg>', tag_end)
+        if seg_end == -1:
+            seg_end = len(data)
+
+        scan = SegmentScan()
+        p = tag_end
+        while True:
+            pt_start = data.find(b'<trkpt', p, seg_end)
+            if pt_start == -1:
+                break
+
+            # a <trkpt .../> has no <time>, which leaves its segment unordered
+            no_children, pt_end = is_self_closing(data, pt_start)
+            if not no_children:
+                pt_end = data.find(b'</trkpt>', pt_start, seg_end)
+                if pt_end == -1:
+                    break
+                pt_end = pt_end + len(b'</trkpt>')
+
+            t_start = data.find(b'<time>', pt_start, pt_end)
+            t_end = data.find(b'</time>', t_start, pt_end) if t_start != -1 else -1
+
+            scan.pt_starts.append(pt_start)
+            scan.pt_ends.append(pt_end)
+            scan.times.append(parse_time(data[t_start + len(b'<time>'):t_end]) if t_end != -1 else math.nan)
+            p = pt_end
+
+        scans.append(scan)
+        pos = seg_end + 1
+
+    return scans
+
 
-    gpx: GPX = gpxpy.parse(open(rt_args.get_file_loc(fn)))
+def copy_range(data, start: int, end: int, out):
+    for chunk_start in range(start, end, COPY_CHUNK_BYTES):
+        out.write(data[chunk_start:min(chunk_start + COPY_CHUNK_BYTES, end)])
 
-    all_segments = []
-    for t in gpx.tracks:
-        all_segments.extend(t.segments)
 
-    for seg in all_segments:
-        if seg.points[0].time > seg.points[1].time:
-            reversed = True
-            seg.points.reverse()
+def write_corrected(data, scans: list[SegmentScan], out) -> int:
+    # everything outside of reordered segments, including whitespace between points, is copied unchanged
+    num_fixed = 0
+    pos = 0
 
-    if reversed:
-        print('Backwards track detected.  Writing corrected file to output directory.')
-        with open(rt_args.OUTPUT_DIR + fn, 'w') as f:
-            f.write(gpx.to_xml())
+    for scan in scans:
+        order = scan.point_order()
+        if order is None:
+            continue
 
+        copy_range(data, pos, scan.pt_starts[0], out)
+        for i, src in enumerate(order):
+            copy_range(data, scan.pt_starts[src], scan.pt_ends[src], out)
+            if i + 1 < len(order):
+                copy_range(data, scan.pt_ends[i], scan.pt_starts[i + 1], out)
+
+        pos = scan.pt_ends[-1]
+        num_fixed += 1
+
+    copy_range(data, pos, len(data), out)
+
+    return num_fixed
+
+
+def fix_file(fn: str) -> (str, int):
+    # returns the file name and the number of segments whose points were reordered
+    with rt_args.map_gpx(fn) as data:
+        if len(data) == 0:
+            return fn, 0
+
+        scans = scan_segments(data)
+        if all(s.point_order() is None for s in scans):
+            return fn, 0
+
+        with open(rt_args.OUTPUT_DIR + fn, 'wb') as out:
+            return fn, write_corrected(data, scans, out)
+
+
+def fix_all_files(workers: Optional[int] = None):
+    from concurrent.futures import ProcessPoolExecutor
+
+    data_files = rt_args.get_data_files()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for fn, num_fixed in executor.map(fix_file, data_files):
+            if num_fixed > 0:
+                print('{}: reordered {} segments, corrected file written to output directory'.format(fn, num_fixed))
+
+    print('Checked {} files'.format(len(data_files)))
+
+
+def main():
+    fn = rt_args.select_data_file()
+
+    _, num_fixed = fix_file(fn)
+    if num_fixed > 0:
+        print('Backwards track detected.  Wrote corrected file to output directory.')
+        f = open(rt_args.OUTPUT_DIR + fn)
     else:
         print('All tracks correct order.  No action taken.')
+        f = rt_args.open_gpx(fn)
+
+    with f:
+        gpx: GPX = gpxpy.parse(f)
 
     pct_to_ignore = get_speed_pct_to_ignore()
     analyze_track_segments(gpx, pct_to_ignore)
 
 
 if __name__ == '__main__':
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Put track points into ascending time order.')
+    parser.add_argument('--all', action='store_true',
+                        help='check every file in the gpx files directory without prompting')
+    parser.add_argument('--workers', type=int, help='number of files processed in parallel (default: all cores)')
+    args = parser.parse_args()
+
+    if args.all:
+        fix_all_files(args.workers)
+    else:
+        main()
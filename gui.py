@@ -1,28 +1,27 @@
 from FreeSimpleGUI import TabGroup
 
-from database import get_entry_summaries, create_database, LogEntryRecord, get_maintenance_views, MaintenanceRecordView
+from database import get_entry_summaries, create_database, LogEntryRecord, get_maintenance_views, MaintenanceRecordView, \
+    upgrade_database
 from gui_track import create_track_tab, event_loop_for_process_gpx_file, create_process_file_window, \
-    update_track_tab_entries
+    update_track_tab_entries, search_track_entries
 
 from gui_upkeep import *
 
+import timing
+
 entries_in_db = {}
 
 
 def process_gpx_file() -> Optional[LogEntryRecord]:
     DEFAULT_YEAR = '2025'
-    selected_year = DEFAULT_YEAR
-
-    def match_year(candidate) -> bool:
-        return selected_year in candidate
 
     return_val = None
     segments_dict = {}
 
-    window = create_process_file_window(DEFAULT_YEAR, match_year)
+    window = create_process_file_window(DEFAULT_YEAR)
 
     # Event Loop to process "events" and get the "values" of the inputs
-    return_val = event_loop_for_process_gpx_file(match_year, return_val, segments_dict, window)
+    return_val = event_loop_for_process_gpx_file(return_val, segments_dict, window)
 
     window.close()
 
@@ -51,7 +50,11 @@ def main_window():
     for s in summaries:
         entries_in_db[s.summary_string()] = s
 
-    layout = [[TabGroup(enable_events=True, layout=[[create_track_tab(entries_in_db), create_maintenance_tab(con)]])],
+    tabs = [create_track_tab(entries_in_db), create_maintenance_tab(con)]
+    if timing.ENABLED:
+        tabs.append(create_debug_tab())
+
+    layout = [[TabGroup(enable_events=True, layout=[tabs])],
               [sg.Button('Exit')],
               ]
 
@@ -63,6 +66,14 @@ def main_window():
     main_event_loop(con, window)
 
 
+def create_debug_tab() -> sg.Tab:
+    t_layout = [[sg.Multiline(timing.report_str(), key='-DBG_REPORT-', size=(80, 30), font='Courier 10',
+                              disabled=True)],
+                [sg.Button('Refresh', key='-DBG_REFRESH-'), sg.Button('Reset', key='-DBG_RESET-')]]
+
+    return sg.Tab(title='Debug', layout=t_layout)
+
+
 def main_event_loop(con, window):
     global entries_in_db
     while True:
@@ -88,9 +99,20 @@ def main_event_loop(con, window):
             entries_in_db = create_entry_summary_dict(con)
             update_track_tab_entries(window, entries_in_db, values, con)
 
+        if event == '-TT_FIND-':
+            entries_in_db = create_entry_summary_dict(con)
+            search_track_entries(window, entries_in_db, values['-TT_SEARCH-'], con)
+
+        if event == '-MT_FIND-':
+            update_maintenance_search(window, values['-MT_SEARCH-'], con)
+
+        if event == '-MT_HITS-':
+            show_maintenance_search_hit(window, values['-MT_HITS-'], con)
+
         if event == '-MT_SELECT_ACTION-':
             view_recs = get_maintenance_views(con, values['-MT_SELECT_ACTION-'])
-            update_upkeep_tab_entries(window, view_recs)
+            update_upkeep_tab_entries(window, view_recs, con)
+            update_upkeep_due(window, values['-MT_SELECT_ACTION-'], con)
 
         if event == '-MT_SVC_DATE-':
             view_recs = get_maintenance_views(con, values['-MT_SELECT_ACTION-'])
@@ -98,7 +120,12 @@ def main_event_loop(con, window):
             recs = list(filter(lambda r: r.info() == info_to_match, view_recs))
 
             if len(recs) > 0:
-                update_upkeep_tab_fields(recs[0], window)
+                update_upkeep_tab_fields(recs[0], window, con)
+
+        if event in ('-DBG_REFRESH-', '-DBG_RESET-'):
+            if event == '-DBG_RESET-':
+                timing.reset()
+            window['-DBG_REPORT-'].update(value=timing.report_str())
 
         if event == '-MT_NEW-':
             new_rec = create_maintenance_record()
@@ -111,6 +138,7 @@ def main_event_loop(con, window):
                 window['-MT_PROVIDER-'].update(value=get_provider(new_rec.provider_id).name)
                 window['-MT_EHOURS-'].update(value=new_rec.engine_hours)
                 window['-MT_NOTES-'].update(value=new_rec.notes)
+                update_upkeep_due(window, new_rec.action, con)
 
     window.close()
 
@@ -144,6 +172,8 @@ def initialize_and_startup():
     my_file = Path(rt_args.DATABASE_LOC)
     if not my_file.is_file():
         create_database()
+    else:
+        upgrade_database()
 
     main_window()
 
@@ -1,22 +1,23 @@
 import os
 import sqlite3
 from datetime import timedelta
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
 import FreeSimpleGUI as sg
-import gpxpy
 from FreeSimpleGUI import Tab
-from PIL import Image
-from PIL.Image import Resampling
-from gpxpy.gpx import GPXTrackSegment, GPX
 
 import common as rt_args
-from common import get_data_files
+from catalog import catalog_file_names, is_year, refresh_catalog
 from database import LogEntryRecord, select_log_entry, select_log_entry_stats, EngineHoursRecord, add_to_database, \
-    LogEntryAndHoursView, select_log_entry_and_hours
-from images import segment_image, load_image
-from log_entry import create_log_entry, create_track_stats, persist
-from track_stats import get_segment_stats
+    LogEntryAndHoursView, select_log_entry_and_hours, search_log_entries
+from engine_hours import engine_hours_index, hours_str
+from timing import span, timed, count
+
+# gpxpy, PIL, staticmap and numpy (via images, log_entry and track_stats) are only needed once a track is imported or
+# an entry's image is shown, so they are imported where they are used to keep the main window's startup fast
+if TYPE_CHECKING:
+    from PIL.Image import Image
+    from gpxpy.gpx import GPXTrackSegment
 
 IMAGE_SIZE = (440, 440)
 
@@ -34,6 +35,8 @@ def create_track_tab(e_dict) -> Tab:
     t_layout = [
         [sg.Text("Log Entries:"), sg.Combo(entry_strings, key='-TT_SELECT_ENTRY-', size=(60, 1), enable_events=True),
          sg.Button('New', key='-TT_NEW-')],
+        [sg.Text("Search:"), sg.InputText(key='-TT_SEARCH-', size=(40, 1)), sg.Button('Find', key='-TT_FIND-'),
+         sg.Text('', key='-TT_HITS-')],
         [sg.Text("Title:"), sg.InputText(key='-TT_TITLE-')],
         [sg.Text("Starting Loc:"), sg.InputText(size=(20, 1), key='-TT_START-'), sg.Text("Ending Loc:"),
          sg.InputText(size=(20, 1), key='-TT_END-')],
@@ -60,7 +63,7 @@ def create_track_statistics_column():
     return stats_col
 
 
-def event_loop_for_process_gpx_file(match_year, return_val, segments_dict, window):
+def event_loop_for_process_gpx_file(return_val, segments_dict, window):
     while True:
         event, values = window.read()
 
@@ -68,10 +71,18 @@ def event_loop_for_process_gpx_file(match_year, return_val, segments_dict, windo
         if event == sg.WIN_CLOSED or event == '-EXIT-':
             break
 
+        if event == '-CATALOG_REFRESHED-':
+            window['-CATALOG_STATUS-'].update(value='')
+            selected_year = values['-YEAR-'].strip()
+            if selected_year == '' or is_year(selected_year):
+                window['-SELECT_FILE-'].update(values=catalog_file_names(selected_year, refresh=False))
+
         if event == '-YEAR-':
-            selected_year = values['-YEAR-']
-            new_list = list(filter(selected_year, get_data_files()))
-            window['-SELECT_FILE-'].update(values=new_list, set_to_index=0)
+            # wait for a whole year before refiltering, rather than on every keystroke
+            selected_year = values['-YEAR-'].strip()
+            if selected_year == '' or is_year(selected_year):
+                new_list = catalog_file_names(selected_year, refresh=False)
+                window['-SELECT_FILE-'].update(values=new_list, set_to_index=0)
 
         if event == '-SELECT_FILE-':
             segments_dict = {}
@@ -80,7 +91,7 @@ def event_loop_for_process_gpx_file(match_year, return_val, segments_dict, windo
 
             all_seg_strings = sorted(segments_dict.keys())
 
-            seg_strings = list(filter(match_year, all_seg_strings))
+            seg_strings = [s for s in all_seg_strings if s.startswith(values['-YEAR-'].strip())]
 
             window['-SELECT_SEG-'].update(values=seg_strings, set_to_index=0)
             window['-TITLE-'].update(value='')
@@ -93,7 +104,21 @@ def event_loop_for_process_gpx_file(match_year, return_val, segments_dict, windo
 
         if event == 'Save':
             selected_seg = segments_dict[values['-SELECT_SEG-']]
-            new_rec = process_args(values, selected_seg)
+
+            from log_entry import is_already_logged
+
+            con = sqlite3.connect(rt_args.DATABASE_LOC)
+            try:
+                already_logged = is_already_logged(selected_seg, con)
+            finally:
+                con.close()
+
+            if already_logged:
+                window['-SAVE_STATUS-'].update(value='Already logged ' + values['-SELECT_SEG-'] + '.  No action taken')
+                continue
+
+            with span('save'):
+                new_rec = process_args(values, selected_seg)
 
             if new_rec:
                 window['-SAVE_STATUS-'].update(value='Processed ' + values['-SELECT_SEG-'])
@@ -103,17 +128,16 @@ def event_loop_for_process_gpx_file(match_year, return_val, segments_dict, windo
     return return_val
 
 
-def create_process_file_window(DEFAULT_YEAR, match_year):
-    all_files = get_data_files()
-    candidate_files = list(filter(match_year, all_files))
-
-    if candidate_files is None:
-        candidate_files = []
+def create_process_file_window(DEFAULT_YEAR):
+    # the catalog is refreshed on a background thread, as the first build after installing or adding a season of
+    # files parses every new file.  Until it finishes the list shows what is already cataloged.
+    candidate_files = catalog_file_names(DEFAULT_YEAR, refresh=False)
 
     layout = [
         [sg.Text("Year:"), sg.InputText(DEFAULT_YEAR, key='-YEAR-', enable_events=True)],
         [sg.Text("File:"),
-         sg.Combo(values=candidate_files, key='-SELECT_FILE-', enable_events=True)],
+         sg.Combo(values=candidate_files, key='-SELECT_FILE-', enable_events=True),
+         sg.Text('Cataloging gpx files...', key='-CATALOG_STATUS-')],
         [sg.Text("Segments:"), sg.Combo(values=[], key='-SELECT_SEG-', size=(60, 1))],
         [sg.Text("Title:"), sg.InputText(key='-TITLE-')],
         [sg.Text("Starting Loc:"), sg.InputText(key='-START-')],
@@ -123,11 +147,12 @@ def create_process_file_window(DEFAULT_YEAR, match_year):
         [sg.Text("Notes:"), sg.Multiline(key='-NOTES-', size=(70, 4))],
         [sg.Button('Save'), sg.Button('Exit', key='-EXIT-'), sg.Text('', key='-SAVE_STATUS-')]]
     # Create the Window
-    window = sg.Window('GPX File Import', layout, resizable=True, font='default 12')
+    window = sg.Window('GPX File Import', layout, resizable=True, font='default 12', finalize=True)
+    window.perform_long_operation(refresh_catalog, '-CATALOG_REFRESHED-')
     return window
 
 
-def process_args(values: dict, seg: GPXTrackSegment) -> Optional[LogEntryAndHoursView]:
+def process_args(values: dict, seg: 'GPXTrackSegment') -> Optional[LogEntryAndHoursView]:
     file_name = values['-SELECT_FILE-']
     title = values['-TITLE-']
     start_loc = values['-START-']
@@ -148,7 +173,10 @@ def process_args(values: dict, seg: GPXTrackSegment) -> Optional[LogEntryAndHour
     return return_val
 
 
-def create_and_save_image(file_name, seg) -> Optional[Image]:
+@timed('create_and_save_image')
+def create_and_save_image(file_name, seg) -> Optional['Image']:
+    from images import segment_image
+
     try:
         img = segment_image(seg)
         image_name = file_name.replace('.gpx', '.png')
@@ -160,7 +188,12 @@ def create_and_save_image(file_name, seg) -> Optional[Image]:
 
     return None
 
+@timed('persist_track_data')
 def persist_track_data(crew, end_loc, file_name, notes, seg, start_loc, title, hours) -> Optional[LogEntryAndHoursView]:
+    from log_entry import create_log_entry, create_track_stats, persist
+    from track_stats import get_segment_stats
+    from window_stats import get_segment_best_efforts, create_best_effort_records
+
     con = sqlite3.connect(rt_args.DATABASE_LOC)
 
     try:
@@ -174,7 +207,9 @@ def persist_track_data(crew, end_loc, file_name, notes, seg, start_loc, title, h
         if hours is not None:
             hours_rec = EngineHoursRecord(l_e.date, hours)
 
-        persist(l_e, trk_stats, hours_rec, con)
+        efforts = create_best_effort_records(l_e.start_timestamp, get_segment_best_efforts(seg))
+
+        persist(l_e, trk_stats, hours_rec, con, efforts)
         return_val = LogEntryAndHoursView(l_e.start_timestamp, title, l_e.date, crew, file_name, start_loc, end_loc, notes, hours)
     finally:
         con.close()
@@ -183,10 +218,15 @@ def persist_track_data(crew, end_loc, file_name, notes, seg, start_loc, title, h
 
 
 def extract_segments(fn):
-    gpx: GPX = gpxpy.parse(open(rt_args.get_file_loc(fn)))
-    all_segments: list[GPXTrackSegment] = []
+    import gpxpy
+
+    with span('parse'), rt_args.open_gpx(fn) as f:
+        gpx = gpxpy.parse(f)
+
+    all_segments = []
     for t in gpx.tracks:
         for s in t.segments:
+            count('points parsed', len(s.points))
             if s.points[0].time > s.points[1].time:
                 s.points.reverse()
 
@@ -207,11 +247,31 @@ def update_track_tab_entries(window, e_dict, values, con):
 
     window['-TT_CREW-'].update(value=selected_entry.crew)
     window['-TT_NOTES-'].update(value=selected_entry.notes.replace('\\n', os.linesep))
-    window['-TT_ENGINE_HOURS-'].update(value=nullable_float_as_str('{:.1f}', selected_entry.hours))
+    window['-TT_ENGINE_HOURS-'].update(value=hours_str(engine_hours_index(con), selected_entry.date,
+                                                      selected_entry.hours))
 
     update_selected_image(selected_entry, window)
 
 
+def search_track_entries(window, e_dict, text: str, con):
+    # narrows the entry list to the entries matching text, best match first, and shows the best.  Blank text restores
+    # the full list.
+    if not text.strip():
+        window['-TT_SELECT_ENTRY-'].update(values=list(sorted(e_dict.keys(), reverse=True)))
+        window['-TT_HITS-'].update(value='')
+        return
+
+    keys_by_timestamp = {s.start_timestamp: k for k, s in e_dict.items()}
+    matches = [keys_by_timestamp[h.id] for h in search_log_entries(con, text)
+               if h.id in keys_by_timestamp]
+
+    window['-TT_SELECT_ENTRY-'].update(values=matches, set_to_index=0 if matches else None)
+    window['-TT_HITS-'].update(value='{} found'.format(len(matches)))
+
+    if matches:
+        update_track_tab_entries(window, e_dict, {'-TT_SELECT_ENTRY-': matches[0]}, con)
+
+
 def update_track_stat_fields(selected_entry, selected_stats, window):
     window['-TT_TITLE-'].update(value=selected_entry.title)
     window['-TT_START-'].update(value=selected_entry.start_loc)
@@ -233,16 +293,22 @@ def update_track_stat_fields(selected_entry, selected_stats, window):
 
 
 def update_selected_image(selected_entry, window):
+    from PIL.Image import Resampling
+    from images import load_image
+
     image = load_image(selected_entry.path_to_image_file())
-    if not image:
-        file_name = selected_entry.path_to_gpx_file
-        segs = extract_segments(file_name)
+    if image:
+        count('image cache hits')
+    else:
+        count('image cache misses')
+        from segment_index import load_logged_segment
 
-        desired_timestamp = selected_entry.start_timestamp
-        matches = list(filter(lambda s: int(s.get_time_bounds().start_time.timestamp()) == desired_timestamp, segs))
+        # seeks to the one segment rather than parsing the whole file
+        file_name = selected_entry.path_to_gpx_file
+        seg = load_logged_segment(file_name, selected_entry.start_timestamp)
 
-        if matches:
-            image = create_and_save_image(file_name, matches[0])
+        if seg:
+            image = create_and_save_image(file_name, seg)
     if image:
         image = image.resize(IMAGE_SIZE, resample=Resampling.LANCZOS)
 
@@ -8,11 +8,16 @@ import FreeSimpleGUI as sg
 from FreeSimpleGUI import Tab
 
 from database import get_action_types, get_providers, MaintenanceRecord, add_to_database, UpkeepActionRecord, \
-    ProviderRecord, EngineHoursRecord, MaintenanceRecordView
+    ProviderRecord, EngineHoursRecord, MaintenanceRecordView, get_maintenance_views, select_maintenance_view, \
+    search_maintenance
+from engine_hours import engine_hours_index, note_engine_hours, hours_str, forecast_maintenance
 
 actions_dict: dict = {}
 providers_dict: dict = {}
 
+# the maintenance search's hits as listed -> MAINTENANCE id
+search_hits_dict: dict = {}
+
 
 def create_maintenance_tab(con) -> Tab:
     global actions_dict
@@ -31,7 +36,10 @@ def create_maintenance_tab(con) -> Tab:
         [sg.Text("Provider:"),
          sg.InputText(key='-MT_PROVIDER-', size=(50, 1), disabled=True), ],
         [sg.Text("Engine Hours:"), sg.InputText(key='-MT_EHOURS-', size=(25, 1), disabled=True)],
-        [sg.Text("Notes:"), sg.Multiline(key='-MT_NOTES-', size=(70, 10), disabled=True)]]
+        [sg.Text("Next Due:"), sg.Text('', key='-MT_DUE-')],
+        [sg.Text("Notes:"), sg.Multiline(key='-MT_NOTES-', size=(70, 10), disabled=True)],
+        [sg.Text("Search:"), sg.InputText(key='-MT_SEARCH-', size=(50, 1)), sg.Button('Find', key='-MT_FIND-')],
+        [sg.Combo([], key='-MT_HITS-', size=(70, 1), enable_events=True)]]
 
     return Tab(title='Maintenance', layout=t_layout)
 
@@ -83,6 +91,7 @@ def process_args(values: dict) -> Optional[MaintenanceRecordView]:
             try:
                 hours_rec = EngineHoursRecord(svc_date, engine_hours)
                 add_to_database(hours_rec.table_name(), hours_rec.values_str(), con)
+                note_engine_hours(hours_rec)
             except:
                 print('failed to persist hours')
 
@@ -121,12 +130,12 @@ def event_loop_for_new_maintenance_rec(return_val, window):
     return return_val
 
 
-def update_upkeep_tab_entries(window, maintenance_recs):
+def update_upkeep_tab_entries(window, maintenance_recs, con):
     window['-MT_SVC_DATE-'].update(values=list(map(lambda mr: mr.info(), maintenance_recs)))
 
     if len(maintenance_recs) == 1:
         a_rec = maintenance_recs[0]
-        update_upkeep_tab_fields(a_rec, window)
+        update_upkeep_tab_fields(a_rec, window, con)
         window['-MT_SVC_DATE-'].update(value=a_rec.info())
     else:
         window['-MT_SUMMARY-'].update(value='')
@@ -135,18 +144,49 @@ def update_upkeep_tab_entries(window, maintenance_recs):
         window['-MT_NOTES-'].update(value='')
 
 
-def update_upkeep_tab_fields(a_rec, window):
+def update_upkeep_tab_fields(a_rec, window, con):
     window['-MT_SUMMARY-'].update(value=a_rec.summary)
     window['-MT_PROVIDER-'].update(value=a_rec.provider)
 
     if a_rec.engine_hours == None:
-        window['-MT_EHOURS-'].update(value='')
+        # estimated from the readings either side when none was entered with the service
+        window['-MT_EHOURS-'].update(value=hours_str(engine_hours_index(con), a_rec.service_date))
     else:
         window['-MT_EHOURS-'].update(value=a_rec.engine_hours)
 
     window['-MT_NOTES-'].update(value=a_rec.notes.replace('\\n', os.linesep))
 
 
+def update_upkeep_due(window, action_desc: str, con):
+    forecasts = [f for f in forecast_maintenance(con) if f.action == action_desc]
+    window['-MT_DUE-'].update(value=forecasts[0].summary_string() if forecasts else '')
+
+
+def update_maintenance_search(window, text: str, con):
+    global search_hits_dict
+    search_hits_dict = {h.summary_string(): h.id for h in search_maintenance(con, text)}
+
+    hits = list(search_hits_dict.keys())
+    window['-MT_HITS-'].update(value='{} found'.format(len(hits)) if text.strip() else '', values=hits)
+
+
+def show_maintenance_search_hit(window, hit: str, con):
+    # selects the hit's action and service date as if they had been picked, and shows the record
+    global search_hits_dict
+    if hit not in search_hits_dict:
+        return
+
+    a_rec = select_maintenance_view(search_hits_dict[hit], con)
+    if a_rec is None:
+        return
+
+    window['-MT_SELECT_ACTION-'].update(value=a_rec.action)
+    update_upkeep_tab_entries(window, get_maintenance_views(con, a_rec.action), con)
+    window['-MT_SVC_DATE-'].update(value=a_rec.info())
+    update_upkeep_tab_fields(a_rec, window, con)
+    update_upkeep_due(window, a_rec.action, con)
+
+
 def get_action(an_id: int) -> Optional[UpkeepActionRecord]:
     global actions_dict
 
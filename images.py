@@ -1,10 +1,14 @@
+import math
 import os
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Union
+
+import numpy as np
 from PIL import Image
 from staticmap3 import Line
 from gpxpy.gpx import GPXTrackSegment, GPX
 
 import common as rt_args
+from timing import timed
 
 
 # installed staticmap 0.5.7
@@ -21,7 +25,7 @@ def create_image_files():
 
     for r in recs:
         import gpxpy
-        gpx: GPX = gpxpy.parse(open(rt_args.get_file_loc(r[0])))
+        gpx: GPX = gpxpy.parse(rt_args.open_gpx(r[0]))
 
         a_seg = gpx.tracks[0].segments[0]
         seg_image = segment_image(a_seg)
@@ -32,15 +36,19 @@ def create_image_files():
     con.close()
 
 
+def coords_as_line(coords: list[Tuple[float, float]]) -> Line:
+    # (lon, lat) pairs in the track colour and width every track image uses
+    return Line(coords, '#D2322D', 4)
+
+
 def segment_as_line(s: GPXTrackSegment) -> Line:
     def lon_lat(p) -> Tuple[float, float]:
         return p.longitude, p.latitude
 
-    coords = list(map(lon_lat, s.points))
-    line = Line(coords, '#D2322D', 4)
-    return line
+    return coords_as_line(list(map(lon_lat, s.points)))
 
 
+@timed('segment_image')
 def segment_image(s: GPXTrackSegment) -> Image:
     from staticmap3 import StaticMap
 
@@ -51,6 +59,17 @@ def segment_image(s: GPXTrackSegment) -> Image:
     return m.render()
 
 
+@timed('channels_image')
+def channels_image(ch) -> Image:
+    # segment_image for decoded channels, so rendering doesn't need the gpxpy points
+    from staticmap3 import StaticMap
+
+    m = StaticMap(1000, 1000, 80)
+    m.add_line(coords_as_line(list(zip(ch.longitude.tolist(), ch.latitude.tolist()))))
+
+    return m.render()
+
+
 def load_image(fn: str) -> Optional[Image]:
     import os
 
@@ -62,5 +81,223 @@ def load_image(fn: str) -> Optional[Image]:
         return None
 
 
+# heatmap points are accumulated as sparse pixel counts at a fixed web mercator zoom level, so memory grows with the
+# area actually sailed rather than with the number of points or tracks.
+HEATMAP_ZOOM = 16
+HEATMAP_TILE_SIZE = 256
+HEATMAP_COMPACT_SIZE = 1_000_000
+# staticmap3 reads a zoom of 0 as no zoom given and tries to fit one to its lines, which fails as the heatmap has none
+HEATMAP_MIN_ZOOM = 1
+MERCATOR_MAX_LAT = 85.05112878
+
+
+def mercator_xy(lons: np.ndarray, lats: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # normalized web mercator coordinates, (0, 0) is the top left corner of the world and (1, 1) the bottom right
+    x = (np.asarray(lons, dtype=np.float64) + 180.0) / 360.0
+    lat_rads = np.radians(np.clip(np.asarray(lats, dtype=np.float64), -MERCATOR_MAX_LAT, MERCATOR_MAX_LAT))
+    y = (1.0 - np.log(np.tan(lat_rads) + 1.0 / np.cos(lat_rads)) / math.pi) / 2.0
+
+    return x, y
+
+
+def mercator_lon_lat(x: float, y: float) -> Tuple[float, float]:
+    lon = x * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * y))))
+
+    return lon, lat
+
+
+class TrackHeatmap:
+    def __init__(self, zoom: int = HEATMAP_ZOOM):
+        self.zoom = zoom
+        self.world_px = (2 ** zoom) * HEATMAP_TILE_SIZE
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self._pending_keys: list[np.ndarray] = []
+        self._pending_counts: list[np.ndarray] = []
+        self._pending_size = 0
+        self.num_tracks = 0
+
+    def add_coords(self, lons: np.ndarray, lats: np.ndarray):
+        if len(lons) == 0:
+            return
+
+        x, y = mercator_xy(lons, lats)
+        px = np.clip((x * self.world_px).astype(np.int64), 0, self.world_px - 1)
+        py = np.clip((y * self.world_px).astype(np.int64), 0, self.world_px - 1)
+
+        keys, counts = np.unique(py * self.world_px + px, return_counts=True)
+        self._pending_keys.append(keys)
+        self._pending_counts.append(counts)
+        self._pending_size += len(keys)
+        self.num_tracks += 1
+
+        if self._pending_size > HEATMAP_COMPACT_SIZE:
+            self.compact()
+
+    def add_segment(self, seg: GPXTrackSegment):
+        lons = np.fromiter((p.longitude for p in seg.points), dtype=np.float64, count=len(seg.points))
+        lats = np.fromiter((p.latitude for p in seg.points), dtype=np.float64, count=len(seg.points))
+        self.add_coords(lons, lats)
+
+    def compact(self):
+        if not self._pending_keys:
+            return
+
+        all_keys = np.concatenate([self.keys] + self._pending_keys)
+        all_counts = np.concatenate([self.counts] + self._pending_counts)
+
+        self.keys, inverse = np.unique(all_keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=all_counts).astype(np.int64)
+
+        self._pending_keys = []
+        self._pending_counts = []
+        self._pending_size = 0
+
+    def is_empty(self) -> bool:
+        return len(self.keys) == 0 and self._pending_size == 0
+
+    def extent(self) -> Tuple[float, float, float, float]:
+        # normalized mercator bounds (min_x, min_y, max_x, max_y) of all accumulated pixels
+        self.compact()
+        px = self.keys % self.world_px
+        py = self.keys // self.world_px
+
+        return (px.min() / self.world_px, py.min() / self.world_px,
+                (px.max() + 1) / self.world_px, (py.max() + 1) / self.world_px)
+
+    def render_zoom(self, width: int, height: int, padding: int) -> int:
+        min_x, min_y, max_x, max_y = self.extent()
+
+        for z in range(min(self.zoom, 17), HEATMAP_MIN_ZOOM - 1, -1):
+            scale = (2 ** z) * HEATMAP_TILE_SIZE
+            if ((max_x - min_x) * scale <= width - padding * 2) and ((max_y - min_y) * scale <= height - padding * 2):
+                return z
+
+        return HEATMAP_MIN_ZOOM
+
+    def density_grid(self, width: int, height: int, zoom: int, center_x: float, center_y: float) -> np.ndarray:
+        self.compact()
+        scale = (2 ** zoom) * HEATMAP_TILE_SIZE / self.world_px
+
+        ix = ((self.keys % self.world_px) * scale - center_x * (2 ** zoom) * HEATMAP_TILE_SIZE + width / 2)
+        iy = ((self.keys // self.world_px) * scale - center_y * (2 ** zoom) * HEATMAP_TILE_SIZE + height / 2)
+        ix = ix.astype(np.int64)
+        iy = iy.astype(np.int64)
+
+        in_view = (ix >= 0) & (ix < width) & (iy >= 0) & (iy < height)
+        flat = iy[in_view] * width + ix[in_view]
+        grid = np.bincount(flat, weights=self.counts[in_view], minlength=width * height)
+
+        return grid.reshape((height, width))
+
+    def render(self, width: int = 1000, height: int = 1000, padding: int = 80, spread: int = 1) -> Image:
+        from staticmap3 import StaticMap
+
+        min_x, min_y, max_x, max_y = self.extent()
+        center_x = (min_x + max_x) / 2.0
+        center_y = (min_y + max_y) / 2.0
+        zoom = self.render_zoom(width, height, padding)
+
+        m = StaticMap(width, height, padding)
+        base = m.render(zoom=zoom, center=mercator_lon_lat(center_x, center_y)).convert('RGBA')
+
+        grid = self.density_grid(width, height, zoom, center_x, center_y)
+        grid = spread_grid(grid, spread)
+
+        overlay = Image.fromarray(heat_colors(grid), mode='RGBA')
+        return Image.alpha_composite(base, overlay)
+
+
+def spread_grid(grid: np.ndarray, spread: int) -> np.ndarray:
+    # widen single pixel tracks with a box sum so they remain visible on the basemap
+    if spread < 1:
+        return grid
+
+    size = 2 * spread + 1
+    padded = np.pad(grid, spread)
+    result = np.zeros_like(grid)
+    for dy in range(size):
+        for dx in range(size):
+            result += padded[dy:dy + grid.shape[0], dx:dx + grid.shape[1]]
+
+    return result
+
+
+def heat_colors(grid: np.ndarray) -> np.ndarray:
+    # log scaled black-body style ramp: red -> yellow -> white, transparent where nothing was logged
+    max_count = grid.max()
+    if max_count <= 0:
+        return np.zeros(grid.shape + (4,), dtype=np.uint8)
+
+    t = np.log1p(grid) / math.log1p(max_count)
+
+    rgba = np.empty(grid.shape + (4,), dtype=np.float64)
+    rgba[..., 0] = np.clip(t * 3.0, 0.0, 1.0)
+    rgba[..., 1] = np.clip(t * 3.0 - 1.0, 0.0, 1.0)
+    rgba[..., 2] = np.clip(t * 3.0 - 2.0, 0.0, 1.0)
+    rgba[..., 3] = np.where(grid > 0, 0.35 + 0.65 * t, 0.0)
+
+    return (rgba * 255).astype(np.uint8)
+
+
+def create_heatmap_image(year: Optional[Union[int, str]] = None, min_tws: Optional[float] = None,
+                         max_tws: Optional[float] = None) -> Optional[Image]:
+    import sqlite3
+    from database import select_track_refs
+    from track_stats import iter_logged_segments
+
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    try:
+        track_refs = select_track_refs(con, year, min_tws, max_tws)
+    finally:
+        con.close()
+
+    heatmap = TrackHeatmap()
+    for seg in iter_logged_segments(track_refs):
+        heatmap.add_segment(seg)
+
+    if heatmap.is_empty():
+        return None
+
+    print('\t\tAccumulated {} tracks into {} heatmap pixels'.format(heatmap.num_tracks, len(heatmap.keys)))
+    return heatmap.render()
+
+
+def save_heatmap_image(year: Optional[Union[int, str]] = None, min_tws: Optional[float] = None,
+                       max_tws: Optional[float] = None) -> Optional[str]:
+    image = create_heatmap_image(year, min_tws, max_tws)
+    if image is None:
+        print('No logged tracks match the heatmap filter')
+        return None
+
+    image_name = 'heatmap_' + (str(year) if year else 'all')
+    if min_tws is not None or max_tws is not None:
+        image_name = image_name + '_tws_{}-{}'.format(min_tws if min_tws is not None else 0,
+                                                     max_tws if max_tws is not None else 'max')
+
+    file_loc = rt_args.TRACK_IMAGES_DIR + os.sep + image_name + '.png'
+    image.save(file_loc)
+    print('\t\tCreated ' + file_loc)
+
+    return file_loc
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Create track images for logged entries, or a heatmap of them.')
+    parser.add_argument('--heatmap', action='store_true', help='render all logged tracks into one density map')
+    parser.add_argument('--year', type=int, help='only include tracks logged in this year')
+    parser.add_argument('--min-tws', type=float, help='only include tracks with average TWS at or above this')
+    parser.add_argument('--max-tws', type=float, help='only include tracks with average TWS at or below this')
+    args = parser.parse_args()
+
+    if args.heatmap:
+        save_heatmap_image(args.year, args.min_tws, args.max_tws)
+    else:
+        create_image_files()
+
+
 if __name__ == '__main__':
-    create_image_files()
+    main()
@@ -0,0 +1,312 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+import common as rt_args
+from database import LogEntryRecord, TrackStats, BestEffortRecord, SegmentIndexRecord, insert_all, \
+    select_overlapping_entries, replace_segment_index_records
+from track_stats import SegmentChannels
+
+# Bulk import runs as four stages.  Worker processes parse each file and compute stats and best efforts, since those
+# share the parsed gpxpy segment and it is too costly to pickle between processes.  The dispatcher skips segments
+# that are already logged.  Threads render images, which mostly wait on map tile requests.  A single writer batches
+# the inserts.  Every hand-off is bounded, so memory stays flat however many files are imported.
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_RENDER_THREADS = 4
+WRITE_BATCH_SEGMENTS = 50
+
+_DONE = None
+
+
+@dataclass()
+class SegmentResult:
+    entry: LogEntryRecord
+    stats: TrackStats
+    best_efforts: list[BestEffortRecord]
+    end_timestamp: int
+    num_points: int
+    channels: Optional[SegmentChannels]
+
+
+@dataclass()
+class FileResult:
+    file_name: str
+    segments: list[SegmentResult]
+    index: list[SegmentIndexRecord]
+    num_points: int
+    seconds: float
+
+
+@dataclass()
+class StageStats:
+    name: str
+    items: int = 0
+    points: int = 0
+    busy_seconds: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, items: int, seconds: float, points: int = 0):
+        with self.lock:
+            self.items += items
+            self.points += points
+            self.busy_seconds += seconds
+
+    def report_str(self, wall_seconds: float) -> str:
+        return '{:<10} {:>8} {:>10} {:>10.2f} {:>10.1f} {:>12.0f}'.format(
+            self.name, self.items, self.points, self.busy_seconds, self.items / wall_seconds if wall_seconds else 0.0,
+            self.points / wall_seconds if wall_seconds else 0.0)
+
+
+def analyze_file(fn: str, speed_pct_ignore: float, render: bool, clean: bool = False,
+                 time_weighted: bool = False) -> FileResult:
+    # runs in a worker process, so everything returned must pickle cheaply: records and compact channels only
+    import gpxpy
+    from log_entry import create_log_entry, create_track_stats
+    from segment_index import scan_segment_offsets
+    from quality import clean_channels
+    from track_stats import get_segment_stats, segment_channels
+    from window_stats import get_best_efforts, create_best_effort_records
+
+    start = time.perf_counter()
+
+    try:
+        with rt_args.open_gpx(fn) as f:
+            gpx = gpxpy.parse(f)
+    except Exception as e:
+        print('unable to read {}: {}'.format(fn, e))
+        return FileResult(fn, [], [], 0, time.perf_counter() - start)
+
+    results = []
+    num_points = 0
+    for t in gpx.tracks:
+        for seg in t.segments:
+            num_points += len(seg.points)
+            if len(seg.points) < 2:
+                continue
+
+            if seg.points[0].time > seg.points[1].time:
+                seg.points.reverse()
+
+            # skip segments w/ distance < 10m, or shorter than 10 minutes
+            if seg.length_2d() > 10.0 and seg.get_duration() > 600:
+                pct_ignore = 0.0 if clean else speed_pct_ignore
+                stats = get_segment_stats(seg, pct_ignore, time_weighted=time_weighted, clean=clean)
+                entry = create_log_entry(fn, seg, fn.replace('.gpx', ''), '', '', '', '')
+                ch = segment_channels(seg)
+                if clean:
+                    ch, _ = clean_channels(ch)
+
+                results.append(SegmentResult(entry, create_track_stats(entry, stats, pct_ignore),
+                                             create_best_effort_records(entry.start_timestamp, get_best_efforts(ch)),
+                                             int(seg.get_time_bounds().end_time.timestamp()), len(seg.points),
+                                             ch.compact() if render else None))
+
+    return FileResult(fn, results, scan_segment_offsets(fn) if results else [], num_points,
+                      time.perf_counter() - start)
+
+
+def render_worker(in_q: queue.Queue, out_q: queue.Queue, stage: StageStats):
+    from images import channels_image
+
+    while True:
+        result = in_q.get()
+        if result is _DONE:
+            break
+
+        start = time.perf_counter()
+        try:
+            img = channels_image(result.channels)
+            img.save(rt_args.get_file_loc(result.entry.path_to_image_file()))
+        except Exception:
+            print('failed to create and save image for ' + result.entry.path_to_gpx_file)
+
+        # the writer has no use for the points
+        result.channels = None
+        stage.add(1, time.perf_counter() - start, result.num_points)
+        out_q.put(result)
+
+
+def write_batch(batch: list[SegmentResult], con: sqlite3.Connection):
+    # one transaction for every table, so a failed insert rolls back the whole batch rather than leaving log entries
+    # without their stats
+    insert_all('LOG_ENTRY', [r.entry.values_str() for r in batch], con)
+    insert_all('TRACK_STATS', [r.stats.values_str() for r in batch], con)
+    insert_all('TRACK_BEST_EFFORTS', [e.values_str() for r in batch for e in r.best_efforts], con)
+    con.commit()
+
+
+def writer_worker(in_q: queue.Queue, stage: StageStats, batch_size: int):
+    # the only connection that writes, so inserts never contend for the database lock
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    batch = []
+
+    def flush():
+        # a failed batch is retried a segment at a time, so only the segments that fail are lost.  Those are reported
+        # rather than raised, as a dead writer would leave the other stages blocked on a full queue.
+        start = time.perf_counter()
+        try:
+            write_batch(batch, con)
+        except sqlite3.Error:
+            con.rollback()
+            for r in batch:
+                try:
+                    write_batch([r], con)
+                except sqlite3.Error as e:
+                    con.rollback()
+                    print('failed to persist segment {} of {}: {}'.format(r.entry.start_timestamp,
+                                                                         r.entry.path_to_gpx_file, e))
+        stage.add(len(batch), time.perf_counter() - start, sum(r.num_points for r in batch))
+        batch.clear()
+
+    try:
+        while True:
+            result = in_q.get()
+            if result is _DONE:
+                break
+
+            # a file's segment index, written as it arrives as it is only a few rows
+            if isinstance(result, list):
+                try:
+                    replace_segment_index_records(sorted({r.file_name for r in result}), result, con)
+                except sqlite3.Error as e:
+                    con.rollback()
+                    print('failed to persist segment index: {}'.format(e))
+                continue
+
+            batch.append(result)
+            if len(batch) >= batch_size:
+                flush()
+
+        if batch:
+            flush()
+    finally:
+        con.close()
+
+
+def ingest_files(file_names: list[str], speed_pct_ignore: float = 0.0, workers: Optional[int] = None,
+                 render: bool = True, render_threads: int = DEFAULT_RENDER_THREADS,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, batch_size: int = WRITE_BATCH_SEGMENTS,
+                 clean: bool = False, time_weighted: bool = False) -> list[StageStats]:
+    from concurrent.futures import ProcessPoolExecutor
+
+    analyze_stage = StageStats('analyze')
+    dispatch_stage = StageStats('dispatch')
+    render_stage = StageStats('render')
+    write_stage = StageStats('write')
+
+    write_q = queue.Queue(maxsize=queue_size * 4)
+    writer = threading.Thread(target=writer_worker, args=(write_q, write_stage, batch_size))
+    writer.start()
+
+    render_q = queue.Queue(maxsize=queue_size)
+    renderers = []
+    if render:
+        os.makedirs(rt_args.TRACK_IMAGES_DIR, exist_ok=True)
+        renderers = [threading.Thread(target=render_worker, args=(render_q, write_q, render_stage))
+                     for _ in range(render_threads)]
+        for r in renderers:
+            r.start()
+
+    # time spans queued in this run, so the same passage in two overlapping files is only imported once
+    queued_spans = []
+    num_skipped = 0
+
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+
+    def dispatch(file_result: FileResult):
+        nonlocal num_skipped
+        analyze_stage.add(1, file_result.seconds, file_result.num_points)
+
+        for r in file_result.segments:
+            # busy time excludes waiting on a full queue, which is back pressure from a slower stage
+            start = time.perf_counter()
+            span = (r.entry.start_timestamp, r.end_timestamp)
+            already_logged = select_overlapping_entries(span[0], span[1], con) or \
+                any(s <= span[1] and e >= span[0] for s, e in queued_spans)
+            dispatch_stage.add(1, time.perf_counter() - start, r.num_points)
+
+            if already_logged:
+                num_skipped += 1
+                continue
+
+            queued_spans.append(span)
+            (render_q if render else write_q).put(r)
+
+        if file_result.index:
+            write_q.put(file_result.index)
+
+    try:
+        # at most queue_size files are in flight, and results are taken in submission order so the first file
+        # listed wins when exports overlap
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for fn in file_names:
+                pending.append(executor.submit(analyze_file, fn, speed_pct_ignore, render, clean, time_weighted))
+                if len(pending) >= queue_size:
+                    dispatch(pending.popleft().result())
+
+            while pending:
+                dispatch(pending.popleft().result())
+    finally:
+        con.close()
+
+        for _ in renderers:
+            render_q.put(_DONE)
+        for r in renderers:
+            r.join()
+
+        write_q.put(_DONE)
+        writer.join()
+
+    if num_skipped:
+        print('\t\tSkipped {} segments that are already logged'.format(num_skipped))
+
+    stages = [analyze_stage, dispatch_stage, write_stage]
+    if render:
+        stages.insert(2, render_stage)
+
+    return stages
+
+
+def ingest_report_str(stages: list[StageStats], wall_seconds: float) -> str:
+    lines = ['{:<10} {:>8} {:>10} {:>10} {:>10} {:>12}'.format('Stage', 'Items', 'Points', 'Busy s', 'Items/s',
+                                                               'Points/s')]
+    lines.extend(s.report_str(wall_seconds) for s in stages)
+    lines.append('Wall time {:.2f}s'.format(wall_seconds))
+
+    return '\n'.join(lines)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Log every segment of many gpx files without prompting.')
+    parser.add_argument('files', nargs='*', help='gpx file names (default: every file in the gpx files directory)')
+    parser.add_argument('--workers', type=int, help='parse and stats processes (default: all cores)')
+    parser.add_argument('--render-threads', type=int, default=DEFAULT_RENDER_THREADS)
+    parser.add_argument('--no-images', action='store_true', help='skip rendering track images')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help='files in flight between stages (default {})'.format(DEFAULT_QUEUE_SIZE))
+    parser.add_argument('--pct-ignore', type=int, default=0, help='pct of top speeds to ignore (0 - 50)')
+    parser.add_argument('--clean', action='store_true',
+                        help='drop GPS spikes and sensor glitches before stats, instead of ignoring top speeds')
+    parser.add_argument('--time-weighted', action='store_true',
+                        help='weight the STW and wind averages by the time each point covers, not per point')
+    args = parser.parse_args()
+
+    file_names = args.files if args.files else rt_args.get_data_files()
+
+    start = time.perf_counter()
+    stages = ingest_files(file_names, min(max(args.pct_ignore, 0), 50) / 100.0, args.workers, not args.no_images,
+                          args.render_threads, args.queue_size, clean=args.clean, time_weighted=args.time_weighted)
+
+    print(ingest_report_str(stages, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
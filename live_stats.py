@@ -0,0 +1,250 @@
+import json
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Iterator
+
+from gpxpy.gpx import GPXTrackPoint, DEFAULT_STOPPED_SPEED_THRESHOLD
+
+import common as rt_args
+from track_stats import PointExtension, SegmentStats, mps_to_knots, m_to_nm, wind_averages_from_sums
+
+LIVE_UDP_PORT = 10110
+SNAPSHOT_SECONDS = 10.0
+
+
+@dataclass()
+class LiveSegmentStats:
+    # get_segment_stats(seg, 0.0) for a segment that is still growing.  Each point updates running sums in O(1), so
+    # a snapshot never reprocesses the track.  Moving and stopped time follow gpxpy's get_moving_data.  Max SOG
+    # applies gpxpy's outlier test (distance within 1.5 standard deviations of the mean) against the points seen so
+    # far, so it can differ from the batch value while the track is short.
+    num_pts: int = 0
+    start_time: Optional[datetime] = None
+    speed_units: str = 'kts'
+    previous: Optional[GPXTrackPoint] = None
+
+    moving_seconds: float = 0.0
+    stopped_seconds: float = 0.0
+    moving_m: float = 0.0
+    stopped_m: float = 0.0
+
+    # running mean and sum of squared deviations (Welford) of the distances between moving points
+    num_distances: int = 0
+    mean_distance: float = 0.0
+    m2_distance: float = 0.0
+    max_speed_mps: float = 0.0
+
+    num_stw: int = 0
+    stw_total: float = 0.0
+    max_stw: Optional[float] = None
+
+    num_tw: int = 0
+    tws_total: float = 0.0
+    max_tws: Optional[float] = None
+    ew_total: float = 0.0
+    ns_total: float = 0.0
+
+    def add_point(self, p: GPXTrackPoint):
+        pe = PointExtension(p)
+
+        if self.num_pts == 0:
+            self.speed_units = pe.speed_units()
+        if self.start_time is None and p.time:
+            self.start_time = p.time
+        self.num_pts += 1
+
+        self.add_motion(p)
+
+        stw = pe.stw
+        if stw is not None:
+            self.num_stw += 1
+            self.stw_total += stw
+            self.max_stw = stw if self.max_stw is None else max(self.max_stw, stw)
+
+        tws = pe.tws
+        twd = pe.twd
+        if tws is not None and twd is not None:
+            self.num_tw += 1
+            self.tws_total += tws
+            self.max_tws = tws if self.max_tws is None else max(self.max_tws, tws)
+            self.ew_total += math.sin(math.radians(twd)) * tws
+            self.ns_total += math.cos(math.radians(twd)) * tws
+
+    def add_motion(self, p: GPXTrackPoint):
+        previous = self.previous
+        self.previous = p
+        if previous is None or not p.time or not previous.time:
+            return
+
+        if p.elevation and previous.elevation:
+            distance = p.distance_3d(previous)
+        else:
+            distance = p.distance_2d(previous)
+
+        seconds = (p.time - previous.time).total_seconds()
+        if seconds <= 0 or not distance:
+            return
+
+        if (distance / 1000) / (seconds / 60 ** 2) <= DEFAULT_STOPPED_SPEED_THRESHOLD:
+            self.stopped_seconds += seconds
+            self.stopped_m += distance
+        else:
+            self.moving_seconds += seconds
+            self.moving_m += distance
+
+        if self.moving_seconds:
+            self.num_distances += 1
+            delta = distance - self.mean_distance
+            self.mean_distance += delta / self.num_distances
+            self.m2_distance += delta * (distance - self.mean_distance)
+
+            std = math.sqrt(self.m2_distance / self.num_distances)
+            if self.num_distances >= 2 and abs(distance - self.mean_distance) <= std * 1.5:
+                self.max_speed_mps = max(self.max_speed_mps, distance / seconds)
+
+    def snapshot(self) -> SegmentStats:
+        s_date = self.start_time.date() if self.start_time else 'None'
+        start_t = self.start_time.time() if self.start_time else 'None'
+
+        total_seconds = self.moving_seconds + self.stopped_seconds
+        avg_mps = (self.moving_m + self.stopped_m) / total_seconds if total_seconds else 0.0
+
+        if self.speed_units == 'kts':
+            max_sog = mps_to_knots(self.max_speed_mps)
+            avg_sog = mps_to_knots(avg_mps)
+            moving_d = m_to_nm(self.moving_m)
+            stopped_d = m_to_nm(self.stopped_m)
+        else:
+            max_sog = self.max_speed_mps
+            avg_sog = avg_mps
+            moving_d = self.moving_m
+            stopped_d = self.stopped_m
+
+        moving_t = timedelta(seconds=int(self.moving_seconds))
+        stopped_t = timedelta(seconds=int(self.stopped_seconds))
+
+        if self.num_stw == 0:
+            return SegmentStats(s_date, start_t, moving_t, stopped_t, moving_d, stopped_d, self.num_pts, 'kts',
+                                max_sog, avg_sog, None, None, None, None, None, None)
+
+        avg_tws = None
+        avg_wind_dir = None
+        avg_wind_spd = None
+        if self.num_tw:
+            avg_tws = self.tws_total / self.num_tw
+            avg_wind_dir, avg_wind_spd = wind_averages_from_sums(self.ew_total, self.ns_total, self.num_tw)
+
+        return SegmentStats(s_date, start_t, moving_t, stopped_t, moving_d, stopped_d, self.num_pts,
+                            self.speed_units, max_sog, avg_sog, self.max_stw, self.stw_total / self.num_stw,
+                            self.max_tws, avg_tws, avg_wind_dir, avg_wind_spd)
+
+
+def replay_gpx(fn: str, speedup: float = 0.0) -> Iterator[GPXTrackPoint]:
+    # the first segment of a gpx file as a timed feed, speedup times faster than it was logged.  0 replays as fast
+    # as the points can be read.
+    import gpxpy
+
+    with rt_args.open_gpx(fn) as f:
+        gpx = gpxpy.parse(f)
+
+    seg = gpx.tracks[0].segments[0]
+    if len(seg.points) > 1 and seg.points[0].time > seg.points[1].time:
+        seg.points.reverse()
+
+    previous = None
+    for p in seg.points:
+        if speedup > 0.0 and previous is not None and p.time and previous.time:
+            time.sleep(max((p.time - previous.time).total_seconds(), 0.0) / speedup)
+
+        previous = p
+        yield p
+
+
+# stand-in for a live instrument feed until NMEA is read directly: one json object per udp datagram, with the
+# point's time, position and a Yacht Devices style comment
+def point_to_datagram(p: GPXTrackPoint) -> bytes:
+    return json.dumps({'time': p.time.isoformat() if p.time else None, 'lat': p.latitude, 'lon': p.longitude,
+                       'cmt': p.comment}).encode()
+
+
+def datagram_to_point(data: bytes) -> GPXTrackPoint:
+    d = json.loads(data)
+    t = datetime.fromisoformat(d['time']) if d.get('time') else None
+
+    return GPXTrackPoint(d['lat'], d['lon'], time=t, comment=d.get('cmt'))
+
+
+def udp_feed(port: int = LIVE_UDP_PORT, host: str = '127.0.0.1') -> Iterator[GPXTrackPoint]:
+    import socket
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind((host, port))
+        while True:
+            data, _ = sock.recvfrom(65536)
+            try:
+                yield datagram_to_point(data)
+            except (ValueError, KeyError):
+                print('ignoring malformed datagram')
+
+
+def send_udp(points: Iterator[GPXTrackPoint], port: int = LIVE_UDP_PORT, host: str = '127.0.0.1'):
+    import socket
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for p in points:
+            sock.sendto(point_to_datagram(p), (host, port))
+
+
+def print_snapshot(stats: SegmentStats):
+    print('\n' + stats.summary_str())
+    print(stats.distance_str())
+    print(stats.speeds_str())
+    print(stats.wind_str())
+
+
+def run_live(points: Iterator[GPXTrackPoint], snapshot_seconds: float = SNAPSHOT_SECONDS) -> LiveSegmentStats:
+    live = LiveSegmentStats()
+    last_snapshot = time.monotonic()
+
+    try:
+        for p in points:
+            live.add_point(p)
+
+            if time.monotonic() - last_snapshot >= snapshot_seconds:
+                print_snapshot(live.snapshot())
+                last_snapshot = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+
+    if live.num_pts:
+        print_snapshot(live.snapshot())
+
+    return live
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Live segment statistics from a replayed gpx file or a udp feed.')
+    parser.add_argument('--replay', help='gpx file to replay')
+    parser.add_argument('--speedup', type=float, default=60.0, help='replay speed multiple, 0 for no delay')
+    parser.add_argument('--send', action='store_true', help='send the replay to the udp port instead of summarizing it')
+    parser.add_argument('--listen', action='store_true', help='summarize points arriving on the udp port')
+    parser.add_argument('--port', type=int, default=LIVE_UDP_PORT)
+    parser.add_argument('--every', type=float, default=SNAPSHOT_SECONDS, help='seconds between snapshots')
+    args = parser.parse_args()
+
+    if args.listen:
+        run_live(udp_feed(args.port), args.every)
+    elif args.replay and args.send:
+        send_udp(replay_gpx(args.replay, args.speedup), args.port)
+    elif args.replay:
+        run_live(replay_gpx(args.replay, args.speedup), args.every)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,17 +6,28 @@ import gpxpy
 from gpxpy.gpx import GPX, GPXTrackSegment
 
 import common as rt_args
-from database import LogEntryRecord, TrackStats, add_to_database, EngineHoursRecord
+from database import LogEntryRecord, TrackStats, add_to_database, EngineHoursRecord, BestEffortRecord, \
+    select_overlapping_entries
+from engine_hours import note_engine_hours
 from track_stats import get_speed_pct_to_ignore, get_segment_stats, SegmentStats
+from timing import timed
+from window_stats import get_segment_best_efforts, create_best_effort_records
 
 
-def persist(entry: LogEntryRecord, stats: TrackStats, hours_rec: Optional[EngineHoursRecord], con: Connection):
+@timed('persist')
+def persist(entry: LogEntryRecord, stats: TrackStats, hours_rec: Optional[EngineHoursRecord], con: Connection,
+            best_efforts: Optional[list[BestEffortRecord]] = None):
     add_to_database(entry.table_name(), entry.values_str(), con)
     add_to_database(stats.table_name(), stats.values_str(), con)
 
+    if best_efforts is not None:
+        for rec in best_efforts:
+            add_to_database(rec.table_name(), rec.values_str(), con)
+
     if hours_rec is not None:
         try:
             add_to_database(hours_rec.table_name(), hours_rec.values_str(), con)
+            note_engine_hours(hours_rec)
         except:
             print('failed to persist hours')
 
@@ -64,6 +75,15 @@ def create_track_stats(le: LogEntryRecord, stats: SegmentStats, pct: float) -> O
                       stats.avg_wind_spd)
 
 
+def is_already_logged(seg: GPXTrackSegment, con: Connection) -> bool:
+    # the same passage can appear in several overlapping exports, so match on time span rather than file name
+    t_bounds = seg.get_time_bounds()
+    overlaps = select_overlapping_entries(int(t_bounds.start_time.timestamp()), int(t_bounds.end_time.timestamp()),
+                                          con)
+
+    return len(overlaps) > 0
+
+
 def select_and_process_file():
     fn = rt_args.select_data_file()
     speed_pct_ignore = get_speed_pct_to_ignore()
@@ -71,7 +91,7 @@ def select_and_process_file():
 
 
 def process_selected_file(fn: str, speed_pct_ignore: float):
-    gpx: GPX = gpxpy.parse(open(rt_args.get_file_loc(fn)))
+    gpx: GPX = gpxpy.parse(rt_args.open_gpx(fn))
 
     all_segments: list[GPXTrackSegment] = []
     for t in gpx.tracks:
@@ -84,13 +104,17 @@ def process_selected_file(fn: str, speed_pct_ignore: float):
 
         # skip segments w/ distance < 10m, or shorter than 10 minutes
         if seg.length_2d() > 10.0 and seg.get_duration() > 600:
+            if is_already_logged(seg, con):
+                print('Segment starting {} is already logged, skipping'.format(seg.get_time_bounds().start_time))
+                continue
+
             stats = get_segment_stats(seg, speed_pct_ignore)
 
             new_entry = input_log_entry(fn, seg, speed_pct_ignore)
             trk_stats = create_track_stats(new_entry, stats, speed_pct_ignore)
+            efforts = create_best_effort_records(new_entry.start_timestamp, get_segment_best_efforts(seg))
 
-            con = sqlite3.connect(rt_args.DATABASE_LOC)
-            persist(new_entry, trk_stats, con)
+            persist(new_entry, trk_stats, None, con, efforts)
 
     con.close()
 
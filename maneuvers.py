@@ -0,0 +1,173 @@
+import sqlite3
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+import common as rt_args
+from database import select_track_refs, select_maneuver_timestamps, add_all_to_database, ManeuverRecord, \
+    ManeuverAnalysisRecord
+from track_stats import SegmentChannels, segment_channels, iter_logged_segments
+
+# the boat is only considered to be on a tack once the wind is this far off the bow or stern, so wind shifts and
+# steering wobble around dead upwind/downwind don't register as maneuvers
+HYSTERESIS_DEG = 15.0
+
+# a tack has to be held at least this long to count, otherwise short excursions are folded into the previous tack
+MIN_TACK_SECONDS = 60.0
+
+# windows around the moment of the maneuver used to measure speed loss
+SPEED_BEFORE_SECONDS = (-60.0, -10.0)
+SPEED_DURING_SECONDS = (-10.0, 30.0)
+
+
+@dataclass()
+class Maneuver:
+    timestamp: int
+    kind: str
+    twa_before: Optional[float]
+    twa_after: Optional[float]
+    stw_before: Optional[float]
+    stw_min: Optional[float]
+
+    @property
+    def speed_loss(self) -> Optional[float]:
+        if self.stw_before is None or self.stw_min is None:
+            return None
+
+        return self.stw_before - self.stw_min
+
+
+def signed_twa(ch: SegmentChannels) -> np.ndarray:
+    # -180 to 180°, positive with the wind over the starboard side.  COG stands in for heading.
+    twa = (ch.twd - ch.cog + 180.0) % 360.0 - 180.0
+    awa = (ch.awa + 180.0) % 360.0 - 180.0
+
+    return np.where(np.isnan(twa), awa, twa)
+
+
+def forward_fill(v: np.ndarray) -> np.ndarray:
+    idx = np.where(np.isnan(v), 0, np.arange(len(v)))
+    np.maximum.accumulate(idx, out=idx)
+
+    return v[idx]
+
+
+def tack_sides(t: np.ndarray, twa: np.ndarray) -> np.ndarray:
+    # +1 starboard, -1 port, NaN before the first confident reading.  Near dead upwind or downwind sin(twa) is
+    # small, so the previous side is carried forward until the wind is clearly on the other side.
+    threshold = np.sin(np.radians(HYSTERESIS_DEG))
+    s = np.sin(np.radians(twa))
+
+    side = np.full(len(twa), np.nan)
+    side[s > threshold] = 1.0
+    side[s < -threshold] = -1.0
+    side = forward_fill(side)
+
+    # drop tacks held for less than the minimum time, then refill from the tack before them
+    change = np.flatnonzero(np.diff(side) != 0) + 1
+    run_starts = np.concatenate(([0], change))
+    run_ends = np.concatenate((change, [len(side)]))
+    run_seconds = t[run_ends - 1] - t[run_starts]
+
+    short = (run_seconds < MIN_TACK_SECONDS) & (run_starts > 0)
+    if np.any(short):
+        run_ids = np.repeat(np.arange(len(run_starts)), run_ends - run_starts)
+        side[short[run_ids]] = np.nan
+        side = forward_fill(side)
+
+    return side
+
+
+def window_means(t: np.ndarray, v: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    valid = ~np.isnan(v)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, v, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+
+    lo = np.searchsorted(t, starts, side='left')
+    hi = np.searchsorted(t, ends, side='right')
+    n = counts[hi] - counts[lo]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, (sums[hi] - sums[lo]) / n, np.nan)
+
+
+def detect_maneuvers(ch: SegmentChannels) -> list[Maneuver]:
+    if len(ch) < 2:
+        return []
+
+    twa = signed_twa(ch)
+    side = tack_sides(ch.time, twa)
+
+    at = np.flatnonzero(~np.isnan(side[:-1]) & ~np.isnan(side[1:]) & (np.diff(side) != 0)) + 1
+    if len(at) == 0:
+        return []
+
+    m_times = ch.time[at]
+    abs_twa = np.abs(twa)
+    twa_before = window_means(ch.time, abs_twa, m_times + SPEED_BEFORE_SECONDS[0], m_times + SPEED_BEFORE_SECONDS[1])
+    twa_after = window_means(ch.time, abs_twa, m_times - SPEED_BEFORE_SECONDS[1], m_times - SPEED_BEFORE_SECONDS[0])
+    stw_before = window_means(ch.time, ch.stw, m_times + SPEED_BEFORE_SECONDS[0], m_times + SPEED_BEFORE_SECONDS[1])
+
+    # minimum speed through each maneuver, maneuvers are few enough that slicing per maneuver is cheap
+    lo = np.searchsorted(ch.time, m_times + SPEED_DURING_SECONDS[0], side='left')
+    hi = np.searchsorted(ch.time, m_times + SPEED_DURING_SECONDS[1], side='right')
+    stw_min = np.array([np.nanmin(ch.stw[a:b]) if np.any(~np.isnan(ch.stw[a:b])) else np.nan
+                        for a, b in zip(lo, hi)])
+
+    # tacks turn through the wind, gybes turn away from it
+    through = np.nanmean(np.vstack((twa_before, twa_after)), axis=0)
+    kinds = np.where(np.nan_to_num(through, nan=0.0) < 90.0, 'tack', 'gybe')
+
+    def opt(v: float) -> Optional[float]:
+        return None if np.isnan(v) else float(v)
+
+    return [Maneuver(int(m_times[i]), str(kinds[i]), opt(twa_before[i]), opt(twa_after[i]), opt(stw_before[i]),
+                     opt(stw_min[i])) for i in range(len(at))]
+
+
+def create_maneuver_records(start_timestamp: int, maneuvers: list[Maneuver]) -> list[ManeuverRecord]:
+    return [ManeuverRecord(start_timestamp, m.timestamp, m.kind, m.twa_before, m.twa_after, m.stw_before, m.stw_min,
+                           m.speed_loss) for m in maneuvers]
+
+
+def maneuvers_summary_str(maneuvers: list[Maneuver]) -> str:
+    tacks = [m for m in maneuvers if m.kind == 'tack']
+    gybes = [m for m in maneuvers if m.kind == 'gybe']
+
+    def avg_loss(ms: list[Maneuver]) -> str:
+        losses = [m.speed_loss for m in ms if m.speed_loss is not None]
+        return '{:.1f}'.format(sum(losses) / len(losses)) if losses else 'n/a'
+
+    return '\tTacks: {} (avg STW loss {}), Gybes: {} (avg STW loss {})'.format(len(tacks), avg_loss(tacks),
+                                                                             len(gybes), avg_loss(gybes))
+
+
+def analyze_all_maneuvers():
+    # detect maneuvers for every logged trip that hasn't been analyzed yet, in one batch
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+
+    try:
+        done = select_maneuver_timestamps(con)
+        track_refs = [r for r in select_track_refs(con) if r[1] not in done]
+
+        for seg in iter_logged_segments(track_refs):
+            ch = segment_channels(seg)
+            start_timestamp = int(seg.get_time_bounds().start_time.timestamp())
+            maneuvers = detect_maneuvers(ch)
+
+            print('{}:'.format(seg.get_time_bounds().start_time))
+            print(maneuvers_summary_str(maneuvers))
+
+            recs = create_maneuver_records(start_timestamp, maneuvers)
+            if recs:
+                add_all_to_database(recs[0].table_name(), [r.values_str() for r in recs], con)
+
+            analysis = ManeuverAnalysisRecord(start_timestamp, len(recs))
+            add_all_to_database(analysis.table_name(), [analysis.values_str()], con)
+    finally:
+        con.close()
+
+
+if __name__ == '__main__':
+    analyze_all_maneuvers()
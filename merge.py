@@ -0,0 +1,128 @@
+import heapq
+from typing import Iterator
+
+import gpxpy
+from gpxpy.gpx import GPX, GPXTrack, GPXTrackSegment, GPXTrackPoint
+
+import common as rt_args
+
+# consecutive points further apart than this are treated as separate trips, closer ones are stitched into one segment
+STITCH_GAP_SECONDS = 300
+
+
+class MergeCounts:
+    def __init__(self):
+        self.points_in = 0
+        self.duplicates = 0
+        self.untimed = 0
+
+    def summary_str(self) -> str:
+        return 'Points read: {}, duplicates dropped: {}, points without time dropped: {}'.format(
+            self.points_in, self.duplicates, self.untimed)
+
+
+def file_segments(fn: str) -> list[GPXTrackSegment]:
+    with rt_args.open_gpx(fn) as f:
+        gpx: GPX = gpxpy.parse(f)
+
+    all_segments = []
+    for t in gpx.tracks:
+        all_segments.extend(t.segments)
+
+    return all_segments
+
+
+def ordered_points(seg: GPXTrackSegment, counts: MergeCounts) -> list[GPXTrackPoint]:
+    # each merge input has to be in ascending time order.  Reversed exports only need reversing, anything else
+    # out of order is sorted.
+    pts = [p for p in seg.points if p.time is not None]
+    counts.points_in += len(seg.points)
+    counts.untimed += len(seg.points) - len(pts)
+
+    if len(pts) > 1 and pts[0].time > pts[-1].time:
+        pts.reverse()
+
+    if any(a.time > b.time for a, b in zip(pts, pts[1:])):
+        pts.sort(key=lambda p: p.time)
+
+    return pts
+
+
+def merge_points(segments: list[GPXTrackSegment], counts: MergeCounts) -> Iterator[GPXTrackPoint]:
+    # k-way merge of already ordered segments, O(n log k).  The same fix exported in several files carries the
+    # same timestamp, so only the first point seen for each time is kept.
+    streams = [ordered_points(s, counts) for s in segments]
+
+    last_time = None
+    for p in heapq.merge(*streams, key=lambda pt: pt.time):
+        if p.time == last_time:
+            counts.duplicates += 1
+            continue
+
+        last_time = p.time
+        yield p
+
+
+def stitch_segments(points: Iterator[GPXTrackPoint]) -> list[GPXTrackSegment]:
+    segments = []
+    current: list[GPXTrackPoint] = []
+
+    for p in points:
+        if current and (p.time - current[-1].time).total_seconds() > STITCH_GAP_SECONDS:
+            segments.append(GPXTrackSegment(current))
+            current = []
+
+        current.append(p)
+
+    if current:
+        segments.append(GPXTrackSegment(current))
+
+    return segments
+
+
+def merge_files(fns: list[str]) -> (GPX, MergeCounts):
+    counts = MergeCounts()
+
+    all_segments = []
+    for fn in fns:
+        all_segments.extend(file_segments(fn))
+
+    track = GPXTrack()
+    track.segments = stitch_segments(merge_points(all_segments, counts))
+
+    gpx = GPX()
+    gpx.tracks.append(track)
+
+    return gpx, counts
+
+
+def merged_file_name(gpx: GPX) -> str:
+    bounds = gpx.get_time_bounds()
+    return '{}_{}_merged.gpx'.format(bounds.start_time.date(), bounds.end_time.date())
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Merge overlapping gpx exports into one file with one segment per '
+                                                 'trip and no duplicate points.')
+    parser.add_argument('files', nargs='+', help='gpx file names in the gpx files directory')
+    parser.add_argument('-o', '--output', help='output file name, written to the output directory')
+    args = parser.parse_args()
+
+    gpx, counts = merge_files(args.files)
+    print(counts.summary_str())
+
+    if not gpx.tracks[0].segments:
+        print('No timed points found.  No action taken.')
+        return
+
+    out_fn = args.output if args.output else merged_file_name(gpx)
+    with open(rt_args.OUTPUT_DIR + out_fn, 'w') as f:
+        f.write(gpx.to_xml())
+
+    print('Wrote {} segments to {}'.format(len(gpx.tracks[0].segments), out_fn))
+
+
+if __name__ == '__main__':
+    main()
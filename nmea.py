@@ -0,0 +1,394 @@
+import calendar
+import math
+import mmap
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import common as rt_args
+from track_stats import SegmentChannels, CHANNEL_NAMES
+
+# NMEA 0183 logs are scanned a chunk at a time.  Line bounds, sentence delimiters, checksums, sentence types and field
+# counts are found with numpy over the whole chunk.  The fields themselves are cut out by slicing each valid sentence
+# from the chunk and splitting them with one bytes.split per type and field count, so python's per sentence work is
+# a slice in a list comprehension rather than any parsing.
+NMEA_CHUNK_BYTES = 16 * 1024 * 1024
+
+# fixes further apart than this start a new segment, as merge.py does when stitching gpx segments
+NMEA_SEGMENT_GAP_SECONDS = 300
+
+# instrument values are carried into a fix for this many fixes after their sentence, then treated as missing
+NMEA_STALE_FIXES = 5
+
+KNOTS_PER_UNIT = {b'N': 1.0, b'M': 1.94384, b'K': 0.539957}
+
+_HEX_VALUES = np.full(256, -1, dtype=np.int16)
+for _i, _c in enumerate(b'0123456789ABCDEF'):
+    _HEX_VALUES[_c] = _i
+for _i, _c in enumerate(b'abcdef'):
+    _HEX_VALUES[_c] = 10 + _i
+
+
+@dataclass()
+class NmeaReadStats:
+    num_bytes: int = 0
+    num_lines: int = 0
+    num_invalid: int = 0
+    num_fixes: int = 0
+    decoded: dict = field(default_factory=dict)
+
+    def summary_str(self) -> str:
+        by_type = ', '.join('{} {}'.format(k.decode(), v) for k, v in sorted(self.decoded.items()))
+        return '{:.1f} MB, {} lines, {} invalid, {} fixes ({})'.format(self.num_bytes / 1e6, self.num_lines,
+                                                                       self.num_invalid, self.num_fixes, by_type)
+
+
+def valid_sentences(buf: np.ndarray) -> (np.ndarray, np.ndarray, int):
+    # start (first byte after '$' or '!') and end ('*') of every line whose checksum matches, and the number of lines.
+    # buf must end with a newline.
+    line_ends = np.flatnonzero(buf == 0x0A)
+    if len(line_ends) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), 0
+    line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+
+    # first '$' or '!' at or after the line start, and the last '*' before the line end.  Gateways may prefix
+    # each line with a timestamp, so the sentence doesn't have to start the line.
+    dollars = np.flatnonzero((buf == 0x24) | (buf == 0x21))
+    stars = np.flatnonzero(buf == 0x2A)
+    if len(dollars) == 0 or len(stars) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), len(line_ends)
+
+    d = dollars[np.minimum(np.searchsorted(dollars, line_starts), len(dollars) - 1)]
+    s = stars[np.maximum(np.searchsorted(stars, line_ends) - 1, 0)]
+
+    ok = (d >= line_starts) & (s > d + 1) & (s + 2 < line_ends)
+    starts = d[ok] + 1
+    ends = s[ok]
+
+    expected = _HEX_VALUES[buf[ends + 1]] * 16 + _HEX_VALUES[buf[ends + 2]]
+
+    bounds = np.empty(2 * len(starts), dtype=np.int64)
+    bounds[0::2] = starts
+    bounds[1::2] = ends
+    actual = np.bitwise_xor.reduceat(buf, bounds)[0::2] if len(bounds) else np.empty(0, dtype=np.uint8)
+
+    valid = expected == actual
+
+    return starts[valid], ends[valid], len(line_ends)
+
+
+# sentence type -> (field index, column) pairs.  MWV is keyed with its reference field appended, R for apparent and
+# T for true wind.
+NMEA_FIELDS = {
+    b'RMC': ((1, 'hms'), (3, 'lat'), (4, 'ns'), (5, 'lon'), (6, 'ew'), (7, 'sog'), (8, 'cog'), (9, 'dmy')),
+    b'VTG': ((1, 'cog'), (5, 'sog')),
+    b'VHW': ((5, 'stw'),),
+    b'MWVR': ((1, 'awa'), (3, 'aws'), (4, 'aws_units')),
+    b'MWVT': ((1, 'twa'), (3, 'tws'), (4, 'tws_units')),
+    b'MWD': ((1, 'twd'), (5, 'tws'), (6, 'tws_units')),
+    b'DPT': ((1, 'depth'),),
+    b'DBT': ((3, 'depth'),),
+}
+
+# sentence type -> field appended to the type to look up NMEA_FIELDS
+NMEA_SUBTYPE_FIELDS = {b'MWV': 2}
+
+# sentence type -> status field, which must be A (valid) for the sentence to be used
+NMEA_STATUS_FIELDS = {b'RMC': 2, b'MWVR': 5, b'MWVT': 5}
+
+# RMC is the fix: each one becomes a point carrying the latest value of every other channel
+NMEA_FIX_TYPE = b'RMC'
+NMEA_FIX_COLUMNS = ('hms', 'lat', 'ns', 'lon', 'ew', 'dmy')
+NMEA_WIND_SPEEDS = {'aws': 'aws_units', 'tws': 'tws_units'}
+
+# sentences with fewer fields than the table reads, or than their status field, are rejected as invalid
+NMEA_MIN_FIELDS = {t: max([i for i, _ in columns] + [NMEA_STATUS_FIELDS.get(t, 0)]) + 1
+                   for t, columns in NMEA_FIELDS.items()}
+
+
+def to_floats(values: np.ndarray) -> np.ndarray:
+    a = values.astype(np.bytes_)
+    a[a == b''] = b'nan'
+
+    try:
+        return a.astype(np.float64)
+    except ValueError:
+        # a field that passed its checksum but isn't a number
+        return np.array([num(v) for v in values.tolist()], dtype=np.float64)
+
+
+def num(b: bytes) -> float:
+    try:
+        return float(b) if b else math.nan
+    except ValueError:
+        return math.nan
+
+
+def degrees_minutes(dm: np.ndarray, hemispheres: np.ndarray, negative: bytes) -> np.ndarray:
+    # ddmm.mmmm or dddmm.mmmm
+    degrees = np.floor(dm / 100.0)
+    values = degrees + (dm - degrees * 100.0) / 60.0
+
+    return np.where(hemispheres == negative, -values, values)
+
+
+def fix_times(hms: np.ndarray, dmy: np.ndarray) -> np.ndarray:
+    # epoch seconds from hhmmss.ss and ddmmyy.  A log only spans a few dates, so each is converted once.
+    dates, inverse = np.unique(dmy, return_inverse=True)
+
+    day_seconds = np.full(len(dates), np.nan)
+    for i, d in enumerate(dates.tolist()):
+        try:
+            day_seconds[i] = calendar.timegm((2000 + int(d[4:6]), int(d[2:4]), int(d[0:2]), 0, 0, 0))
+        except ValueError:
+            pass
+
+    return day_seconds[inverse] + np.floor(hms / 10000.0) * 3600.0 + np.floor(hms / 100.0) % 100.0 * 60.0 + \
+        hms % 100.0
+
+
+def type_keys(buf: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # the three letter sentence type after the two letter talker id (GP, II, WI, ...) as one integer per sentence
+    ok = starts + 5 <= ends
+    at = np.where(ok, starts, 0)
+    keys = (buf[at + 2].astype(np.int32) << 16) | (buf[at + 3].astype(np.int32) << 8) | buf[at + 4]
+
+    return np.where(ok, keys, -1)
+
+
+def type_key(sentence_type: bytes) -> int:
+    return (sentence_type[0] << 16) | (sentence_type[1] << 8) | sentence_type[2]
+
+
+class NmeaAssembler:
+    # converts each chunk's sentences to arrays, each value tagged with the number of fixes before its sentence.  A
+    # fix takes the latest value of each channel, if it arrived within NMEA_STALE_FIXES fixes.
+    def __init__(self):
+        self.num_fixes = 0
+
+        # converted so far: column -> list of (file offset, fix seq, value) arrays
+        self.columns: dict[str, list] = {}
+
+    def sentence_fields(self, chunk: bytes, buf: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                        stats: NmeaReadStats) -> dict[bytes, tuple[np.ndarray, dict]]:
+        # sentence type -> (index into starts, {column: raw field bytes}) for the valid sentences of each type.
+        # Sentences of one type and field count are joined and split in one call, so a column is every nth field.
+        commas = np.concatenate(([0], np.cumsum(buf == 0x2C, dtype=np.int32)))
+        num_fields = commas[ends] - commas[starts] + 1
+        keys = type_keys(buf, starts, ends)
+
+        found = {}
+        for base_type in {t[:3] for t in NMEA_FIELDS}:
+            sub_types = [t for t in NMEA_FIELDS if t[:3] == base_type]
+            min_fields = max(NMEA_MIN_FIELDS[t] for t in sub_types)
+
+            of_type = np.flatnonzero(keys == type_key(base_type))
+            for nf in np.unique(num_fields[of_type]).tolist():
+                group = of_type[num_fields[of_type] == nf]
+                if nf < min_fields:
+                    stats.num_invalid += len(group)
+                    continue
+
+                flat = b','.join([chunk[s:e] for s, e in zip(starts[group].tolist(), ends[group].tolist())]) \
+                    .split(b',')
+
+                subtype_field = NMEA_SUBTYPE_FIELDS.get(base_type)
+                subtypes = np.array(flat[subtype_field::nf], dtype=np.bytes_) if subtype_field else None
+
+                for t in sub_types:
+                    keep = np.ones(len(group), dtype=bool) if subtypes is None else subtypes == t[3:]
+
+                    status_field = NMEA_STATUS_FIELDS.get(t)
+                    if status_field is not None:
+                        keep &= np.array(flat[status_field::nf], dtype='S1') == b'A'
+
+                    if not keep.any():
+                        continue
+
+                    raw = {column: np.array(flat[i::nf], dtype=np.bytes_)[keep] for i, column in NMEA_FIELDS[t]}
+                    found.setdefault(t, []).append((group[keep], raw))
+
+        # a type may have come in more than one field count
+        merged = {}
+        for t, parts in found.items():
+            merged[t] = (np.concatenate([p[0] for p in parts]),
+                         {c: np.concatenate([p[1][c] for p in parts]) for c in parts[0][1]})
+            stats.decoded[t] = stats.decoded.get(t, 0) + len(merged[t][0])
+
+        return merged
+
+    def add_chunk(self, chunk: bytes, offset: int, buf: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                  stats: NmeaReadStats):
+        by_type = self.sentence_fields(chunk, buf, starts, ends, stats)
+
+        # fixes logged before each sentence
+        is_fix = np.zeros(len(starts), dtype=np.int64)
+        if NMEA_FIX_TYPE in by_type:
+            is_fix[by_type[NMEA_FIX_TYPE][0]] = 1
+        seqs = self.num_fixes + np.cumsum(is_fix) - is_fix
+        self.num_fixes += int(is_fix.sum())
+
+        for sentence_type, (idx, raw) in by_type.items():
+            values = {}
+            if sentence_type == NMEA_FIX_TYPE:
+                values['time'] = fix_times(to_floats(raw['hms']), raw['dmy'])
+                values['latitude'] = degrees_minutes(to_floats(raw['lat']), raw['ns'], b'S')
+                values['longitude'] = degrees_minutes(to_floats(raw['lon']), raw['ew'], b'W')
+
+            for column, v in raw.items():
+                if column in NMEA_FIX_COLUMNS or column.endswith('_units'):
+                    continue
+
+                values[column] = to_floats(v)
+                units_column = NMEA_WIND_SPEEDS.get(column)
+                if units_column is not None:
+                    units = raw[units_column]
+                    values[column] = values[column] * np.select([units == u for u in KNOTS_PER_UNIT],
+                                                                list(KNOTS_PER_UNIT.values()), np.nan)
+
+            offsets = offset + starts[idx]
+            for column, v in values.items():
+                self.columns.setdefault(column, []).append((offsets, seqs[idx], v))
+
+    def column(self, column: str) -> (np.ndarray, np.ndarray):
+        # fix seqs and values of a column from every sentence type carrying it, in the order they were logged
+        parts = self.columns.get(column, [])
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        offsets = np.concatenate([p[0] for p in parts])
+        order = np.argsort(offsets, kind='stable')
+
+        return np.concatenate([p[1] for p in parts])[order], np.concatenate([p[2] for p in parts])[order]
+
+    def channel(self, column: str, fix_numbers: np.ndarray) -> np.ndarray:
+        seqs, values = self.column(column)
+        if len(seqs) == 0:
+            return np.full(len(fix_numbers), np.nan)
+
+        # the last value that arrived before or with each fix
+        idx = np.searchsorted(seqs, fix_numbers, side='right') - 1
+        fresh = (idx >= 0) & (fix_numbers - seqs[np.maximum(idx, 0)] <= NMEA_STALE_FIXES)
+
+        return np.where(fresh, values[np.maximum(idx, 0)], np.nan)
+
+    def finish(self) -> list[SegmentChannels]:
+        if self.num_fixes == 0:
+            return []
+
+        fix_numbers = np.arange(self.num_fixes)
+        columns = {c: self.column(c)[1] for c in ['time', 'latitude', 'longitude']}
+        columns.update({c: self.channel(c, fix_numbers) for c in CHANNEL_NAMES})
+
+        # without MWD, the true wind direction comes from the MWV true wind angle and COG
+        twa = self.channel('twa', fix_numbers)
+        columns['twd'] = np.where(np.isnan(columns['twd']), (columns['cog'] + twa) % 360.0, columns['twd'])
+
+        # repeated or out of order fixes are dropped, and a gap starts a new segment
+        t = columns['time']
+        dt = np.diff(t)
+        keep = ~np.isnan(t)
+        keep[1:] &= ~((dt <= 0.0) & (dt > -NMEA_SEGMENT_GAP_SECONDS))
+        columns = {c: v[keep] for c, v in columns.items()}
+
+        breaks = np.flatnonzero(np.abs(np.diff(columns['time'])) > NMEA_SEGMENT_GAP_SECONDS) + 1
+        bounds = [0] + breaks.tolist() + [len(columns['time'])]
+
+        return [SegmentChannels(speed_units='kts', **{c: v[s:e] for c, v in columns.items()})
+                for s, e in zip(bounds, bounds[1:]) if e - s > 1]
+
+
+def decode_chunk(chunk: bytes, offset: int, assembler: NmeaAssembler, stats: NmeaReadStats):
+    buf = np.frombuffer(chunk, dtype=np.uint8)
+    starts, ends, num_lines = valid_sentences(buf)
+
+    stats.num_bytes += len(chunk)
+    stats.num_lines += num_lines
+    stats.num_invalid += num_lines - len(starts)
+
+    assembler.add_chunk(chunk, offset, buf, starts, ends, stats)
+
+
+def read_nmea_channels(file_loc: str) -> (list[SegmentChannels], NmeaReadStats):
+    assembler = NmeaAssembler()
+    stats = NmeaReadStats()
+
+    with open(file_loc, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return [], stats
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            pos = 0
+            while pos < size:
+                end = data.rfind(b'\n', pos, min(pos + NMEA_CHUNK_BYTES, size)) + 1
+                if end <= pos or pos + NMEA_CHUNK_BYTES >= size:
+                    end = size
+
+                chunk = data[pos:end]
+                if not chunk.endswith(b'\n'):
+                    chunk = chunk + b'\n'
+
+                decode_chunk(chunk, pos, assembler, stats)
+                pos = end
+
+    segments = assembler.finish()
+    stats.num_fixes = assembler.num_fixes
+
+    return segments, stats
+
+
+def read_nmea_segments(file_loc: str):
+    # gpxpy segments whose points carry the instrument values as comments, so get_segment_stats, images and the
+    # log entry code treat them like segments read from a Yacht Devices gpx export
+    from track_stats import channels_to_segment
+
+    segments, _ = read_nmea_channels(file_loc)
+
+    return [channels_to_segment(ch) for ch in segments]
+
+
+def nmea_to_gpx(file_loc: str, out_loc: str) -> int:
+    # writes the NMEA log as a gpx file, so it can be imported like any other export
+    from gpxpy.gpx import GPX, GPXTrack
+
+    gpx = GPX()
+    track = GPXTrack()
+    gpx.tracks.append(track)
+    track.segments.extend(read_nmea_segments(file_loc))
+
+    with open(out_loc, 'w') as f:
+        f.write(gpx.to_xml())
+
+    return len(track.segments)
+
+
+def main():
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Read a raw NMEA 0183 log, print its segment stats, and optionally '
+                                                 'convert it to gpx.')
+    parser.add_argument('file', help='path to the NMEA log')
+    parser.add_argument('--gpx', action='store_true', help='write <name>.gpx to the output directory')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    segments, stats = read_nmea_channels(args.file)
+    elapsed = time.perf_counter() - start
+
+    print('Read {} in {:.2f}s ({:.1f} MB/s)'.format(stats.summary_str(), elapsed, stats.num_bytes / 1e6 / elapsed))
+
+    from track_stats import channels_to_segment, print_segment_stats
+    for ch in segments:
+        print_segment_stats(channels_to_segment(ch), 0.0)
+
+    if args.gpx:
+        out_loc = rt_args.OUTPUT_DIR + os.path.splitext(os.path.basename(args.file))[0] + '.gpx'
+        nmea_to_gpx(args.file, out_loc)
+        print('\t\tCreated ' + out_loc)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from functools import partial
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+
+import common as rt_args
+from track_stats import SegmentChannels, CHANNEL_NAMES, COMPACT_CHANNEL_DTYPE
+
+# Every logged segment's points in one file, as fixed width columns.  A header holds the column offsets and a table of
+# (start timestamp, first point, point count) per segment, sorted by start timestamp.  Opening the store maps the file,
+# so a segment's channels are numpy views into the page cache: worker processes that each open it share one copy of
+# the data and receive nothing but segment numbers.
+POINT_STORE_LOC = rt_args.OUTPUT_DIR + 'points.store'
+POINT_STORE_MAGIC = b'BLPSTORE'
+POINT_STORE_VERSION = 1
+
+# column blocks and the segment table start on this boundary, so every view is aligned for its dtype
+POINT_STORE_ALIGN = 64
+
+POINT_STORE_COLUMNS = [('time', '<f8'), ('latitude', '<f8'), ('longitude', '<f8')] + \
+                      [(c, np.dtype(COMPACT_CHANNEL_DTYPE).newbyteorder('<').str) for c in CHANNEL_NAMES]
+
+SEGMENT_DTYPE = np.dtype([('start_timestamp', '<i8'), ('offset', '<i8'), ('count', '<i8'), ('file_id', '<i4'),
+                          ('speed_units', 'S8')])
+
+
+def aligned(n: int) -> int:
+    return -(-n // POINT_STORE_ALIGN) * POINT_STORE_ALIGN
+
+
+class PointStoreWriter:
+    # appends segments a column at a time to temporary files, then lays them out in the store, so building it never
+    # holds more than one segment in memory
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_dir = tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path)))
+        self.column_files = {c: open(os.path.join(self.tmp_dir.name, c), 'wb') for c, _ in POINT_STORE_COLUMNS}
+        self.segments = []
+        self.file_ids: dict[str, int] = {}
+        self.num_points = 0
+
+    def add(self, file_name: str, start_timestamp: int, ch: SegmentChannels):
+        for c, dtype in POINT_STORE_COLUMNS:
+            getattr(ch, c).astype(dtype, copy=False).tofile(self.column_files[c])
+
+        file_id = self.file_ids.setdefault(file_name, len(self.file_ids))
+        self.segments.append((start_timestamp, self.num_points, len(ch), file_id, ch.speed_units.encode()))
+        self.num_points += len(ch)
+
+    def finish(self) -> int:
+        for f in self.column_files.values():
+            f.close()
+
+        table = np.array(self.segments, dtype=SEGMENT_DTYPE)
+        table = table[np.argsort(table['start_timestamp'], kind='stable')]
+
+        files = sorted(self.file_ids, key=self.file_ids.get)
+
+        def lay_out(first_offset: int) -> (dict, int):
+            header = {'version': POINT_STORE_VERSION, 'num_segments': len(table), 'num_points': self.num_points,
+                      'files': files, 'segment_table_offset': first_offset, 'columns': []}
+            pos = aligned(first_offset + table.nbytes)
+            for c, dtype in POINT_STORE_COLUMNS:
+                header['columns'].append({'name': c, 'dtype': dtype, 'offset': pos})
+                pos = aligned(pos + self.num_points * np.dtype(dtype).itemsize)
+
+            return header, pos
+
+        # the header's size depends on the offsets it holds, so room is made for the widest they could be
+        widest, _ = lay_out(10 ** 15)
+        header, pos = lay_out(aligned(len(POINT_STORE_MAGIC) + 8 + len(json.dumps(widest).encode())))
+
+        header_bytes = json.dumps(header).encode()
+
+        partial_path = self.path + '.partial'
+        with open(partial_path, 'wb') as out:
+            out.write(POINT_STORE_MAGIC)
+            out.write(np.uint64(len(header_bytes)).tobytes())
+            out.write(header_bytes)
+
+            out.seek(header['segment_table_offset'])
+            out.write(table.tobytes())
+
+            for col in header['columns']:
+                out.seek(col['offset'])
+                with open(os.path.join(self.tmp_dir.name, col['name']), 'rb') as f:
+                    shutil.copyfileobj(f, out, 16 * 1024 * 1024)
+
+            out.truncate(pos)
+
+        os.replace(partial_path, self.path)
+        self.tmp_dir.cleanup()
+
+        return len(table)
+
+
+class PointStore:
+    def __init__(self, path: str = POINT_STORE_LOC):
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self.data[:len(POINT_STORE_MAGIC)]) != POINT_STORE_MAGIC:
+            raise ValueError(path + ' is not a point store')
+
+        header_len = int(self.data[len(POINT_STORE_MAGIC):len(POINT_STORE_MAGIC) + 8].view('<u8')[0])
+        header_start = len(POINT_STORE_MAGIC) + 8
+        header = json.loads(bytes(self.data[header_start:header_start + header_len]))
+        if header['version'] != POINT_STORE_VERSION:
+            raise ValueError(path + ' was built by a different version, rebuild it')
+
+        self.file_names: list[str] = header['files']
+        self.num_points: int = header['num_points']
+
+        table_start = header['segment_table_offset']
+        self.segments = self.data[table_start:table_start + header['num_segments'] * SEGMENT_DTYPE.itemsize] \
+            .view(SEGMENT_DTYPE)
+
+        self.columns = {}
+        for col in header['columns']:
+            dtype = np.dtype(col['dtype'])
+            self.columns[col['name']] = self.data[col['offset']:col['offset'] + self.num_points * dtype.itemsize] \
+                .view(dtype)
+
+    def __len__(self):
+        return len(self.segments)
+
+    def channels(self, i: int) -> SegmentChannels:
+        # views into the mapped file, so nothing is copied or decoded until the values are used
+        seg = self.segments[i]
+        s = slice(int(seg['offset']), int(seg['offset'] + seg['count']))
+
+        return SegmentChannels(speed_units=seg['speed_units'].decode(),
+                               **{c: v[s] for c, v in self.columns.items()})
+
+    def find(self, start_timestamp: int) -> Optional[int]:
+        i = int(np.searchsorted(self.segments['start_timestamp'], start_timestamp))
+        if i < len(self.segments) and self.segments['start_timestamp'][i] == start_timestamp:
+            return i
+
+        return None
+
+    def file_name(self, i: int) -> str:
+        return self.file_names[int(self.segments[i]['file_id'])]
+
+    def start_timestamp(self, i: int) -> int:
+        return int(self.segments[i]['start_timestamp'])
+
+
+def file_channels(fn: str, start_timestamps: Optional[list[int]] = None) -> list[tuple[int, SegmentChannels]]:
+    # runs in a worker process while building.  Every segment of the file with at least two points, or only the
+    # logged ones when start_timestamps is given.
+    from track_stats import segment_channels
+
+    if start_timestamps is not None:
+        from segment_index import load_logged_segment
+
+        con = sqlite3.connect(rt_args.DATABASE_LOC)
+        try:
+            segs = [load_logged_segment(fn, ts, con) for ts in start_timestamps]
+        finally:
+            con.close()
+    else:
+        import gpxpy
+
+        with rt_args.open_gpx(fn) as f:
+            gpx = gpxpy.parse(f)
+
+        segs = [s for t in gpx.tracks for s in t.segments if len(s.points) > 1]
+        for s in segs:
+            if s.points[0].time > s.points[1].time:
+                s.points.reverse()
+
+    return [(int(s.get_time_bounds().start_time.timestamp()), segment_channels(s, compact=True))
+            for s in segs if s is not None]
+
+
+def build_point_store(path: str = POINT_STORE_LOC, from_db: bool = True, workers: int = 1) -> int:
+    # from the logged segments in the database, or every segment in GPX_FILES_DIR.  Returns the number of segments.
+    if from_db:
+        from database import select_track_refs
+
+        con = sqlite3.connect(rt_args.DATABASE_LOC)
+        try:
+            timestamps_by_file: dict[str, list[int]] = {}
+            for fn, start_timestamp in select_track_refs(con):
+                timestamps_by_file.setdefault(fn, []).append(start_timestamp)
+        finally:
+            con.close()
+
+        jobs = list(timestamps_by_file.items())
+    else:
+        jobs = [(fn, None) for fn in rt_args.get_data_files()]
+
+    writer = PointStoreWriter(path)
+
+    def add_file(fn: str, segs: list[tuple[int, SegmentChannels]]):
+        for start_timestamp, ch in segs:
+            writer.add(fn, start_timestamp, ch)
+
+    if workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for (fn, _), segs in zip(jobs, executor.map(file_channels, *zip(*jobs))):
+                add_file(fn, segs)
+    else:
+        for fn, start_timestamps in jobs:
+            add_file(fn, file_channels(fn, start_timestamps))
+
+    return writer.finish()
+
+
+# each pool worker maps the store once, when it starts
+_worker_store: Optional[PointStore] = None
+
+
+def _open_worker_store(path: str):
+    global _worker_store
+    _worker_store = PointStore(path)
+
+
+def _apply_to_segment(fn: Callable, i: int):
+    return fn(_worker_store.channels(i))
+
+
+def map_segments(fn: Callable[[SegmentChannels], object], path: str = POINT_STORE_LOC, workers: Optional[int] = None,
+                 indexes: Optional[list[int]] = None) -> Iterator:
+    # fn(channels) for each segment, in segment order, spread over a process pool.  Only segment numbers and fn's
+    # results cross between processes.  fn must be a module level function so it can be sent to the workers.
+    from concurrent.futures import ProcessPoolExecutor
+
+    if indexes is None:
+        indexes = range(len(PointStore(path)))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_open_worker_store, initargs=(path,)) as executor:
+        yield from executor.map(partial(_apply_to_segment, fn), indexes, chunksize=8)
+
+
+def segment_best_efforts(ch: SegmentChannels) -> list:
+    from window_stats import get_best_efforts
+
+    return get_best_efforts(ch)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build or use the memory mapped store of every segment\'s points.')
+    parser.add_argument('command', choices=['build', 'info', 'best-efforts'])
+    parser.add_argument('--files', action='store_true', help='build from every gpx file rather than logged trips')
+    parser.add_argument('--workers', type=int, default=1, help='processes used to build or analyze (default 1)')
+    parser.add_argument('-o', '--output', default=POINT_STORE_LOC, help='store location (default %(default)s)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+
+    if args.command == 'build':
+        num_segments = build_point_store(args.output, not args.files, args.workers)
+        print('\t\tStored {} segments in {} ({:.1f} MB) in {:.2f}s'.format(
+            num_segments, args.output, os.path.getsize(args.output) / 1e6, time.perf_counter() - start))
+
+    elif args.command == 'info':
+        store = PointStore(args.output)
+        print('{} segments, {} points, {} files'.format(len(store), store.num_points, len(store.file_names)))
+        for i in range(len(store)):
+            print('\t{}: {}, {} points'.format(store.start_timestamp(i), store.file_name(i),
+                                               int(store.segments[i]['count'])))
+
+    else:
+        store = PointStore(args.output)
+        efforts = list(map_segments(segment_best_efforts, args.output, args.workers))
+        elapsed = time.perf_counter() - start
+
+        for i, segment_efforts in enumerate(efforts):
+            print('{}:'.format(store.start_timestamp(i)))
+            for e in segment_efforts:
+                print(e.summary_str())
+
+        print('\t\t{} segments, {} points in {:.2f}s ({:.0f} points/s)'.format(
+            len(store), store.num_points, elapsed, store.num_points / elapsed if elapsed else 0.0))
+
+
+if __name__ == '__main__':
+    main()
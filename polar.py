@@ -0,0 +1,240 @@
+import math
+import os
+import sqlite3
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import common as rt_args
+from database import select_track_refs, Year
+from track_stats import SegmentChannels, segment_channels, iter_logged_segments
+
+TWA_BIN_DEG = 10.0
+TWS_BIN_KTS = 2.0
+MAX_TWS_KTS = 40.0
+STW_BIN_KTS = 0.1
+MAX_STW_KTS = 20.0
+
+# points below this STW are drifting or at anchor, same threshold used by remove_stationary_pts
+MIN_STW_KTS = 0.8
+MIN_CELL_POINTS = 10
+POLAR_PERCENTILE = 0.95
+
+POLAR_FILE = rt_args.OUTPUT_DIR + 'polar.npz'
+POLAR_TABLE_FILE = rt_args.OUTPUT_DIR + 'polar.csv'
+POLAR_IMAGE_FILE = rt_args.OUTPUT_DIR + 'polar.png'
+
+POLAR_COLORS = ['#1F77B4', '#FF7F0E', '#2CA02C', '#D62728', '#9467BD', '#8C564B', '#E377C2', '#7F7F7F', '#BCBD22',
+                '#17BECF']
+
+
+def apparent_to_true(ch: SegmentChannels) -> (np.ndarray, np.ndarray):
+    # solve the wind triangle for points with apparent wind but no logged true wind
+    awa_rads = np.radians(ch.awa)
+    tw_x = ch.aws * np.cos(awa_rads) - ch.stw
+    tw_y = ch.aws * np.sin(awa_rads)
+
+    return np.abs(np.degrees(np.arctan2(tw_y, tw_x))), np.hypot(tw_x, tw_y)
+
+
+def true_wind_angles(ch: SegmentChannels) -> np.ndarray:
+    # angle off the true wind, 0 - 180°.  COG is the only heading that is logged, so it stands in for heading.
+    twa = np.abs((ch.twd - ch.cog + 180.0) % 360.0 - 180.0)
+    apparent_twa, _ = apparent_to_true(ch)
+
+    return np.where(np.isnan(twa), apparent_twa, twa)
+
+
+def true_wind_speeds(ch: SegmentChannels) -> np.ndarray:
+    _, apparent_tws = apparent_to_true(ch)
+
+    return np.where(np.isnan(ch.tws), apparent_tws, ch.tws)
+
+
+class PolarAccumulator:
+    # STW histogram per (TWA, TWS) cell.  Histograms add, so accumulators built from different trips can be merged
+    # and percentiles taken afterwards without revisiting the points.
+    def __init__(self):
+        self.n_twa = int(math.ceil(180.0 / TWA_BIN_DEG))
+        self.n_tws = int(math.ceil(MAX_TWS_KTS / TWS_BIN_KTS))
+        self.n_stw = int(math.ceil(MAX_STW_KTS / STW_BIN_KTS))
+        self.counts = np.zeros((self.n_twa, self.n_tws, self.n_stw), dtype=np.int64)
+        self.start_timestamps: set[int] = set()
+
+    def add_channels(self, ch: SegmentChannels, start_timestamp: Optional[int] = None):
+        twa = true_wind_angles(ch)
+        tws = true_wind_speeds(ch)
+        stw = ch.stw
+
+        valid = ~(np.isnan(twa) | np.isnan(tws) | np.isnan(stw)) & (stw >= MIN_STW_KTS)
+
+        i = np.minimum((twa[valid] / TWA_BIN_DEG).astype(np.int64), self.n_twa - 1)
+        j = np.minimum((tws[valid] / TWS_BIN_KTS).astype(np.int64), self.n_tws - 1)
+        k = np.minimum((stw[valid] / STW_BIN_KTS).astype(np.int64), self.n_stw - 1)
+
+        flat = np.ravel_multi_index((i, j, k), self.counts.shape)
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+
+        if start_timestamp is not None:
+            self.start_timestamps.add(start_timestamp)
+
+    def merge(self, other: 'PolarAccumulator'):
+        if self.counts.shape != other.counts.shape:
+            raise ValueError('cannot merge polar accumulators with different bin sizes')
+
+        self.counts += other.counts
+        self.start_timestamps |= other.start_timestamps
+
+    def cell_counts(self) -> np.ndarray:
+        return self.counts.sum(axis=2)
+
+    def percentile(self, q: float = POLAR_PERCENTILE) -> np.ndarray:
+        # STW at the q quantile of each cell, NaN where the cell has too few points to be meaningful
+        cdf = np.cumsum(self.counts, axis=2)
+        totals = cdf[..., -1]
+
+        idx = np.argmax(cdf >= (q * totals)[..., np.newaxis], axis=2)
+        values = (idx + 0.5) * STW_BIN_KTS
+
+        return np.where(totals >= MIN_CELL_POINTS, values, np.nan)
+
+    def mean(self) -> np.ndarray:
+        centers = (np.arange(self.n_stw) + 0.5) * STW_BIN_KTS
+        totals = self.cell_counts()
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = (self.counts * centers).sum(axis=2) / totals
+
+        return np.where(totals >= MIN_CELL_POINTS, means, np.nan)
+
+    def twa_labels(self) -> list[float]:
+        return [(i + 0.5) * TWA_BIN_DEG for i in range(self.n_twa)]
+
+    def tws_labels(self) -> list[float]:
+        return [(j + 0.5) * TWS_BIN_KTS for j in range(self.n_tws)]
+
+    def table_str(self, q: float = POLAR_PERCENTILE) -> str:
+        values = self.percentile(q)
+        used_tws = [j for j in range(self.n_tws) if not np.all(np.isnan(values[:, j]))]
+
+        lines = ['TWA\\TWS,' + ','.join('{:.0f}'.format(self.tws_labels()[j]) for j in used_tws)]
+        for i, twa in enumerate(self.twa_labels()):
+            cells = ['' if np.isnan(values[i, j]) else '{:.1f}'.format(values[i, j]) for j in used_tws]
+            lines.append('{:.0f},'.format(twa) + ','.join(cells))
+
+        return '\n'.join(lines)
+
+    def save(self, fn: str):
+        np.savez_compressed(fn, counts=self.counts,
+                            start_timestamps=np.array(sorted(self.start_timestamps), dtype=np.int64))
+
+    @staticmethod
+    def load(fn: str) -> 'PolarAccumulator':
+        polar = PolarAccumulator()
+        with np.load(fn) as data:
+            if data['counts'].shape != polar.counts.shape:
+                raise ValueError('polar file ' + fn + ' was built with different bin sizes')
+
+            polar.counts = data['counts']
+            polar.start_timestamps = set(int(ts) for ts in data['start_timestamps'])
+
+        return polar
+
+
+def polar_image(polar: PolarAccumulator, q: float = POLAR_PERCENTILE, size: int = 800) -> Image:
+    values = polar.percentile(q)
+    max_stw = np.nanmax(values) if not np.all(np.isnan(values)) else 1.0
+    ring_step = 2.0
+    max_ring = math.ceil(max_stw / ring_step) * ring_step
+
+    margin = 40
+    radius = size // 2 - margin
+    origin = (margin, size // 2)
+
+    img = Image.new('RGB', (size, size), 'white')
+    draw = ImageDraw.Draw(img)
+
+    def to_px(twa: float, stw: float) -> (float, float):
+        r = stw / max_ring * radius
+        a = math.radians(twa)
+        return origin[0] + r * math.sin(a), origin[1] - r * math.cos(a)
+
+    # speed rings and TWA spokes, wind from the top of the image
+    for ring in np.arange(ring_step, max_ring + ring_step / 2, ring_step):
+        r = ring / max_ring * radius
+        draw.arc((origin[0] - r, origin[1] - r, origin[0] + r, origin[1] + r), 270, 90, fill='#CCCCCC')
+        draw.text((origin[0] + 2, origin[1] - r - 12), '{:.0f} kts'.format(ring), fill='#888888')
+
+    for twa in range(0, 181, 30):
+        draw.line((origin, to_px(twa, max_ring)), fill='#CCCCCC')
+        draw.text(to_px(twa, max_ring * 1.04), '{}°'.format(twa), fill='#888888')
+
+    legend_y = 10
+    color_index = 0
+    for j, tws in enumerate(polar.tws_labels()):
+        pts = [to_px(twa, values[i, j]) for i, twa in enumerate(polar.twa_labels()) if not np.isnan(values[i, j])]
+        if len(pts) < 2:
+            continue
+
+        color = POLAR_COLORS[color_index % len(POLAR_COLORS)]
+        color_index += 1
+
+        draw.line(pts, fill=color, width=3)
+        draw.text((size - 120, legend_y), 'TWS {:.0f} kts'.format(tws), fill=color)
+        legend_y += 14
+
+    return img
+
+
+def build_polar(year: Optional[Year] = None, rebuild: bool = False) -> PolarAccumulator:
+    if not rebuild and year is None and os.path.exists(POLAR_FILE):
+        polar = PolarAccumulator.load(POLAR_FILE)
+    else:
+        polar = PolarAccumulator()
+
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    try:
+        track_refs = select_track_refs(con, year)
+    finally:
+        con.close()
+
+    # only trips not already in the saved accumulator need to be read
+    new_refs = [r for r in track_refs if r[1] not in polar.start_timestamps]
+    for seg in iter_logged_segments(new_refs):
+        ch = segment_channels(seg)
+        polar.add_channels(ch, int(np.nanmin(ch.time)))
+
+    print('\t\tAdded {} trips to polar, {} trips total'.format(len(new_refs), len(polar.start_timestamps)))
+
+    if year is None:
+        polar.save(POLAR_FILE)
+
+    return polar
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build a polar performance table from logged trips.')
+    parser.add_argument('--year', type=int, help='only include trips logged in this year')
+    parser.add_argument('--rebuild', action='store_true', help='ignore the saved polar and rescan every trip')
+    parser.add_argument('--percentile', type=float, default=POLAR_PERCENTILE * 100,
+                        help='STW percentile reported for each cell (default 95)')
+    args = parser.parse_args()
+
+    q = min(max(args.percentile, 0.0), 100.0) / 100.0
+    polar = build_polar(args.year, args.rebuild)
+
+    table = polar.table_str(q)
+    print(table)
+
+    with open(POLAR_TABLE_FILE, 'w') as f:
+        f.write(table + '\n')
+
+    polar_image(polar, q).save(POLAR_IMAGE_FILE)
+    print('\t\tCreated ' + POLAR_TABLE_FILE + ' and ' + POLAR_IMAGE_FILE)
+
+
+if __name__ == '__main__':
+    main()
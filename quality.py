@@ -0,0 +1,247 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+import gpxpy
+from gpxpy.gpx import GPX, GPXTrackSegment
+
+import common as rt_args
+from timing import timed, count
+from track_stats import SegmentChannels, PointExtension, CHANNEL_NAMES, segment_channels, get_segment_stats
+from window_stats import EARTH_RADIUS_NM
+
+# Points whose time or position is wrong are dropped.  An instrument value that is out of range, or a sensor stuck on
+# one value while the boat moves, only blanks that channel at those points, so a fouled paddle wheel doesn't take the
+# GPS track with it.
+MAX_IMPLIED_SPEED_KTS = 40.0
+
+# a point that is a detour from the line between its neighbours needing more than this to get to and back from
+MAX_ACCELERATION_KTS_PER_S = 10.0
+
+# inclusive (low, high) in knots for speeds and metres for depth.  Sounders that lose the bottom often log 0.
+CHANNEL_RANGES = {'stw': (0.0, 30.0), 'tws': (0.0, 100.0), 'depth': (0.1, 1000.0)}
+
+# a channel logging exactly the same value for this long while the boat averages this speed is stuck
+STUCK_SENSOR_SECONDS = 900.0
+STUCK_SENSOR_MIN_SPEED_KTS = 1.0
+STUCK_SENSOR_CHANNELS = ['stw', 'tws', 'depth']
+
+KNOTS_PER_SPEED_UNIT = {'kts': 1.0, 'm/s': 1.94384, 'km/h': 0.539957}
+
+# PointExtension keys holding each channel's value
+CHANNEL_COMMENT_KEYS = {'stw': 'STW', 'tws': 'TWS', 'depth': 'Depth'}
+
+
+@dataclass()
+class QualityReport:
+    num_pts: int = 0
+    dropped: dict = field(default_factory=dict)
+    blanked: dict = field(default_factory=dict)
+
+    @property
+    def num_dropped(self) -> int:
+        return sum(self.dropped.values())
+
+    def summary_str(self) -> str:
+        lines = ['\tData quality: {} of {} points dropped'.format(self.num_dropped, self.num_pts)]
+        lines.extend('\t\t{}: {} points dropped'.format(reason, n) for reason, n in self.dropped.items() if n)
+        lines.extend('\t\t{}: {} values blanked'.format(reason, n) for reason, n in self.blanked.items() if n)
+
+        return '\n'.join(lines)
+
+
+def distances_nm(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+
+    return 2.0 * EARTH_RADIUS_NM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def time_flags(ch: SegmentChannels) -> dict[str, np.ndarray]:
+    # points without a time or position, and points that don't come after every point before them
+    missing = np.isnan(ch.time) | np.isnan(ch.latitude) | np.isnan(ch.longitude)
+
+    t = np.where(missing, -np.inf, ch.time)
+    latest_before = np.concatenate(([-np.inf], np.maximum.accumulate(t)[:-1]))
+    duplicate = ~missing & (t <= latest_before)
+
+    return {'no time or position': missing, 'duplicate time': duplicate}
+
+
+def motion_flags(t: np.ndarray, lat: np.ndarray, lon: np.ndarray) -> dict[str, np.ndarray]:
+    # GPS spikes, for points in time order.  A spike is reached and left faster than the boat can go, or is so far
+    # off the line between its neighbours that getting there and back takes an impossible acceleration.  A run of
+    # several displaced points is only caught at its ends.
+    n = len(t)
+    if n < 2:
+        return {'implied speed': np.zeros(n, dtype=bool), 'acceleration': np.zeros(n, dtype=bool)}
+
+    leg_hours = np.diff(t) / 3600.0
+    leg_kts = distances_nm(lat[:-1], lon[:-1], lat[1:], lon[1:]) / leg_hours
+
+    # speed into and out of each point, with the end points only having one
+    v_in = np.concatenate(([np.nan], leg_kts))
+    v_out = np.concatenate((leg_kts, [np.nan]))
+
+    too_fast = np.zeros(n, dtype=bool)
+    too_fast[1:-1] = (v_in[1:-1] > MAX_IMPLIED_SPEED_KTS) & (v_out[1:-1] > MAX_IMPLIED_SPEED_KTS)
+    too_fast[0] = v_out[0] > MAX_IMPLIED_SPEED_KTS
+    too_fast[-1] = v_in[-1] > MAX_IMPLIED_SPEED_KTS
+
+    too_sudden = np.zeros(n, dtype=bool)
+    if n > 2:
+        skip_kts = distances_nm(lat[:-2], lon[:-2], lat[2:], lon[2:]) / ((t[2:] - t[:-2]) / 3600.0)
+        detour_kts = np.minimum(v_in[1:-1], v_out[1:-1]) - skip_kts
+        too_sudden[1:-1] = detour_kts > MAX_ACCELERATION_KTS_PER_S * (t[2:] - t[:-2]) / 2.0
+
+    return {'implied speed': too_fast, 'acceleration': too_sudden & ~too_fast}
+
+
+def range_flags(ch: SegmentChannels) -> dict[str, np.ndarray]:
+    to_kts = KNOTS_PER_SPEED_UNIT.get(ch.speed_units, 1.0)
+
+    flags = {}
+    for c, (low, high) in CHANNEL_RANGES.items():
+        v = getattr(ch, c).astype(np.float64) * (1.0 if c == 'depth' else to_kts)
+        flags[c] = ~np.isnan(v) & ((v < low) | (v > high))
+
+    return flags
+
+
+def stuck_flags(ch: SegmentChannels) -> dict[str, np.ndarray]:
+    # runs of one unchanging value, for points in time order.  NaN never equals itself, so gaps end a run.
+    n = len(ch)
+    flags = {c: np.zeros(n, dtype=bool) for c in STUCK_SENSOR_CHANNELS}
+    if n < 2:
+        return flags
+
+    distance = np.concatenate(([0.0], np.cumsum(distances_nm(ch.latitude[:-1], ch.longitude[:-1],
+                                                             ch.latitude[1:], ch.longitude[1:]))))
+
+    for c in STUCK_SENSOR_CHANNELS:
+        v = getattr(ch, c)
+        run_starts = np.flatnonzero(np.concatenate(([True], v[1:] != v[:-1])))
+        run_ends = np.concatenate((run_starts[1:], [n])) - 1
+
+        seconds = ch.time[run_ends] - ch.time[run_starts]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            kts = (distance[run_ends] - distance[run_starts]) / (seconds / 3600.0)
+
+        stuck = ~np.isnan(v[run_starts]) & (seconds >= STUCK_SENSOR_SECONDS) & (kts >= STUCK_SENSOR_MIN_SPEED_KTS)
+
+        run_ids = np.repeat(np.arange(len(run_starts)), run_ends - run_starts + 1)
+        flags[c] = stuck[run_ids]
+
+    return flags
+
+
+def quality_masks(ch: SegmentChannels) -> (np.ndarray, dict[str, np.ndarray], QualityReport):
+    # points to keep, and per channel the values to blank among all points, with the count for each reason.  A point
+    # is only counted under the first reason that drops it.
+    n = len(ch)
+    report = QualityReport(n)
+    keep = np.ones(n, dtype=bool)
+
+    def drop(flags: dict[str, np.ndarray], idx: np.ndarray):
+        for reason, flagged in flags.items():
+            dropped = idx[flagged & keep[idx]]
+            report.dropped[reason] = len(dropped)
+            keep[dropped] = False
+
+    drop(time_flags(ch), np.arange(n))
+
+    kept = np.flatnonzero(keep)
+    drop(motion_flags(ch.time[kept], ch.latitude[kept], ch.longitude[kept]), kept)
+
+    kept = np.flatnonzero(keep)
+    kept_ch = select_points(ch, kept)
+
+    blank = {c: np.zeros(n, dtype=bool) for c in CHANNEL_RANGES}
+    for reasons in ({'{} out of range'.format(c): (c, f) for c, f in range_flags(kept_ch).items()},
+                    {'stuck {}'.format(c): (c, f) for c, f in stuck_flags(kept_ch).items()}):
+        for reason, (c, flagged) in reasons.items():
+            blanked = kept[flagged & ~blank[c][kept]]
+            report.blanked[reason] = len(blanked)
+            blank[c][blanked] = True
+
+    return keep, blank, report
+
+
+def select_points(ch: SegmentChannels, idx: np.ndarray) -> SegmentChannels:
+    return SegmentChannels(ch.time[idx], ch.latitude[idx], ch.longitude[idx], speed_units=ch.speed_units,
+                           **{c: getattr(ch, c)[idx] for c in CHANNEL_NAMES})
+
+
+@timed('clean_channels')
+def clean_channels(ch: SegmentChannels) -> (SegmentChannels, QualityReport):
+    keep, blank, report = quality_masks(ch)
+
+    values = {c: getattr(ch, c) for c in CHANNEL_NAMES}
+    for c, blanked in blank.items():
+        if blanked.any():
+            values[c] = np.where(blanked, np.nan, values[c]).astype(values[c].dtype)
+
+    count('points dropped', report.num_dropped)
+
+    return SegmentChannels(ch.time[keep], ch.latitude[keep], ch.longitude[keep], speed_units=ch.speed_units,
+                           **{c: v[keep] for c, v in values.items()}), report
+
+
+@timed('clean_segment')
+def clean_segment(seg: GPXTrackSegment, p_extensions: Optional[list[PointExtension]] = None) \
+        -> (GPXTrackSegment, list[PointExtension], QualityReport):
+    # the segment without its dropped points, and PointExtensions for the kept points with blanked values removed, so
+    # get_segment_stats reads them as missing
+    if p_extensions is None:
+        p_extensions = [PointExtension(p) for p in seg.points]
+
+    keep, blank, report = quality_masks(segment_channels(seg, p_extensions))
+
+    for c, blanked in blank.items():
+        for i in np.flatnonzero(blanked & keep).tolist():
+            p_extensions[i].extracted_values.pop(CHANNEL_COMMENT_KEYS[c], None)
+
+    kept = np.flatnonzero(keep).tolist()
+
+    count('points dropped', report.num_dropped)
+
+    return GPXTrackSegment([seg.points[i] for i in kept]), [p_extensions[i] for i in kept], report
+
+
+def print_quality_summary(seg: GPXTrackSegment, speed_pct_ignore: float):
+    percentile_stats = get_segment_stats(seg, speed_pct_ignore)
+    clean_stats = get_segment_stats(seg, clean=True)
+    _, _, report = clean_segment(seg)
+
+    print('\n' + clean_stats.summary_str())
+    print(report.summary_str())
+    print('\tIgnoring top {:.0f}% of speeds:'.format(speed_pct_ignore * 100.0))
+    print(percentile_stats.speeds_str())
+    print('\tCleaned:')
+    print(clean_stats.speeds_str())
+
+
+def main():
+    from track_stats import get_speed_pct_to_ignore
+
+    fn = rt_args.select_data_file()
+    with rt_args.open_gpx(fn) as f:
+        gpx: GPX = gpxpy.parse(f)
+
+    speed_pct_ignore = get_speed_pct_to_ignore()
+
+    for t in gpx.tracks:
+        for seg in t.segments:
+            if len(seg.points) < 2:
+                continue
+
+            if seg.points[0].time > seg.points[1].time:
+                seg.points.reverse()
+
+            print_quality_summary(seg, speed_pct_ignore)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+
+import common as rt_args
+from benchmark import time_call, latest_results_file, save_results, BENCHMARK_DIR, REGRESSION_THRESHOLD
+
+# The GUI's queries and views timed against a database far bigger than any real log, so a query that reads every row,
+# or a join that lost its index, shows up long before the real log is big enough to notice.  Each query's plan is
+# captured with EXPLAIN QUERY PLAN and compared with the previous run's, as are its timings.
+QUERY_BENCHMARK_DIR = BENCHMARK_DIR + os.sep + 'queries'
+QUERY_FIXTURE_LOC = QUERY_BENCHMARK_DIR + os.sep + 'large_boat_log.db'
+
+DEFAULT_LOG_ENTRIES = 100000
+DEFAULT_MAINTENANCE_RECORDS = 50000
+
+# several trips a day, so dates repeat as they do on a busy cruise and joins on date have more than one match
+TRIP_SPACING_SECONDS = 4 * 3600
+FIRST_TRIP_TIMESTAMP = 1300000000
+
+# notes are drawn from these words and a long tail of filler words, so each searched word is in about 1% of notes as
+# it might be in a real log
+NOTE_WORDS = ['wind', 'building', 'reefed', 'main', 'jib', 'tacked', 'anchored', 'calm', 'motored', 'engine',
+              'impeller', 'overheated', 'fog', 'current', 'ebb', 'flood', 'crab', 'pots', 'whales', 'rain', 'squall',
+              'fuel', 'filter', 'oil', 'leak', 'bilge', 'pump', 'autopilot', 'failed', 'fixed', 'harbor', 'dock'] + \
+             ['word{}'.format(i) for i in range(2000)]
+NOTE_LENGTH_WORDS = 20
+
+QUERY_REPEATS = 3
+
+# lookups take microseconds, where the noise between runs is bigger than the threshold, so a latency regression is
+# only reported for queries taking at least this long
+QUERY_MIN_COMPARED_SECONDS = 0.001
+
+# queries that fetch one trip.  Any full scan in these is reported, not just a new one.
+LOOKUP_QUERIES = ['select_log_summary', 'select_log_entry', 'select_log_entry_and_hours', 'select_log_entry_stats']
+
+
+def trip_date(start_timestamp: int) -> str:
+    return str(datetime.fromtimestamp(start_timestamp).date())
+
+
+def num_trip_days(num_entries: int) -> int:
+    # days from the first trip's date to the last's, inclusive
+    if num_entries == 0:
+        return 1
+
+    first_day = datetime.fromtimestamp(FIRST_TRIP_TIMESTAMP).date()
+    last_day = datetime.fromtimestamp(FIRST_TRIP_TIMESTAMP + (num_entries - 1) * TRIP_SPACING_SECONDS).date()
+
+    return (last_day - first_day).days + 1
+
+
+def num_engine_hours_readings(num_entries: int, hours_every_days: int) -> int:
+    return len(range(0, num_trip_days(num_entries), hours_every_days))
+
+
+def populate_large_database(db_loc: str, num_entries: int, num_maintenance: int, hours_every_days: int = 1,
+                            seed: int = 0):
+    # a fresh database at db_loc with num_entries trips, each with TRACK_STATS and a 10 minute best effort, engine
+    # hours every hours_every_days days across their dates, and num_maintenance records on random dates.  Rows are
+    # inserted in one transaction per table, as only the queries are being measured.
+    from database import create_database, upgrade_database
+
+    if os.path.exists(db_loc):
+        os.remove(db_loc)
+
+    saved_db_loc = rt_args.DATABASE_LOC
+    rt_args.DATABASE_LOC = db_loc
+    try:
+        create_database()
+        upgrade_database()
+    finally:
+        rt_args.DATABASE_LOC = saved_db_loc
+
+    rng = random.Random(seed)
+
+    def notes() -> str:
+        return ' '.join(rng.choices(NOTE_WORDS, k=NOTE_LENGTH_WORDS))
+    timestamps = [FIRST_TRIP_TIMESTAMP + i * TRIP_SPACING_SECONDS for i in range(num_entries)]
+
+    first_day = datetime.fromtimestamp(FIRST_TRIP_TIMESTAMP).date()
+    num_days = num_trip_days(num_entries)
+
+    con = sqlite3.connect(db_loc)
+    try:
+        with con:
+            con.executemany('INSERT INTO LOG_ENTRY VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            ((ts, 'Trip ' + str(i), trip_date(ts), rng.choice(['Solo', 'Crew', 'Family', 'Race crew']),
+                              'trip_{}.gpx'.format(i // 20), 'Harbor', 'Anchorage', notes())
+                             for i, ts in enumerate(timestamps)))
+
+            def stats_row(ts: int) -> tuple:
+                moving = rng.randint(1800, 6 * 3600)
+                sog_avg = rng.uniform(3.0, 7.0)
+                tws_avg = rng.uniform(2.0, 25.0)
+                return (ts, 0.0, moving, rng.randint(0, 3600), sog_avg * moving / 3600.0, rng.uniform(0.0, 0.5),
+                        sog_avg, sog_avg + rng.uniform(1.0, 3.0), sog_avg - 0.2, sog_avg + rng.uniform(1.0, 3.0),
+                        tws_avg, tws_avg + rng.uniform(2.0, 10.0), rng.uniform(0.0, 360.0), tws_avg)
+
+            con.executemany('INSERT INTO TRACK_STATS VALUES (' + ', '.join(['?'] * 14) + ')',
+                            (stats_row(ts) for ts in timestamps))
+
+            con.executemany('INSERT INTO TRACK_BEST_EFFORTS VALUES (?, ?, ?, ?, ?)',
+                            ((ts, 600, rng.uniform(4.0, 9.0), rng.uniform(4.0, 9.0), rng.uniform(5.0, 35.0))
+                             for ts in timestamps))
+
+            hours = 100.0
+            hours_rows = []
+            for day in range(0, num_days, hours_every_days):
+                hours += rng.uniform(0.0, 2.0) * hours_every_days
+                hours_rows.append((str(first_day + timedelta(days=day)), round(hours, 1)))
+            con.executemany('INSERT INTO ENGINE_HOURS VALUES (?, ?)', hours_rows)
+
+            con.executemany('INSERT INTO MAINTENANCE VALUES (?, ?, ?, ?, ?, ?)',
+                            ((None, str(first_day + timedelta(days=rng.randrange(num_days))), rng.randint(1, 9),
+                              rng.randint(1, 2), notes(), 'Summary') for _ in range(num_maintenance)))
+    finally:
+        con.close()
+
+
+def fixture_volumes(con: sqlite3.Connection) -> dict:
+    cur = con.cursor()
+    return {tbl: cur.execute('SELECT count(*) FROM ' + tbl).fetchone()[0]
+            for tbl in ['LOG_ENTRY', 'TRACK_STATS', 'ENGINE_HOURS', 'MAINTENANCE']}
+
+
+def benchmark_queries(con: sqlite3.Connection) -> dict[str, Callable]:
+    # name -> a call of the query as the GUI and reports make it, on a trip in the middle of the log
+    from database import get_entry_summaries, get_maintenance_views, select_log_summary, select_log_entry, \
+        select_log_entry_and_hours, select_log_entry_stats, select_track_refs, iter_top_trips, iter_export_rows, \
+        search_log_entries, search_maintenance, MAINTENANCE_EXPORT_QRY
+
+    cur = con.cursor()
+    middle, = cur.execute('SELECT start_timestamp FROM LOG_ENTRY ORDER BY start_timestamp '
+                          'LIMIT 1 OFFSET (SELECT count(*) / 2 FROM LOG_ENTRY)').fetchone()
+    year = trip_date(middle)[:4]
+
+    return {
+        'get_entry_summaries': lambda: get_entry_summaries(con),
+        'get_maintenance_views': lambda: get_maintenance_views(con, 'Change engine oil'),
+        'select_log_summary': lambda: select_log_summary(middle, con),
+        'select_log_entry': lambda: select_log_entry(middle, con),
+        'select_log_entry_and_hours': lambda: select_log_entry_and_hours(middle, con),
+        'select_log_entry_stats': lambda: select_log_entry_stats(middle, con),
+        'select_track_refs year': lambda: select_track_refs(con, year=year),
+        'iter_top_trips fastest': lambda: list(iter_top_trips(con, 'fastest')),
+        'iter_top_trips windiest year': lambda: list(iter_top_trips(con, 'windiest', year=year)),
+        'LOG_ENTRY_SUMMARY': lambda: cur.execute('select * from LOG_ENTRY_SUMMARY').fetchall(),
+        'LOG_ENTRY_HOURS_VIEW': lambda: cur.execute('select * from LOG_ENTRY_HOURS_VIEW').fetchall(),
+        'MAINTENANCE_EXPORT_QRY': lambda: cur.execute(MAINTENANCE_EXPORT_QRY).fetchall(),
+        'export trips year': lambda: list(iter_export_rows(con, 'trips', year + '-01-01', year + '-12-31')),
+        'search_log_entries': lambda: search_log_entries(con, 'impeller overheated'),
+        'search_maintenance': lambda: search_maintenance(con, 'bilge pump leak'),
+    }
+
+
+def query_plans(con: sqlite3.Connection, fn: Callable) -> list[list[str]]:
+    # the plan of every SELECT fn issues, found by tracing the statements it runs with their parameters bound
+    statements = []
+    con.set_trace_callback(statements.append)
+    try:
+        fn()
+    finally:
+        con.set_trace_callback(None)
+
+    cur = con.cursor()
+    return [[r[3] for r in cur.execute('EXPLAIN QUERY PLAN ' + s)]
+            for s in statements if s.lstrip().upper().startswith('SELECT')]
+
+
+def full_scans(plans: list[list[str]]) -> list[str]:
+    # tables (or their aliases) read in full.  Scans of a temporary b-tree, a subquery or a constant row aren't rows
+    # of a table, and a virtual table such as a full text index picks its own index, so is left out along with the
+    # schema qualified reads of its shadow tables.
+    scanned = []
+    for plan in plans:
+        for detail in plan:
+            words = detail.split()
+            if len(words) < 2 or words[0] != 'SCAN' or words[1] in ('CONSTANT', 'SUBQUERY') or \
+                    'VIRTUAL TABLE' in detail or words[1].startswith('main.'):
+                continue
+
+            # older sqlite versions write 'SCAN TABLE name'
+            scanned.append(words[2] if words[1] == 'TABLE' and len(words) > 2 else words[1])
+
+    return sorted(set(scanned))
+
+
+def run_query_benchmarks(db_loc: str, repeats: int = QUERY_REPEATS) -> dict:
+    con = sqlite3.connect(db_loc)
+    try:
+        results = {'volumes': fixture_volumes(con), 'queries': {}}
+
+        for name, fn in benchmark_queries(con).items():
+            plans = query_plans(con, fn)
+            timing = time_call(fn, repeats)
+            timing.update({'plans': plans, 'full_scans': full_scans(plans)})
+            results['queries'][name] = timing
+    finally:
+        con.close()
+
+    return results
+
+
+def compare_query_results(previous: dict, current: dict) -> list[str]:
+    regressions = []
+
+    for name, result in current['queries'].items():
+        if name in LOOKUP_QUERIES and result['full_scans']:
+            regressions.append('{} looks up one trip with a full scan of {}'.format(name,
+                                                                                  ', '.join(result['full_scans'])))
+
+        before = previous.get('queries', {}).get(name)
+        if not before:
+            continue
+
+        new_scans = [t for t in result['full_scans'] if t not in before['full_scans']]
+        if new_scans and name not in LOOKUP_QUERIES:
+            regressions.append('{} now scans {} in full'.format(name, ', '.join(new_scans)))
+
+        # timings are only comparable on the same volumes
+        if previous.get('volumes') == current['volumes'] and result['min'] >= QUERY_MIN_COMPARED_SECONDS and \
+                before['min'] > 0.0 and result['min'] > before['min'] * (1.0 + REGRESSION_THRESHOLD):
+            regressions.append('{}: {:.4f}s -> {:.4f}s (+{:.0f}%)'.format(
+                name, before['min'], result['min'], (result['min'] / before['min'] - 1.0) * 100.0))
+
+    return regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Time the database queries and views on a large synthetic log.')
+    parser.add_argument('--entries', type=int, default=DEFAULT_LOG_ENTRIES, help='log entries (default %(default)s)')
+    parser.add_argument('--maintenance', type=int, default=DEFAULT_MAINTENANCE_RECORDS,
+                        help='maintenance records (default %(default)s)')
+    parser.add_argument('--hours-every', type=int, default=1,
+                        help='days between engine hours readings (default %(default)s, a reading every day)')
+    parser.add_argument('--database', default=QUERY_FIXTURE_LOC,
+                        help='fixture location, reused while it has the requested volumes (default %(default)s)')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the fixture even if it could be reused')
+    parser.add_argument('--plans', action='store_true', help='print every query plan')
+    args = parser.parse_args()
+
+    if os.path.abspath(args.database) == os.path.abspath(rt_args.DATABASE_LOC):
+        parser.error('the fixture would replace the log database ' + rt_args.DATABASE_LOC)
+
+    # a fixture built with a different --hours-every has the same trips but not the same readings
+    expected = {'LOG_ENTRY': args.entries, 'TRACK_STATS': args.entries,
+                'ENGINE_HOURS': num_engine_hours_readings(args.entries, args.hours_every),
+                'MAINTENANCE': args.maintenance}
+    volumes = None
+    if os.path.exists(args.database) and not args.rebuild:
+        con = sqlite3.connect(args.database)
+        try:
+            volumes = fixture_volumes(con)
+        except sqlite3.Error:
+            pass
+        finally:
+            con.close()
+
+    if volumes is None or any(volumes[t] != n for t, n in expected.items()):
+        os.makedirs(os.path.dirname(os.path.abspath(args.database)), exist_ok=True)
+        start = time.perf_counter()
+        populate_large_database(args.database, args.entries, args.maintenance, args.hours_every)
+        print('\t\tBuilt {} in {:.2f}s'.format(args.database, time.perf_counter() - start))
+
+    previous_file = latest_results_file(QUERY_BENCHMARK_DIR)
+    results = run_query_benchmarks(args.database)
+
+    print(', '.join('{} {}'.format(n, t) for t, n in results['volumes'].items()))
+    for name, result in results['queries'].items():
+        print('{:<30} min {:10.4f}s  median {:10.4f}s{}'.format(
+            name, result['min'], result['median'],
+            '  full scan: ' + ', '.join(result['full_scans']) if result['full_scans'] else ''))
+        if args.plans:
+            for plan in result['plans']:
+                for detail in plan:
+                    print('\t' + detail)
+
+    print('\t\tSaved results to ' + save_results(results, QUERY_BENCHMARK_DIR))
+
+    previous = {}
+    if previous_file:
+        with open(previous_file) as f:
+            previous = json.load(f)
+
+    regressions = compare_query_results(previous, results)
+    if previous_file:
+        print('Compared with ' + previous_file + ':')
+    for r in regressions:
+        print('\tREGRESSION ' + r)
+    if previous_file and not regressions:
+        print('\tno regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+from typing import Optional
+
+import numpy as np
+
+import gpxpy
+from gpxpy.gpx import GPX, GPXTrackSegment
+
+import common as rt_args
+from track_stats import SegmentChannels, CHANNEL_NAMES, segment_channels
+
+RESAMPLE_STEPS = [1, 10, 60]
+
+# angles are interpolated and averaged as unit vectors so 359° and 1° average to 0°, not 180°
+CIRCULAR_CHANNELS = ['cog', 'twd', 'awa']
+LINEAR_CHANNELS = ['latitude', 'longitude'] + [c for c in CHANNEL_NAMES if c not in CIRCULAR_CHANNELS]
+
+# grid points further than this from logged data on both sides are left as NaN rather than bridged
+MAX_GAP_SECONDS = 60.0
+
+
+def time_grid(t: np.ndarray, step: float) -> np.ndarray:
+    valid_t = t[~np.isnan(t)]
+    if len(valid_t) == 0:
+        return np.empty(0)
+
+    # steps within the logged span only, so the grid never ends on a point past the last sample
+    start = np.ceil(valid_t[0] / step) * step
+    end = np.floor(valid_t[-1] / step) * step
+    return np.arange(start, end + step / 2.0, step)
+
+
+def interp_linear(grid: np.ndarray, t: np.ndarray, v: np.ndarray, max_gap=MAX_GAP_SECONDS) -> np.ndarray:
+    valid = ~(np.isnan(t) | np.isnan(v))
+    tv = t[valid]
+    vv = v[valid]
+
+    if len(tv) < 2:
+        return np.full(len(grid), np.nan)
+
+    result = np.interp(grid, tv, vv, left=np.nan, right=np.nan)
+
+    # blank grid points that fall inside a gap in the logged data
+    idx = np.clip(np.searchsorted(tv, grid, side='right'), 1, len(tv) - 1)
+    result[(tv[idx] - tv[idx - 1]) > max(max_gap, 0.0)] = np.nan
+
+    return result
+
+
+def interp_circular(grid: np.ndarray, t: np.ndarray, degrees: np.ndarray, max_gap=MAX_GAP_SECONDS) -> np.ndarray:
+    rads = np.radians(degrees)
+    s = interp_linear(grid, t, np.sin(rads), max_gap)
+    c = interp_linear(grid, t, np.cos(rads), max_gap)
+
+    return np.degrees(np.arctan2(s, c)) % 360.0
+
+
+def resample_channels(ch: SegmentChannels, step: float, max_gap=MAX_GAP_SECONDS) -> SegmentChannels:
+    # every channel interpolated onto a uniform time grid, step seconds apart
+    grid = time_grid(ch.time, step)
+    gap = max(max_gap, step)
+
+    values = {c: interp_linear(grid, ch.time, getattr(ch, c), gap) for c in LINEAR_CHANNELS}
+    values.update({c: interp_circular(grid, ch.time, getattr(ch, c), gap) for c in CIRCULAR_CHANNELS})
+
+    return SegmentChannels(grid, speed_units=ch.speed_units, **values)
+
+
+def time_weights(t: np.ndarray, max_gap=MAX_GAP_SECONDS) -> np.ndarray:
+    # each sample stands for half the interval to each neighbour, so dense bursts don't outweigh sparse stretches.
+    # intervals are capped so a sample either side of a long gap is not given the whole gap.
+    dt = np.minimum(np.diff(t), max_gap)
+    w = np.zeros(len(t))
+    w[:-1] += dt / 2.0
+    w[1:] += dt / 2.0
+
+    return w
+
+
+def time_weighted_mean(t: np.ndarray, v: np.ndarray, max_gap=MAX_GAP_SECONDS) -> Optional[float]:
+    valid = ~(np.isnan(t) | np.isnan(v))
+    if np.count_nonzero(valid) == 0:
+        return None
+
+    w = time_weights(t[valid], max_gap)
+    if w.sum() <= 0.0:
+        return float(np.mean(v[valid]))
+
+    return float(np.average(v[valid], weights=w))
+
+
+def time_weighted_circular_mean(t: np.ndarray, degrees: np.ndarray, max_gap=MAX_GAP_SECONDS) -> Optional[float]:
+    rads = np.radians(degrees)
+    s = time_weighted_mean(t, np.sin(rads), max_gap)
+    c = time_weighted_mean(t, np.cos(rads), max_gap)
+
+    if s is None or c is None:
+        return None
+
+    return float(np.degrees(np.arctan2(s, c)) % 360.0)
+
+
+def aggregate_channels(ch: SegmentChannels, step: float, max_gap=MAX_GAP_SECONDS) -> SegmentChannels:
+    # time weighted mean of every channel over consecutive step second bins, labelled by bin start time
+    grid = time_grid(ch.time, step)
+    if len(grid) == 0:
+        return resample_channels(ch, step, max_gap)
+
+    start = grid[0] - step
+    n_bins = len(grid) + 1
+    bins = np.clip(((ch.time - start) // step).astype(np.int64), 0, n_bins - 1)
+
+    def bin_mean(v: np.ndarray) -> np.ndarray:
+        valid = ~(np.isnan(ch.time) | np.isnan(v))
+        w = time_weights(ch.time[valid], max_gap)
+        totals = np.bincount(bins[valid], weights=w, minlength=n_bins)
+        sums = np.bincount(bins[valid], weights=w * v[valid], minlength=n_bins)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(totals > 0.0, sums / totals, np.nan)
+
+    values = {c: bin_mean(getattr(ch, c)) for c in LINEAR_CHANNELS}
+    for c in CIRCULAR_CHANNELS:
+        rads = np.radians(getattr(ch, c))
+        values[c] = np.degrees(np.arctan2(bin_mean(np.sin(rads)), bin_mean(np.cos(rads)))) % 360.0
+
+    bin_times = start + np.arange(n_bins) * step
+    has_data = ~np.isnan(values['latitude'])
+
+    return SegmentChannels(bin_times[has_data], speed_units=ch.speed_units,
+                           **{c: v[has_data] for c, v in values.items()})
+
+
+def print_resampled_summary(seg: GPXTrackSegment, step: float):
+    ch = segment_channels(seg)
+    resampled = resample_channels(ch, step)
+
+    print('\nStart: {}, raw points: {}, {}s grid points: {}'.format(seg.points[0].time, len(ch), step,
+                                                                    len(resampled)))
+
+    for c in ['sog', 'stw', 'tws']:
+        raw_avg = np.nanmean(getattr(ch, c)) if not np.all(np.isnan(getattr(ch, c))) else None
+        tw_avg = time_weighted_mean(ch.time, getattr(ch, c))
+
+        if raw_avg is not None:
+            print('\t{} avg: per point {:.2f}, time weighted {:.2f}'.format(c.upper(), raw_avg, tw_avg))
+
+
+def main():
+    fn = rt_args.select_data_file()
+    with rt_args.open_gpx(fn) as f:
+        gpx: GPX = gpxpy.parse(f)
+
+    step = int(input('Resample interval in seconds ' + str(RESAMPLE_STEPS) + ' : '))
+
+    for t in gpx.tracks:
+        for seg in t.segments:
+            if len(seg.points) < 2:
+                continue
+
+            if seg.points[0].time > seg.points[1].time:
+                seg.points.reverse()
+
+            print_resampled_summary(seg, step)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+import os
+import sqlite3
+from typing import Optional, TYPE_CHECKING
+
+import common as rt_args
+from database import SegmentIndexRecord, select_segment_index, replace_segment_index_records
+from timing import span, timed, count
+
+if TYPE_CHECKING:
+    from gpxpy.gpx import GPXTrackSegment
+
+# A multi-day export can hold hundreds of MB of points, but showing one logged trip needs only its segment.  Each
+# <trkseg> element's byte range is recorded when a file is cataloged or ingested, keyed by the start timestamp its log
+# entry has, so a trip is read with two small reads (the <gpx> root tag, for its namespaces, and the segment) instead
+# of a parse of the whole file.  Finding the ranges is a scan for tags, without parsing the points.
+SEGMENT_OPEN_TAG = b'<trkseg'
+SEGMENT_CLOSE_TAG = b'</trkseg>'
+TIME_OPEN_TAG = b'<time>'
+TIME_CLOSE_TAG = b'</time>'
+
+
+def tag_timestamp(data, start: int, end: int) -> Optional[int]:
+    from gpxpy.gpxfield import parse_time
+
+    close = data.find(TIME_CLOSE_TAG, start, end)
+    if close < 0:
+        return None
+
+    t = parse_time(data[start + len(TIME_OPEN_TAG):close].decode().strip())
+
+    return int(t.timestamp()) if t else None
+
+
+def segment_start_timestamp(data, start: int, end: int) -> Optional[int]:
+    # the start timestamp a log entry gets for the segment in data[start:end].  Segments logged newest point first
+    # are reversed before logging, so their last point's time is the start.
+    first = data.find(TIME_OPEN_TAG, start, end)
+    if first < 0:
+        return None
+    second = data.find(TIME_OPEN_TAG, first + 1, end)
+    last = data.rfind(TIME_OPEN_TAG, start, end)
+
+    first_timestamp = tag_timestamp(data, first, end)
+    if second < 0 or first_timestamp is None:
+        return first_timestamp
+
+    second_timestamp = tag_timestamp(data, second, end)
+    if second_timestamp is not None and first_timestamp > second_timestamp:
+        return tag_timestamp(data, last, end)
+
+    return first_timestamp
+
+
+@timed('scan_segment_offsets')
+def scan_segment_offsets(fn: str) -> list[SegmentIndexRecord]:
+    # offsets are into the xml, so for an archived file they are positions in the decompressed stream
+    st = os.stat(rt_args.get_file_loc(fn))
+
+    with rt_args.map_gpx(fn) as data:
+        root = data.find(b'<gpx')
+        header_length = data.find(b'>', root) + 1 if root >= 0 else 0
+        if header_length <= 0:
+            return []
+
+        recs = {}
+        pos = header_length
+        while True:
+            start = data.find(SEGMENT_OPEN_TAG, pos)
+            if start < 0:
+                break
+
+            close = data.find(SEGMENT_CLOSE_TAG, start)
+            if close < 0:
+                break
+            end = close + len(SEGMENT_CLOSE_TAG)
+
+            start_timestamp = segment_start_timestamp(data, start, end)
+
+            # the first of any segments starting at the same time wins, as it does when the whole file is parsed
+            if start_timestamp is not None and start_timestamp not in recs:
+                recs[start_timestamp] = SegmentIndexRecord(fn, start_timestamp, start, end - start, header_length,
+                                                           st.st_mtime_ns, st.st_size)
+            pos = end
+
+    return list(recs.values())
+
+
+def index_gpx_files(file_names: list[str], con: sqlite3.Connection) -> int:
+    # (re)indexes the given files, returning the number of segments found
+    recs = []
+    for fn in file_names:
+        try:
+            recs.extend(scan_segment_offsets(fn))
+        except OSError:
+            print('unable to index ' + fn)
+
+    replace_segment_index_records(file_names, recs, con)
+
+    return len(recs)
+
+
+def read_indexed_segment(rec: SegmentIndexRecord) -> Optional['GPXTrackSegment']:
+    import gpxpy
+    from gpxpy.gpx import GPXException
+
+    # an archived file can only seek forward by decompressing up to the offset, which still skips the parse
+    with rt_args.open_gpx(rec.file_name, 'rb') as f:
+        header = f.read(rec.header_length)
+        f.seek(rec.offset)
+        fragment = f.read(rec.length)
+
+    try:
+        with span('parse'):
+            gpx = gpxpy.parse((header + b'<trk>' + fragment + b'</trk></gpx>').decode())
+    except (GPXException, UnicodeDecodeError):
+        return None
+
+    if not gpx.tracks or not gpx.tracks[0].segments:
+        return None
+
+    return gpx.tracks[0].segments[0]
+
+
+def parse_logged_segment(fn: str, start_timestamp: int) -> Optional['GPXTrackSegment']:
+    # the whole file parse the index avoids, for when a file can't be indexed
+    import gpxpy
+
+    with span('parse'), rt_args.open_gpx(fn) as f:
+        gpx = gpxpy.parse(f)
+
+    for t in gpx.tracks:
+        for seg in t.segments:
+            if len(seg.points) < 2:
+                continue
+
+            if seg.points[0].time > seg.points[1].time:
+                seg.points.reverse()
+
+            if int(seg.get_time_bounds().start_time.timestamp()) == start_timestamp:
+                return seg
+
+    return None
+
+
+def is_current(rec: SegmentIndexRecord) -> bool:
+    try:
+        st = os.stat(rt_args.get_file_loc(rec.file_name))
+    except OSError:
+        return False
+
+    return (st.st_mtime_ns, st.st_size) == (rec.mtime_ns, rec.size)
+
+
+@timed('load_logged_segment')
+def load_logged_segment(fn: str, start_timestamp: int, con: Optional[sqlite3.Connection] = None) \
+        -> Optional['GPXTrackSegment']:
+    # the segment of fn with the given start timestamp, oldest point first.  A file that is not indexed, or has
+    # changed since, is indexed first.
+    own_con = con is None
+    if own_con:
+        con = sqlite3.connect(rt_args.DATABASE_LOC)
+
+    try:
+        rec = select_segment_index(fn, start_timestamp, con)
+        if rec is None or not is_current(rec):
+            count('segment index misses')
+            index_gpx_files([fn], con)
+            rec = select_segment_index(fn, start_timestamp, con)
+    finally:
+        if own_con:
+            con.close()
+
+    seg = read_indexed_segment(rec) if rec else None
+    if seg is not None and len(seg.points) > 1:
+        if seg.points[0].time > seg.points[1].time:
+            seg.points.reverse()
+
+        if int(seg.get_time_bounds().start_time.timestamp()) == start_timestamp:
+            count('points parsed', len(seg.points))
+            return seg
+
+    count('segment index fallbacks')
+    seg = parse_logged_segment(fn, start_timestamp)
+    if seg is not None:
+        count('points parsed', len(seg.points))
+
+    return seg
+
+
+def main():
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Index the segments of gpx files by start timestamp.')
+    parser.add_argument('files', nargs='*', help='gpx file names (default: every file in the gpx files directory)')
+    args = parser.parse_args()
+
+    file_names = args.files if args.files else rt_args.get_data_files()
+
+    start = time.perf_counter()
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    try:
+        num_segments = index_gpx_files(file_names, con)
+    finally:
+        con.close()
+
+    print('\t\tIndexed {} segments in {} files in {:.2f}s'.format(num_segments, len(file_names),
+                                                                  time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import math
+import random
+from datetime import datetime, timedelta, timezone
+
+import common as rt_args
+
+# synthetic tracks start in Puget Sound and sail a few tacks back and forth on a shifty northerly
+START_LAT = 47.6
+START_LON = -122.4
+START_TIME = datetime(2024, 5, 1, 15, 0, tzinfo=timezone.utc)
+
+GPX_HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<gpx version="1.1" creator="synthetic_gpx" xmlns="http://www.topografix.com/GPX/1/1">\n<trk>\n')
+GPX_FOOTER = '</trk>\n</gpx>\n'
+
+
+def point_comment(cog: float, sog: float, stw: float, twd: float, tws: float, awa: float, aws: float,
+                  depth: float, moving: bool) -> str:
+    # same layout as Yacht Devices exports: compound COG/SOG and AWA/AWS keys, units on every value, and TWD
+    # without the ':' separator.  Stationary points have no true wind, see PointExtension.effective_twd.
+    lines = ['Depth: {:.1f} m'.format(depth),
+             'STW: {:.1f} knots'.format(stw),
+             'COG/SOG: {:.1f}°/{:.1f} knots'.format(cog, sog)]
+
+    if moving:
+        lines.append('TWD {:.1f}°'.format(twd))
+        lines.append('TWS: {:.1f} knots'.format(tws))
+
+    lines.append('AWA/AWS: {:.1f}°/{:.1f} knots'.format(awa, aws))
+
+    return '\n'.join(lines)
+
+
+def generate_segment(num_points: int, start: datetime, rng: random.Random, stationary_fraction=0.1) -> list:
+    # (lat, lon, time, comment) tuples
+    return [(lat, lon, t, point_comment(*values))
+            for lat, lon, t, values in segment_samples(num_points, start, rng, stationary_fraction)]
+
+
+def segment_samples(num_points: int, start: datetime, rng: random.Random, stationary_fraction=0.1) -> list:
+    # (lat, lon, time, (cog, sog, stw, twd, tws, awa, aws, depth, moving)) tuples.  Intervals are irregular, with
+    # occasional bursts of 1 second fixes, and the first part of the segment is spent stationary, as when
+    # instruments are left on for the anchor alarm.
+    pts = []
+    lat = START_LAT + rng.uniform(-0.05, 0.05)
+    lon = START_LON + rng.uniform(-0.05, 0.05)
+    t = start
+
+    stationary_pts = int(num_points * stationary_fraction)
+    tack_pts = max(num_points // 20, 10)
+    wind_dir = rng.uniform(0.0, 360.0)
+
+    for i in range(num_points):
+        moving = i >= stationary_pts
+        twd = (wind_dir + 10.0 * math.sin(i / 300.0) + rng.gauss(0.0, 3.0)) % 360.0
+        tws = max(0.0, 12.0 + 4.0 * math.sin(i / 900.0) + rng.gauss(0.0, 1.0))
+
+        if moving:
+            tack = 1.0 if ((i - stationary_pts) // tack_pts) % 2 == 0 else -1.0
+            cog = (twd + tack * 45.0 + rng.gauss(0.0, 4.0)) % 360.0
+            stw = max(0.0, 4.0 + tws * 0.15 + rng.gauss(0.0, 0.3))
+            sog = max(0.0, stw + rng.gauss(0.0, 0.2))
+        else:
+            cog = rng.uniform(0.0, 360.0)
+            stw = 0.0
+            sog = 0.0
+
+        # apparent wind from the true wind and the boat's motion
+        twa_rads = math.radians(twd - cog)
+        aw_x = tws * math.cos(twa_rads) + stw
+        aw_y = tws * math.sin(twa_rads)
+        awa = math.degrees(math.atan2(aw_y, aw_x)) % 360.0
+        aws = math.hypot(aw_x, aw_y)
+        depth = max(2.0, 20.0 + 10.0 * math.sin(i / 500.0) + rng.gauss(0.0, 0.5))
+
+        # stationary fixes still wander by a metre or so
+        jitter = 0.0 if moving else 0.00001
+        pts.append((lat + rng.gauss(0.0, jitter), lon + rng.gauss(0.0, jitter), t,
+                    (cog, sog, stw, twd, tws, awa, aws, depth, moving)))
+
+        dt = 1.0 if rng.random() < 0.2 else rng.choice([5.0, 10.0, 10.0, 30.0])
+        t = t + timedelta(seconds=dt)
+
+        if moving:
+            d_deg = sog * dt / 3600.0 / 60.0
+            lat = lat + d_deg * math.cos(math.radians(cog))
+            lon = lon + d_deg * math.sin(math.radians(cog)) / math.cos(math.radians(lat))
+
+    return pts
+
+
+def trkpt_str(lat: float, lon: float, t: datetime, comment: str) -> str:
+    return ('<trkpt lat="{:.6f}" lon="{:.6f}"><time>{}</time><cmt>{}</cmt></trkpt>\n'
+            .format(lat, lon, t.strftime('%Y-%m-%dT%H:%M:%SZ'), comment))
+
+
+def generate_gpx_file(file_loc: str, num_points: int, num_segments: int = 1, reverse_every: int = 2, seed: int = 0):
+    # every reverse_every'th segment is written newest point first, as some exports are
+    rng = random.Random(seed)
+    pts_per_segment = max(num_points // num_segments, 2)
+    start = START_TIME
+
+    with open(file_loc, 'w') as f:
+        f.write(GPX_HEADER)
+
+        for s in range(num_segments):
+            pts = generate_segment(pts_per_segment, start, rng)
+            if reverse_every > 0 and s % reverse_every == reverse_every - 1:
+                pts.reverse()
+
+            f.write('<trkseg>\n')
+            for p in pts:
+                f.write(trkpt_str(*p))
+            f.write('</trkseg>\n')
+
+            start = max(p[2] for p in (pts[0], pts[-1])) + timedelta(hours=2)
+
+        f.write(GPX_FOOTER)
+
+
+def nmea_sentence(body: str) -> str:
+    checksum = 0
+    for c in body.encode():
+        checksum ^= c
+
+    return '${}*{:02X}\r\n'.format(body, checksum)
+
+
+def nmea_lat_lon(lat: float, lon: float) -> str:
+    lat_deg, lon_deg = int(abs(lat)), int(abs(lon))
+    return '{:02d}{:07.4f},{},{:03d}{:07.4f},{}'.format(lat_deg, (abs(lat) - lat_deg) * 60.0, 'N' if lat >= 0 else 'S',
+                                                        lon_deg, (abs(lon) - lon_deg) * 60.0, 'E' if lon >= 0 else 'W')
+
+
+def sample_sentences(lat: float, lon: float, t: datetime, values: tuple) -> list[str]:
+    # the sentences a Yacht Devices gateway logs for one fix, instruments first and RMC last
+    cog, sog, stw, twd, tws, awa, aws, depth, moving = values
+
+    sentences = ['IIVHW,,T,,M,{:.1f},N,{:.1f},K'.format(stw, stw * 1.852),
+                 'WIMWV,{:.1f},R,{:.1f},N,A'.format(awa, aws),
+                 'IIDPT,{:.1f},0.0'.format(depth)]
+    if moving:
+        sentences.append('WIMWD,{:.1f},T,,M,{:.1f},N,{:.1f},M'.format(twd, tws, tws / 1.94384))
+    sentences.append('GPRMC,{},A,{},{:.1f},{:.1f},{},,'.format(t.strftime('%H%M%S.00'), nmea_lat_lon(lat, lon), sog,
+                                                              cog, t.strftime('%d%m%y')))
+
+    return [nmea_sentence(s) for s in sentences]
+
+
+def generate_nmea_file(file_loc: str, num_points: int, num_segments: int = 1, seed: int = 0):
+    # the same sailing as generate_gpx_file, as a raw NMEA 0183 log with one RMC per point
+    rng = random.Random(seed)
+    pts_per_segment = max(num_points // num_segments, 2)
+    start = START_TIME
+
+    with open(file_loc, 'w', newline='') as f:
+        for _ in range(num_segments):
+            samples = segment_samples(pts_per_segment, start, rng)
+            for sample in samples:
+                f.writelines(sample_sentences(*sample))
+
+            start = samples[-1][2] + timedelta(hours=2)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Write a synthetic Yacht Devices style gpx file.')
+    parser.add_argument('num_points', type=int)
+    parser.add_argument('--segments', type=int, default=1)
+    parser.add_argument('--reverse-every', type=int, default=2, help='reverse every n-th segment (0 for none)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--nmea', action='store_true', help='write a raw NMEA 0183 log instead of gpx')
+    parser.add_argument('-o', '--output', help='file name, written to the output directory')
+    args = parser.parse_args()
+
+    if args.nmea:
+        fn = args.output if args.output else 'synthetic_{}.nmea'.format(args.num_points)
+        generate_nmea_file(rt_args.OUTPUT_DIR + fn, args.num_points, args.segments, args.seed)
+    else:
+        fn = args.output if args.output else 'synthetic_{}.gpx'.format(args.num_points)
+        generate_gpx_file(rt_args.OUTPUT_DIR + fn, args.num_points, args.segments, args.reverse_every, args.seed)
+    print('\t\tCreated ' + rt_args.OUTPUT_DIR + fn)
+
+
+if __name__ == '__main__':
+    main()
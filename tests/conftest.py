@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# the modules are run as scripts from the package directory, so they import each other as top level modules.  The
+# tests import their shared helpers the same way, whichever import mode pytest runs with.
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TESTS_DIR)
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+import common as rt_args
+
+
+@pytest.fixture
+def db_loc(tmp_path, monkeypatch):
+    # a fresh boat log in a temporary directory, used by everything that connects to rt_args.DATABASE_LOC
+    from database import create_database
+
+    loc = str(tmp_path / 'boat_log.db')
+    monkeypatch.setattr(rt_args, 'DATABASE_LOC', loc)
+    create_database()
+
+    return loc
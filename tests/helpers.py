@@ -0,0 +1,41 @@
+# synthetic tracks shared by the tests
+
+
+def make_channels(time, latitude=None, longitude=None, speed_units='kts', **values):
+    # SegmentChannels from plain lists, with missing channels NaN.  Without a position the boat sails due north at
+    # 6 kts from 48N 123W.
+    import numpy as np
+    from track_stats import SegmentChannels, CHANNEL_NAMES
+
+    time = np.asarray(time, dtype=np.float64)
+    if latitude is None:
+        latitude = 48.0 + (time - time[0]) * 6.0 / 3600.0 / 60.0
+    if longitude is None:
+        longitude = np.full(len(time), -123.0)
+
+    channels = {c: np.asarray(values[c], dtype=np.float64) if c in values else np.full(len(time), np.nan)
+                for c in CHANNEL_NAMES}
+
+    return SegmentChannels(time, np.asarray(latitude, dtype=np.float64), np.asarray(longitude, dtype=np.float64),
+                           speed_units=speed_units, **channels)
+
+
+def write_gpx(path, start_timestamp, num_points=120, step_seconds=10):
+    # a one segment GPX file sailing due north at 6 kts from 48N 123W, without any instrument data in the comments
+    from datetime import datetime, timezone
+    import gpxpy.gpx
+
+    gpx = gpxpy.gpx.GPX()
+    track = gpxpy.gpx.GPXTrack()
+    seg = gpxpy.gpx.GPXTrackSegment()
+    for i in range(num_points):
+        t = start_timestamp + i * step_seconds
+        seg.points.append(gpxpy.gpx.GPXTrackPoint(48.0 + i * step_seconds * 6.0 / 3600.0 / 60.0, -123.0,
+                                                  time=datetime.fromtimestamp(t, timezone.utc)))
+    track.segments.append(seg)
+    gpx.tracks.append(track)
+
+    with open(path, 'w') as f:
+        f.write(gpx.to_xml())
+
+    return str(path)
@@ -0,0 +1,72 @@
+import gzip
+import os
+
+import pytest
+
+import archive
+import common as rt_args
+from helpers import write_gpx
+
+
+@pytest.fixture
+def gpx_dir(tmp_path, monkeypatch):
+    path = tmp_path / 'gpx_files'
+    path.mkdir()
+    monkeypatch.setattr(rt_args, 'GPX_FILES_DIR', str(path))
+    write_gpx(path / 'a.gpx', 1672617600)
+    write_gpx(path / 'b.gpx', 1704153600)
+    return path
+
+
+def test_archived_file_reads_as_before(gpx_dir):
+    raw = (gpx_dir / 'a.gpx').read_bytes()
+
+    result = archive.archive_file('a.gpx', 'gz')
+
+    assert result.error is None
+    assert result.raw_size == len(raw)
+    assert sorted(os.listdir(gpx_dir)) == ['a.gpx.gz', 'b.gpx']
+    assert gzip.decompress((gpx_dir / 'a.gpx.gz').read_bytes()) == raw
+
+    assert rt_args.get_data_files() == ['b.gpx', 'a.gpx']
+    assert rt_args.get_file_loc('a.gpx') == str(gpx_dir / 'a.gpx.gz')
+    assert rt_args.get_file_loc('b.gpx') == str(gpx_dir / 'b.gpx')
+
+    with rt_args.open_gpx('a.gpx') as f:
+        assert f.read() == raw.decode()
+    with rt_args.map_gpx('a.gpx') as data:
+        assert bytes(data) == raw
+
+
+def test_failed_verification_keeps_the_raw_file(gpx_dir, monkeypatch):
+    raw = (gpx_dir / 'a.gpx').read_bytes()
+    monkeypatch.setattr(archive, 'file_digest', lambda f: 'corrupt')
+
+    result = archive.archive_file('a.gpx', 'gz')
+
+    assert result.error == 'decompressed copy does not match'
+    assert sorted(os.listdir(gpx_dir)) == ['a.gpx', 'b.gpx']
+    assert (gpx_dir / 'a.gpx').read_bytes() == raw
+
+
+def test_write_error_leaves_no_partial_file(gpx_dir, monkeypatch):
+    class FullDisk:
+        def __init__(self, file_loc):
+            self.f = open(file_loc, 'wb')
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.f.close()
+            return False
+
+        def write(self, chunk):
+            raise OSError('No space left on device')
+
+    monkeypatch.setattr(archive, 'compressed_writer', lambda file_loc, fmt: FullDisk(file_loc))
+
+    result = archive.archive_file('a.gpx', 'gz')
+
+    assert result.error == 'No space left on device'
+    assert sorted(os.listdir(gpx_dir)) == ['a.gpx', 'b.gpx']
@@ -0,0 +1,40 @@
+import sqlite3
+import sys
+
+import pytest
+
+import catalog
+import common as rt_args
+from helpers import write_gpx
+
+
+@pytest.fixture
+def gpx_dir(tmp_path, monkeypatch):
+    path = tmp_path / 'gpx_files'
+    path.mkdir()
+    monkeypatch.setattr(rt_args, 'GPX_FILES_DIR', str(path))
+    monkeypatch.setattr(catalog, '_refreshed_dir_mtime_ns', None)
+    return path
+
+
+def test_catalog_filters_by_track_year(db_loc, gpx_dir):
+    write_gpx(gpx_dir / 'a.gpx', 1672617600)  # 2023-01-02
+    write_gpx(gpx_dir / 'b.gpx', 1704153600)  # 2024-01-02
+
+    assert catalog.refresh_catalog() == 2
+    assert catalog.refresh_catalog() == 0
+
+    assert catalog.catalog_file_names('2024', refresh=False) == ['b.gpx']
+    assert catalog.catalog_file_names(refresh=False) == ['b.gpx', 'a.gpx']
+
+
+def test_main_upgrades_a_database_without_the_catalog(db_loc, gpx_dir, monkeypatch, capsys):
+    write_gpx(gpx_dir / 'a.gpx', 1672617600)
+    con = sqlite3.connect(db_loc)
+    con.execute('DROP TABLE GPX_FILE_CATALOG')
+    con.close()
+
+    monkeypatch.setattr(sys, 'argv', ['catalog.py'])
+    catalog.main()
+
+    assert 'a.gpx: 2023-01-02' in capsys.readouterr().out
@@ -0,0 +1,47 @@
+import sqlite3
+
+from database import LogEntryRecord, MaintenanceRecord, EXPORT_QRYS, add_to_database, iter_export_rows, \
+    select_track_refs
+
+
+def add_entries(con: sqlite3.Connection, *dates):
+    for i, d in enumerate(dates):
+        rec = LogEntryRecord(1000 + i, 'Trip', d, '', 'trip_{}.gpx'.format(i), '', '', '')
+        add_to_database(rec.table_name(), rec.values_str(), con)
+
+
+def test_select_track_refs_by_year_searches_the_date_index(db_loc):
+    con = sqlite3.connect(db_loc)
+    add_entries(con, '2023-12-31', '2024-01-01', '2024-12-31', '2025-01-01')
+
+    statements = []
+    con.set_trace_callback(statements.append)
+    assert select_track_refs(con, 2024) == [('trip_1.gpx', 1001), ('trip_2.gpx', 1002)]
+    con.set_trace_callback(None)
+
+    plan = con.execute('EXPLAIN QUERY PLAN ' + statements[-1]).fetchall()
+    assert any(r[-1].startswith('SEARCH L USING INDEX LOG_ENTRY_DATE_IDX') for r in plan)
+    con.close()
+
+
+def test_export_date_range_is_inclusive(db_loc):
+    con = sqlite3.connect(db_loc)
+    dates = ['2024-04-30', '2024-05-01', '2024-05-15', '2024-05-31', '2024-06-01']
+    add_entries(con, *dates)
+    for d in dates:
+        rec = MaintenanceRecord(None, d, 2, 1, '', '')
+        add_to_database(rec.table_name(), rec.values_str(), con)
+
+    for name in EXPORT_QRYS:
+        statements = []
+        con.set_trace_callback(statements.append)
+        rows = list(iter_export_rows(con, name, '2024-05-01', '2024-05-31'))
+        con.set_trace_callback(None)
+
+        assert [r[0] for r in rows] == ['2024-05-01', '2024-05-15', '2024-05-31'], name
+        assert [r[0] for r in iter_export_rows(con, name, start_date='2024-05-31')] == ['2024-05-31', '2024-06-01']
+        assert [r[0] for r in iter_export_rows(con, name, end_date='2024-04-30')] == ['2024-04-30']
+
+        plan = con.execute('EXPLAIN QUERY PLAN ' + statements[-1]).fetchall()
+        assert any(r[-1].startswith('SEARCH') and '_DATE_IDX' in r[-1] for r in plan), plan
+    con.close()
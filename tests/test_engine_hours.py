@@ -0,0 +1,51 @@
+import sqlite3
+from datetime import date
+
+from database import EngineHoursRecord, MaintenanceRecord, add_to_database
+from engine_hours import EngineHoursIndex, forecast_maintenance, hours_str
+
+
+def index_of(*readings) -> EngineHoursIndex:
+    return EngineHoursIndex([EngineHoursRecord(d, h) for d, h in readings])
+
+
+def test_interpolates_between_readings_only():
+    index = index_of(('2024-01-11', 120.0), ('2024-01-01', 100.0), ('2024-01-06', ''))
+
+    assert len(index) == 2
+    assert index.hours_at('2024-01-06') == 110.0
+    assert index.hours_at('2023-12-31') is None and index.hours_at('2024-01-12') is None
+    assert index.hours_at('sometime') is None
+    assert hours_str(index, '2024-01-06') == '~110.0'
+    assert hours_str(index, '2024-01-11', index.reading_on('2024-01-11')) == '120.0'
+
+
+def test_later_reading_for_a_day_replaces_it():
+    index = index_of(('2024-01-01', 100.0), ('2024-01-01', 101.5))
+
+    assert index.reading_on(date(2024, 1, 1)) == 101.5
+
+
+def test_hours_per_day_over_the_usage_window():
+    index = index_of(('2023-01-01', 0.0), ('2024-01-01', 365.0), ('2024-01-11', 385.0))
+
+    assert abs(index.hours_per_day(10) - 2.0) < 1e-9
+    assert abs(index.hours_per_day() - (385.0 - 10.0) / 365.0) < 1e-9
+
+
+def test_forecast_says_when_the_hours_are_as_of(db_loc):
+    con = sqlite3.connect(db_loc)
+    for rec in (EngineHoursRecord('2024-01-01', 100.0), EngineHoursRecord('2024-03-01', 160.0),
+                MaintenanceRecord(None, '2024-01-01', 2, 1, 'Oil and filter', 'Oil')):
+        add_to_database(rec.table_name(), rec.values_str(), con)
+
+    index = index_of(('2024-01-01', 100.0), ('2024-03-01', 160.0))
+    forecasts = {f.action: f for f in forecast_maintenance(con, today=date(2024, 6, 1), index=index)}
+    con.close()
+
+    oil = forecasts['Change engine oil']
+    assert (oil.days_since, oil.hours_since, oil.hours_as_of) == (152, 60.0, '2024-03-01')
+    # a reading a day since March is 40 hours to the 100 hour interval
+    assert oil.summary_string() == 'Change engine oil: last 2024-01-01 (152 days ago, 60.0 hours as of 2024-03-01), ' \
+                                   'overdue since 2024-04-10'
+    assert forecasts['Change water impeller'].summary_string() == 'Change water impeller: never done'
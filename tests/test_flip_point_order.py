@@ -0,0 +1,46 @@
+import os
+import random
+from datetime import timedelta
+
+import gpxpy
+
+import common as rt_args
+import flip_point_order
+from synthetic_gpx import GPX_HEADER, GPX_FOOTER, START_TIME, generate_segment, trkpt_str
+
+
+def test_fix_file_reorders_reversed_segment_after_self_closing_segment(tmp_path, monkeypatch):
+    gpx_dir = tmp_path / 'gpx_files'
+    out_dir = tmp_path / 'output'
+    gpx_dir.mkdir()
+    out_dir.mkdir()
+    monkeypatch.setattr(rt_args, 'GPX_FILES_DIR', str(gpx_dir))
+    monkeypatch.setattr(rt_args, 'OUTPUT_DIR', str(out_dir) + os.sep)
+
+    rng = random.Random(0)
+    first = generate_segment(20, START_TIME, rng)
+    reversed_pts = generate_segment(20, START_TIME + timedelta(hours=2), rng)
+
+    # the empty segment comes right before the reversed one, and a point without children sits in its own segment
+    with open(gpx_dir / 'a.gpx', 'w') as f:
+        f.write(GPX_HEADER)
+        f.write('<trkseg>\n' + ''.join(trkpt_str(*p) for p in first) + '</trkseg>\n')
+        f.write('<trkseg/>\n')
+        f.write('<trkseg>\n' + ''.join(trkpt_str(*p) for p in reversed(reversed_pts)) + '</trkseg>\n')
+        f.write('<trkseg>\n<trkpt lat="47.600000" lon="-122.400000"/>\n</trkseg>\n')
+        f.write(GPX_FOOTER)
+
+    with rt_args.map_gpx('a.gpx') as data:
+        scans = flip_point_order.scan_segments(data)
+    assert [len(s.times) for s in scans] == [20, 0, 20, 1]
+
+    assert flip_point_order.fix_file('a.gpx') == ('a.gpx', 1)
+
+    with open(out_dir / 'a.gpx') as f:
+        gpx = gpxpy.parse(f)
+
+    segments = gpx.tracks[0].segments
+    assert [len(s.points) for s in segments] == [20, 0, 20, 1]
+    assert [p.time for p in segments[0].points] == [p[2] for p in first]
+    assert [p.time for p in segments[2].points] == [p[2] for p in reversed_pts]
+    assert segments[3].points[0].time is None
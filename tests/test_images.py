@@ -0,0 +1,37 @@
+import numpy as np
+
+from images import TrackHeatmap, HEATMAP_MIN_ZOOM, mercator_xy, mercator_lon_lat
+
+
+def test_mercator_round_trip():
+    x, y = mercator_xy(np.array([-122.75]), np.array([48.1]))
+    lon, lat = mercator_lon_lat(float(x[0]), float(y[0]))
+
+    assert abs(lon + 122.75) < 1e-9
+    assert abs(lat - 48.1) < 1e-9
+
+
+def test_heatmap_counts_repeated_pixels():
+    heatmap = TrackHeatmap()
+    heatmap.add_coords(np.array([-122.75, -122.75]), np.array([48.1, 48.1]))
+    heatmap.add_coords(np.array([-122.75]), np.array([48.1]))
+    heatmap.compact()
+
+    assert heatmap.num_tracks == 2
+    assert len(heatmap.keys) == 1
+    assert heatmap.counts.tolist() == [3]
+
+
+def test_render_zoom_is_never_zero():
+    # tracks on opposite sides of the world only fit at zoom 0, which staticmap3 can't render without lines
+    heatmap = TrackHeatmap()
+    heatmap.add_coords(np.array([-179.0, 179.0]), np.array([-80.0, 80.0]))
+
+    assert heatmap.render_zoom(1000, 1000, 80) == HEATMAP_MIN_ZOOM
+
+
+def test_render_zoom_fits_a_small_area_closely():
+    heatmap = TrackHeatmap()
+    heatmap.add_coords(np.array([-122.80, -122.70]), np.array([48.05, 48.15]))
+
+    assert heatmap.render_zoom(1000, 1000, 80) >= 12
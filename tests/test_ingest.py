@@ -0,0 +1,54 @@
+import queue
+import sqlite3
+
+import pytest
+
+from database import LogEntryRecord, TrackStats, BestEffortRecord, add_to_database
+from ingest import SegmentResult, StageStats, write_batch, writer_worker, _DONE
+
+
+def segment_result(start_timestamp: int) -> SegmentResult:
+    entry = LogEntryRecord(start_timestamp, 'Trip', '2024-06-01', '', 'trip.gpx', '', '', '')
+    stats = TrackStats(start_timestamp, 0.0, 3600, 0, 6.0, 0.0, 6.0, 7.0, 5.5, 6.5, 12.0, 15.0, 270.0, 12.0)
+    return SegmentResult(entry, stats, [BestEffortRecord(start_timestamp, 600, 6.5, 6.0, 14.0)], start_timestamp + 3600,
+                         360, None)
+
+
+@pytest.fixture
+def con(db_loc):
+    con = sqlite3.connect(db_loc)
+    # a TRACK_STATS row left without its log entry makes inserting that segment's stats fail, after its LOG_ENTRY
+    # row is inserted
+    stats = segment_result(2000).stats
+    add_to_database(stats.table_name(), stats.values_str(), con)
+    yield con
+    con.close()
+
+
+def timestamps(con: sqlite3.Connection, tbl_name: str) -> list:
+    return [r[0] for r in con.execute('select start_timestamp from ' + tbl_name + ' order by start_timestamp')]
+
+
+def test_failed_batch_leaves_no_log_entries(con):
+    with pytest.raises(sqlite3.IntegrityError):
+        write_batch([segment_result(1000), segment_result(2000)], con)
+    con.rollback()
+
+    assert timestamps(con, 'LOG_ENTRY') == []
+    assert timestamps(con, 'TRACK_BEST_EFFORTS') == []
+
+
+def test_writer_skips_only_the_failed_segment(con, capsys):
+    q = queue.Queue()
+    for t in (1000, 2000, 3000):
+        q.put(segment_result(t))
+    q.put(_DONE)
+
+    stage = StageStats('write')
+    writer_worker(q, stage, batch_size=50)
+
+    assert stage.items == 3
+    assert timestamps(con, 'LOG_ENTRY') == [1000, 3000]
+    assert timestamps(con, 'TRACK_STATS') == [1000, 2000, 3000]
+    assert timestamps(con, 'TRACK_BEST_EFFORTS') == [1000, 3000]
+    assert 'failed to persist segment 2000' in capsys.readouterr().out
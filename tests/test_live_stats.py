@@ -0,0 +1,46 @@
+import random
+
+from gpxpy.gpx import GPXTrackSegment, GPXTrackPoint
+
+from live_stats import LiveSegmentStats, point_to_datagram, datagram_to_point
+from synthetic_gpx import generate_segment, START_TIME
+from track_stats import get_segment_stats
+
+
+def synthetic_segment(num_points: int = 500) -> GPXTrackSegment:
+    return GPXTrackSegment([GPXTrackPoint(lat, lon, time=t, comment=c)
+                            for lat, lon, t, c in generate_segment(num_points, START_TIME, random.Random(1))])
+
+
+def test_live_stats_match_batch_stats():
+    seg = synthetic_segment()
+    live = LiveSegmentStats()
+    for p in seg.points:
+        live.add_point(p)
+
+    got = live.snapshot()
+    expected = get_segment_stats(seg, 0.0)
+
+    assert (got.start_date, got.start_time, got.num_pts, got.speed_units) == \
+           (expected.start_date, expected.start_time, expected.num_pts, expected.speed_units)
+    assert (got.moving_time, got.stopped_time) == (expected.moving_time, expected.stopped_time)
+    for name in ('moving_distance', 'stopped_distance', 'avg_sog', 'max_stw', 'avg_stw', 'max_tws', 'avg_tws',
+                 'avg_wind_dir', 'avg_wind_spd'):
+        assert abs(getattr(got, name) - getattr(expected, name)) < 1e-6, name
+
+
+def test_snapshot_before_any_stw():
+    live = LiveSegmentStats()
+    for p in synthetic_segment(3).points:
+        p.comment = None
+        live.add_point(p)
+
+    stats = live.snapshot()
+    assert stats.num_pts == 3 and stats.avg_stw is None
+
+
+def test_datagram_round_trip():
+    p = synthetic_segment(1).points[0]
+    q = datagram_to_point(point_to_datagram(p))
+
+    assert (q.latitude, q.longitude, q.time, q.comment) == (p.latitude, p.longitude, p.time, p.comment)
@@ -0,0 +1,41 @@
+import sqlite3
+
+import numpy as np
+
+import common as rt_args
+import maneuvers
+from database import LogEntryRecord, add_to_database, select_maneuver_timestamps
+from helpers import make_channels, write_gpx
+
+
+def test_detect_tack():
+    # close hauled on starboard, then port, slowing through the turn
+    t = np.arange(0.0, 600.0)
+    twd = np.full(len(t), 0.0)
+    cog = np.where(t < 300.0, 315.0, 45.0)
+    stw = np.where(np.abs(t - 305.0) < 10.0, 3.0, 6.0)
+
+    found = maneuvers.detect_maneuvers(make_channels(t, cog=cog, twd=twd, tws=np.full(len(t), 12.0), stw=stw))
+
+    assert [m.kind for m in found] == ['tack']
+    assert abs(found[0].speed_loss - 3.0) < 1e-9
+
+
+def test_trips_without_maneuvers_are_not_analyzed_again(db_loc, tmp_path, monkeypatch):
+    start = 1700000000
+    monkeypatch.setattr(rt_args, 'GPX_FILES_DIR', str(tmp_path))
+    write_gpx(tmp_path / 'trip.gpx', start)
+    con = sqlite3.connect(db_loc)
+    rec = LogEntryRecord(start, 'Trip', '2023-11-14', '', 'trip.gpx', '', '', '')
+    add_to_database(rec.table_name(), rec.values_str(), con)
+
+    maneuvers.analyze_all_maneuvers()
+    assert select_maneuver_timestamps(con) == {start}
+    assert con.execute('select num_maneuvers from MANEUVER_ANALYSIS').fetchall() == [(0,)]
+    con.close()
+
+    def fail(ch):
+        raise AssertionError('analyzed twice')
+
+    monkeypatch.setattr(maneuvers, 'detect_maneuvers', fail)
+    maneuvers.analyze_all_maneuvers()
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+
+from gpxpy.gpx import GPXTrackSegment, GPXTrackPoint
+
+import common as rt_args
+from helpers import write_gpx
+from merge import MergeCounts, merge_points, stitch_segments, merge_files, STITCH_GAP_SECONDS
+
+START = datetime(2023, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def segment(seconds: list) -> GPXTrackSegment:
+    return GPXTrackSegment([GPXTrackPoint(48.0, -123.0, time=START + timedelta(seconds=s) if s is not None else None)
+                            for s in seconds])
+
+
+def offsets(points) -> list:
+    return [int((p.time - START).total_seconds()) for p in points]
+
+
+def test_merge_orders_and_drops_duplicates():
+    counts = MergeCounts()
+    # a reversed export, an overlapping one out of order, and a point without a time
+    merged = list(merge_points([segment([30, 20, 10, 0]), segment([20, 50, 40, None])], counts))
+
+    assert offsets(merged) == [0, 10, 20, 30, 40, 50]
+    assert (counts.points_in, counts.duplicates, counts.untimed) == (8, 1, 1)
+
+
+def test_stitch_splits_at_long_gaps():
+    points = segment([0, 10, 10 + STITCH_GAP_SECONDS, 20 + 2 * STITCH_GAP_SECONDS]).points
+
+    assert [offsets(s.points) for s in stitch_segments(iter(points))] == \
+           [[0, 10, 10 + STITCH_GAP_SECONDS], [20 + 2 * STITCH_GAP_SECONDS]]
+
+
+def test_merge_overlapping_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(rt_args, 'GPX_FILES_DIR', str(tmp_path))
+    start = int(START.timestamp())
+    write_gpx(tmp_path / 'a.gpx', start, num_points=60)
+    write_gpx(tmp_path / 'b.gpx', start + 300, num_points=60)
+
+    gpx, counts = merge_files(['a.gpx', 'b.gpx'])
+
+    assert counts.duplicates == 30
+    assert len(gpx.tracks[0].segments) == 1
+    assert len(gpx.tracks[0].segments[0].points) == 90
@@ -0,0 +1,53 @@
+import numpy as np
+
+import nmea
+from synthetic_gpx import nmea_sentence, generate_nmea_file
+
+
+def write_log(path, lines: list) -> str:
+    with open(path, 'w', newline='') as f:
+        f.writelines(lines)
+    return str(path)
+
+
+def test_checksums_gaps_and_instrument_values(tmp_path):
+    lines = [nmea_sentence('IIVHW,,T,,M,5.2,N,9.6,K'),
+             nmea_sentence('GPRMC,120000.00,A,4800.0000,N,12300.0000,W,5.5,10.0,010624,,'),
+             # a corrupted checksum, and a gateway timestamp in front of the sentence
+             nmea_sentence('IIVHW,,T,,M,9.9,N,18.3,K').replace('*', '*0'),
+             '12:00:10.123 ' + nmea_sentence('GPRMC,120010.00,A,4800.0150,N,12300.0000,W,5.5,10.0,010624,,'),
+             # more than NMEA_SEGMENT_GAP_SECONDS later
+             nmea_sentence('GPRMC,121000.00,A,4801.0000,S,12300.0000,E,5.5,10.0,010624,,'),
+             nmea_sentence('GPRMC,121010.00,A,4801.0150,S,12300.0000,E,5.5,10.0,010624,,')]
+
+    segments, stats = nmea.read_nmea_channels(write_log(tmp_path / 'boat.log', lines))
+
+    assert (stats.num_lines, stats.num_invalid, stats.num_fixes) == (6, 1, 4)
+    assert [len(s.time) for s in segments] == [2, 2]
+    assert segments[0].time[1] - segments[0].time[0] == 10.0
+    assert np.allclose(segments[0].latitude, [48.0, 48.00025])
+    assert np.allclose(segments[0].longitude, -123.0)
+    assert np.allclose(segments[0].stw, 5.2)
+    assert segments[1].latitude[0] < 0.0 and segments[1].longitude[0] > 0.0
+
+
+def test_chunk_boundaries_do_not_change_the_result(tmp_path, monkeypatch):
+    fn = str(tmp_path / 'boat.log')
+    generate_nmea_file(fn, 2000, num_segments=2)
+
+    whole, whole_stats = nmea.read_nmea_channels(fn)
+    monkeypatch.setattr(nmea, 'NMEA_CHUNK_BYTES', 4096)
+    chunked, chunked_stats = nmea.read_nmea_channels(fn)
+
+    assert whole_stats.num_fixes == chunked_stats.num_fixes == 2000
+    assert whole_stats.num_invalid == chunked_stats.num_invalid == 0
+    assert len(whole) == len(chunked) == 2
+    for a, b in zip(whole, chunked):
+        for name in ('time', 'latitude', 'longitude', 'stw', 'tws', 'twd', 'awa', 'aws', 'depth'):
+            assert np.array_equal(getattr(a, name), getattr(b, name), equal_nan=True), name
+
+
+def test_empty_log(tmp_path):
+    segments, stats = nmea.read_nmea_channels(write_log(tmp_path / 'empty.log', []))
+
+    assert segments == [] and stats.num_lines == 0
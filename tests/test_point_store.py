@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from helpers import make_channels
+from point_store import PointStoreWriter, PointStore, POINT_STORE_ALIGN, map_segments
+
+
+def segment_length(ch) -> int:
+    return len(ch)
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    path = str(tmp_path / 'points.store')
+    writer = PointStoreWriter(path)
+    # added out of order, and spread over two files
+    writer.add('b.gpx', 2000, make_channels(np.arange(5.0) + 2000.0, stw=np.linspace(4.0, 5.0, 5)))
+    writer.add('a.gpx', 1000, make_channels(np.arange(3.0) + 1000.0, speed_units='m/s'))
+    assert writer.finish() == 2
+
+    return path
+
+
+def test_segments_are_sorted_and_read_back(store_path):
+    store = PointStore(store_path)
+
+    assert len(store) == 2 and store.num_points == 8
+    assert [store.start_timestamp(i) for i in range(2)] == [1000, 2000]
+    assert [store.file_name(i) for i in range(2)] == ['a.gpx', 'b.gpx']
+
+    ch = store.channels(store.find(2000))
+    assert ch.time.tolist() == [2000.0, 2001.0, 2002.0, 2003.0, 2004.0]
+    assert np.allclose(ch.stw, np.linspace(4.0, 5.0, 5))
+    assert store.channels(0).speed_units == 'm/s' and np.isnan(store.channels(0).stw).all()
+    assert store.find(1500) is None
+
+
+def test_columns_are_aligned_views(store_path):
+    store = PointStore(store_path)
+
+    for column in store.columns.values():
+        assert (column.ctypes.data - store.data.ctypes.data) % POINT_STORE_ALIGN == 0
+
+
+def test_not_a_point_store(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'\0' * 64)
+
+    with pytest.raises(ValueError):
+        PointStore(str(path))
+
+
+def test_map_segments(store_path):
+    assert list(map_segments(segment_length, store_path, workers=1)) == [3, 5]
@@ -0,0 +1,53 @@
+import numpy as np
+
+from helpers import make_channels
+from polar import PolarAccumulator, true_wind_angles, true_wind_speeds, MIN_CELL_POINTS, TWA_BIN_DEG, TWS_BIN_KTS
+
+
+def test_true_wind_from_logged_direction():
+    ch = make_channels([0.0, 1.0], cog=[0.0, 350.0], twd=[90.0, 10.0], tws=[12.0, 12.0])
+
+    assert np.allclose(true_wind_angles(ch), [90.0, 20.0])
+    assert np.allclose(true_wind_speeds(ch), [12.0, 12.0])
+
+
+def test_true_wind_solved_from_apparent():
+    # 10 kts apparent on the beam at 5 kts through the water is 11.2 kts true, aft of the beam
+    ch = make_channels([0.0], stw=[5.0], awa=[90.0], aws=[10.0])
+
+    assert abs(true_wind_speeds(ch)[0] - np.hypot(10.0, 5.0)) < 1e-9
+    assert 90.0 < true_wind_angles(ch)[0] < 180.0
+
+
+def test_percentile_needs_enough_points_per_cell():
+    n = MIN_CELL_POINTS
+    ch = make_channels(np.arange(n), cog=np.zeros(n), twd=np.full(n, 95.0), tws=np.full(n, 11.0),
+                       stw=np.linspace(5.0, 6.0, n))
+
+    polar = PolarAccumulator()
+    polar.add_channels(ch, 1)
+    values = polar.percentile(1.0)
+
+    i, j = int(95.0 // TWA_BIN_DEG), int(11.0 // TWS_BIN_KTS)
+    assert abs(values[i, j] - 6.0) < 0.1
+    assert np.count_nonzero(~np.isnan(values)) == 1
+
+    polar.merge(PolarAccumulator())
+    assert polar.start_timestamps == {1}
+
+    polar.counts[i, j] = 0
+    polar.counts[i, j, 0] = n - 1
+    assert np.isnan(polar.percentile()[i, j])
+
+
+def test_save_and_load(tmp_path):
+    polar = PolarAccumulator()
+    polar.counts[1, 2, 3] = 7
+    polar.start_timestamps = {5, 6}
+
+    fn = str(tmp_path / 'polar.npz')
+    polar.save(fn)
+    loaded = PolarAccumulator.load(fn)
+
+    assert loaded.counts[1, 2, 3] == 7
+    assert loaded.start_timestamps == {5, 6}
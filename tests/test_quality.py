@@ -0,0 +1,39 @@
+import numpy as np
+
+from helpers import make_channels
+from quality import clean_channels, STUCK_SENSOR_SECONDS
+
+
+def test_spikes_and_bad_times_are_dropped():
+    t = np.arange(0.0, 100.0, 10.0)
+    ch = make_channels(t)
+    # a jump of a degree and back, a point logged twice, and a point without a fix
+    ch.latitude[4] += 1.0
+    ch.time[7] = ch.time[6]
+    ch.latitude[8] = np.nan
+
+    cleaned, report = clean_channels(ch)
+
+    assert cleaned.time.tolist() == [0.0, 10.0, 20.0, 30.0, 50.0, 60.0, 90.0]
+    assert report.dropped == {'no time or position': 1, 'duplicate time': 1, 'implied speed': 1, 'acceleration': 0}
+    assert report.num_dropped == 3
+
+
+def test_out_of_range_values_are_blanked_without_dropping_the_point():
+    t = np.arange(0.0, 50.0, 10.0)
+    ch = make_channels(t, stw=[5.0, 5.1, 99.0, 5.2, 5.0], depth=[10.0, 0.0, 10.0, 9.0, 9.0])
+    cleaned, report = clean_channels(ch)
+
+    assert len(cleaned) == 5
+    assert np.isnan(cleaned.stw[2]) and np.isnan(cleaned.depth[1])
+    assert report.blanked['stw out of range'] == 1 and report.blanked['depth out of range'] == 1
+
+
+def test_stuck_sensor_is_blanked_only_while_moving():
+    t = np.arange(0.0, STUCK_SENSOR_SECONDS + 60.0, 10.0)
+    moving, moving_report = clean_channels(make_channels(t, stw=np.full(len(t), 4.2)))
+    anchored, anchored_report = clean_channels(make_channels(t, latitude=np.full(len(t), 48.0),
+                                                             stw=np.full(len(t), 0.0)))
+
+    assert np.isnan(moving.stw).all() and moving_report.blanked['stuck stw'] == len(t)
+    assert not np.isnan(anchored.stw).any() and anchored_report.blanked['stuck stw'] == 0
@@ -0,0 +1,20 @@
+import sqlite3
+
+from query_benchmark import populate_large_database, fixture_volumes, num_engine_hours_readings
+
+
+def test_fixture_volumes_match_the_build_parameters(tmp_path):
+    db_loc = str(tmp_path / 'large.db')
+
+    for hours_every in (1, 7):
+        populate_large_database(db_loc, 50, 20, hours_every)
+        con = sqlite3.connect(db_loc)
+        try:
+            volumes = fixture_volumes(con)
+        finally:
+            con.close()
+
+        assert volumes == {'LOG_ENTRY': 50, 'TRACK_STATS': 50, 'MAINTENANCE': 20,
+                           'ENGINE_HOURS': num_engine_hours_readings(50, hours_every)}
+
+    assert num_engine_hours_readings(50, 1) != num_engine_hours_readings(50, 7)
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from gpxpy.gpx import GPXTrackSegment, GPXTrackPoint
+
+from helpers import make_channels
+from resample import time_grid, interp_linear, interp_circular, resample_channels, time_weighted_mean, \
+    time_weighted_circular_mean, aggregate_channels
+from track_stats import get_segment_stats
+
+
+def test_time_grid_starts_on_a_step_boundary():
+    grid = time_grid(np.array([1003.0, 1011.0, 1027.0]), 10.0)
+
+    assert grid.tolist() == [1010.0, 1020.0]
+    assert time_grid(np.array([1000.0, 1020.0]), 10.0).tolist() == [1000.0, 1010.0, 1020.0]
+
+
+def test_interp_linear_blanks_gaps():
+    t = np.array([0.0, 10.0, 200.0, 210.0])
+    v = np.array([0.0, 10.0, 20.0, 30.0])
+
+    result = interp_linear(np.array([5.0, 100.0, 205.0]), t, v, max_gap=60.0)
+
+    assert result[0] == 5.0
+    assert np.isnan(result[1])
+    assert result[2] == 25.0
+
+
+def test_interp_circular_wraps_through_north():
+    result = interp_circular(np.array([5.0]), np.array([0.0, 10.0]), np.array([350.0, 10.0]))
+
+    assert abs(((result[0] + 180.0) % 360.0) - 180.0) < 1e-9
+
+
+def test_resample_channels_is_uniform():
+    ch = make_channels([0.0, 1.5, 2.0, 5.0], stw=[4.0, 5.0, 6.0, 6.0], cog=[0.0, 0.0, 0.0, 0.0])
+
+    resampled = resample_channels(ch, 1.0)
+
+    assert resampled.time.tolist() == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+    assert abs(resampled.stw[1] - 4.0 - 2.0 / 3.0) < 1e-9
+
+
+def test_time_weighted_mean_discounts_bursts():
+    # three samples in one second then a sample a minute later.  Unweighted the burst's 10s dominate.
+    t = np.array([0.0, 0.5, 1.0, 60.0])
+    v = np.array([10.0, 10.0, 10.0, 0.0])
+
+    assert time_weighted_mean(t, v) < 6.0
+    assert time_weighted_mean(t, np.full(4, np.nan)) is None
+
+
+def test_time_weighted_circular_mean():
+    t = np.array([0.0, 10.0])
+
+    mean = time_weighted_circular_mean(t, np.array([355.0, 5.0]))
+
+    assert min(mean, 360.0 - mean) < 1e-9
+
+
+def test_aggregate_channels_bins_by_start_time():
+    ch = make_channels(np.arange(0.0, 20.0), stw=np.r_[np.full(10, 4.0), np.full(10, 6.0)])
+
+    agg = aggregate_channels(ch, 10.0)
+
+    assert agg.time.tolist() == [0.0, 10.0]
+    assert np.allclose(agg.stw, [4.0, 6.0])
+
+
+def burst_segment() -> GPXTrackSegment:
+    # an hour logged once a minute, then a minute logged every second in a different breeze
+    start = datetime(2024, 6, 1, 12, 0, tzinfo=timezone.utc)
+    seconds = list(range(0, 3600, 60)) + list(range(3600, 3660))
+
+    def comment(s: int) -> str:
+        stw, twd, tws = (4.0, 350.0, 10.0) if s < 3600 else (8.0, 30.0, 20.0)
+        return 'STW: {:.1f} knots\nTWD {:.1f}°\nTWS: {:.1f} knots'.format(stw, twd, tws)
+
+    return GPXTrackSegment([GPXTrackPoint(48.0 + s * 6.0 / 3600.0 / 60.0, -123.0, time=start + timedelta(seconds=s),
+                                          comment=comment(s)) for s in seconds])
+
+
+def test_time_weighted_segment_stats():
+    seg = burst_segment()
+    per_point = get_segment_stats(seg, 0.0)
+    weighted = get_segment_stats(seg, 0.0, time_weighted=True)
+
+    assert abs(per_point.avg_stw - 6.0) < 0.1
+    assert weighted.avg_stw < 4.1 and weighted.avg_tws < 10.3
+    # the burst pulls the per point direction round past north, but barely moves the time weighted one
+    assert 10.0 < per_point.avg_wind_dir < 20.0
+    assert 350.0 < weighted.avg_wind_dir < 352.0
+    assert weighted.avg_wind_spd < per_point.avg_wind_spd
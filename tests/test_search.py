@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+from database import LogEntryRecord, MaintenanceRecord, add_to_database, fts_query, search_log_entries, \
+    search_maintenance, create_search_tables
+
+
+@pytest.fixture
+def con(db_loc):
+    con = sqlite3.connect(db_loc)
+    for rec in (LogEntryRecord(1000, 'Sucia Island', '2024-06-01', 'Sam', 'a.gpx', 'Home', 'Sucia',
+                               'Engine overheated\nimpeller changed'),
+                LogEntryRecord(2000, 'Impeller run', '2024-06-02', 'Sam', 'a.gpx', 'Sucia', 'Home', 'Calm'),
+                MaintenanceRecord(None, '2024-06-03', 1, 1, 'Old one cracked\r\nnew impeller fitted', 'Impeller')):
+        add_to_database(rec.table_name(), rec.values_str(), con)
+    yield con
+    con.close()
+
+
+def integrity_check(con: sqlite3.Connection):
+    for fts in ('LOG_ENTRY_FTS', 'MAINTENANCE_FTS'):
+        con.execute("INSERT INTO {0}({0}, rank) VALUES ('integrity-check', 1)".format(fts))
+
+
+def test_fts_query_quotes_each_word_as_a_prefix():
+    assert fts_query('impel "oil" AND-filter') == '"impel"* "oil"* "AND"* "filter"*'
+    assert fts_query(' -*" ') == ''
+
+
+def test_multi_line_notes_are_indexed_word_by_word(con):
+    assert [h.id for h in search_log_entries(con, 'impeller')] == [2000, 1000]
+    assert search_log_entries(con, 'nimpeller') == []
+    assert [h.id for h in search_log_entries(con, 'overheated changed')] == [1000]
+
+    hit = search_log_entries(con, 'changed')[0]
+    assert '\\' not in hit.snippet and '[changed]' in hit.snippet
+
+    hits = search_maintenance(con, 'new impeller')
+    assert [h.title for h in hits] == ['Change water impeller']
+    assert search_maintenance(con, 'nnew') == []
+
+    integrity_check(con)
+
+
+def test_updates_and_deletes_keep_the_index_in_step(con):
+    con.execute("UPDATE LOG_ENTRY SET notes = 'Reefed\\nearly' WHERE start_timestamp = 1000")
+    con.execute('DELETE FROM MAINTENANCE')
+    con.commit()
+
+    assert [h.id for h in search_log_entries(con, 'early')] == [1000]
+    assert [h.id for h in search_log_entries(con, 'impeller')] == [2000]
+    assert search_maintenance(con, 'impeller') == []
+
+    integrity_check(con)
+
+
+def test_indexes_from_before_the_views_are_rebuilt(con, db_loc):
+    # the earlier index read the stored text directly, so it held 'nimpeller'
+    con.executescript("""
+        DROP VIEW LOG_ENTRY_SEARCH_VIEW;
+        DROP TABLE LOG_ENTRY_FTS;
+        CREATE VIRTUAL TABLE LOG_ENTRY_FTS USING fts5(title, crew, start_loc, end_loc, notes, content='LOG_ENTRY',
+            content_rowid='start_timestamp', tokenize='porter unicode61 remove_diacritics 2');
+        INSERT INTO LOG_ENTRY_FTS(LOG_ENTRY_FTS) VALUES ('rebuild');
+    """)
+    assert [h.id for h in search_log_entries(con, 'nimpeller')] == [1000]
+
+    create_search_tables()
+
+    assert search_log_entries(con, 'nimpeller') == []
+    assert [h.id for h in search_log_entries(con, 'impeller')] == [2000, 1000]
+    integrity_check(con)
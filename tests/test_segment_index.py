@@ -0,0 +1,123 @@
+import gzip
+import os
+import shutil
+import sqlite3
+from dataclasses import replace
+
+import gpxpy
+import pytest
+
+import common as rt_args
+import segment_index
+from database import select_segment_index, replace_segment_index_records
+from synthetic_gpx import generate_gpx_file
+
+
+@pytest.fixture
+def gpx_dir(tmp_path, monkeypatch):
+    path = tmp_path / 'gpx_files'
+    path.mkdir()
+    monkeypatch.setattr(rt_args, 'GPX_FILES_DIR', str(path))
+    return path
+
+
+def parsed_segments(file_loc) -> dict:
+    # start timestamp -> [(time, lat, lon)] of every segment, oldest point first, from a parse of the whole file
+    with open(file_loc) as f:
+        gpx = gpxpy.parse(f)
+
+    segments = {}
+    for seg in gpx.tracks[0].segments:
+        if seg.points[0].time > seg.points[1].time:
+            seg.points.reverse()
+        segments[int(seg.points[0].time.timestamp())] = point_values(seg)
+
+    return segments
+
+
+def point_values(seg) -> list:
+    return [(p.time, p.latitude, p.longitude) for p in seg.points]
+
+
+def read_in_order(rec):
+    seg = segment_index.read_indexed_segment(rec)
+    if seg.points[0].time > seg.points[1].time:
+        seg.points.reverse()
+    return point_values(seg)
+
+
+def test_indexed_segments_match_a_full_parse(gpx_dir):
+    # every second segment is written newest point first
+    generate_gpx_file(gpx_dir / 'a.gpx', 400, num_segments=4)
+    expected = parsed_segments(gpx_dir / 'a.gpx')
+
+    recs = segment_index.scan_segment_offsets('a.gpx')
+
+    assert sorted(r.start_timestamp for r in recs) == sorted(expected)
+    for rec in recs:
+        assert read_in_order(rec) == expected[rec.start_timestamp]
+
+
+def test_archived_file_is_indexed_in_its_decompressed_offsets(gpx_dir):
+    generate_gpx_file(gpx_dir / 'a.gpx', 400, num_segments=4)
+    expected = parsed_segments(gpx_dir / 'a.gpx')
+
+    with open(gpx_dir / 'a.gpx', 'rb') as src, gzip.open(gpx_dir / 'a.gpx.gz', 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(gpx_dir / 'a.gpx')
+
+    recs = segment_index.scan_segment_offsets('a.gpx')
+
+    assert sorted(r.start_timestamp for r in recs) == sorted(expected)
+    assert all(r.size == os.path.getsize(gpx_dir / 'a.gpx.gz') for r in recs)
+    for rec in recs:
+        assert read_in_order(rec) == expected[rec.start_timestamp]
+
+
+def test_changed_file_is_reindexed(db_loc, gpx_dir):
+    generate_gpx_file(gpx_dir / 'a.gpx', 400, num_segments=4)
+    first = min(parsed_segments(gpx_dir / 'a.gpx'))
+
+    con = sqlite3.connect(db_loc)
+    segment_index.index_gpx_files(['a.gpx'], con)
+    old = select_segment_index('a.gpx', first, con)
+    assert segment_index.is_current(old)
+
+    # same size, newer mtime
+    st = os.stat(gpx_dir / 'a.gpx')
+    os.utime(gpx_dir / 'a.gpx', ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert not segment_index.is_current(old)
+
+    seg = segment_index.load_logged_segment('a.gpx', first, con)
+    assert point_values(seg) == parsed_segments(gpx_dir / 'a.gpx')[first]
+    assert select_segment_index('a.gpx', first, con).mtime_ns == st.st_mtime_ns + 10 ** 9
+
+    # rewritten with the same first segment start but other points, so the offsets and size change
+    generate_gpx_file(gpx_dir / 'a.gpx', 600, num_segments=3, seed=1)
+    expected = parsed_segments(gpx_dir / 'a.gpx')
+    assert first in expected
+
+    seg = segment_index.load_logged_segment('a.gpx', first, con)
+    assert point_values(seg) == expected[first]
+    assert select_segment_index('a.gpx', first, con).size == os.path.getsize(gpx_dir / 'a.gpx')
+    con.close()
+
+
+def test_bad_index_falls_back_to_parsing_the_file(db_loc, gpx_dir):
+    generate_gpx_file(gpx_dir / 'a.gpx', 400, num_segments=4)
+    expected = parsed_segments(gpx_dir / 'a.gpx')
+    first, second = sorted(expected)[:2]
+
+    con = sqlite3.connect(db_loc)
+    segment_index.index_gpx_files(['a.gpx'], con)
+
+    # still current, but pointing at the wrong segment
+    wrong = select_segment_index('a.gpx', second, con)
+    replace_segment_index_records(['a.gpx'], [replace(wrong, start_timestamp=first)], con)
+
+    seg = segment_index.load_logged_segment('a.gpx', first, con)
+    assert point_values(seg) == expected[first]
+    con.close()
+
+    assert point_values(segment_index.parse_logged_segment('a.gpx', second)) == expected[second]
+    assert segment_index.parse_logged_segment('a.gpx', 0) is None
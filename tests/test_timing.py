@@ -0,0 +1,105 @@
+import os
+import time
+
+import pytest
+
+import timing
+
+
+@pytest.fixture
+def profiling(tmp_path, monkeypatch):
+    monkeypatch.setattr(timing, 'ENABLED', True)
+    monkeypatch.setattr(timing, 'CPROFILE_ENABLED', True)
+    monkeypatch.setattr(timing, 'PROFILE_DIR', str(tmp_path))
+    timing.reset()
+    yield tmp_path
+    timing.reset()
+
+
+def test_nested_spans_share_the_outer_profile(profiling):
+    with timing.span('outer'):
+        with timing.span('inner'):
+            pass
+        with timing.span('inner'):
+            pass
+
+    assert timing.span_totals['outer'][0] == 1
+    assert timing.span_totals['inner'][0] == 2
+    assert [fn.startswith('outer_') for fn in os.listdir(profiling)] == [True]
+
+
+def test_profile_dumps_do_not_overwrite(profiling):
+    for _ in range(3):
+        with timing.span('stage'):
+            pass
+
+    assert len(os.listdir(profiling)) == 3
+
+
+def test_timed_generator_covers_iteration(profiling):
+    @timing.timed('rows', counter='queries')
+    def rows():
+        for i in range(3):
+            time.sleep(0.01)
+            yield i
+
+    gen = rows()
+    assert 'rows' not in timing.span_totals
+
+    assert list(gen) == [0, 1, 2]
+    calls, total, _ = timing.span_totals['rows']
+    assert calls == 1 and total >= 0.03
+    assert timing.counters['queries'] == 1
+    assert len(os.listdir(profiling)) == 1
+
+
+def test_timed_generator_closed_early(profiling):
+    @timing.timed('rows')
+    def rows():
+        yield from range(10)
+
+    with timing.span('export'):
+        for i in rows():
+            if i == 2:
+                break
+
+    assert timing.span_totals['rows'][0] == 1
+    assert [fn.startswith('export_') for fn in os.listdir(profiling)] == [True]
+
+
+def test_span_in_another_thread_gets_its_own_profile(profiling):
+    import threading
+
+    entered, release = threading.Event(), threading.Event()
+
+    def worker():
+        with timing.span('worker'):
+            entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    entered.wait(5)
+    try:
+        with timing.span('main'):
+            pass
+    finally:
+        release.set()
+        thread.join()
+
+    assert sorted(fn.split('_')[0] for fn in os.listdir(profiling)) == ['main', 'worker']
+
+
+def test_counts_from_threads_are_not_lost(profiling):
+    from concurrent.futures import ThreadPoolExecutor
+
+    def work(_):
+        for _ in range(1000):
+            timing.count('points')
+            timing.add_span_time('stage', 0.001)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(work, range(8)))
+
+    assert timing.counters['points'] == 8000
+    assert timing.span_totals['stage'][0] == 8000
@@ -0,0 +1,55 @@
+import numpy as np
+
+from helpers import make_channels
+from window_stats import cumulative_integral, best_window_average, get_best_efforts, best_sog
+
+
+def test_cumulative_integral_skips_gaps_and_missing_values():
+    t = np.array([0.0, 10.0, 20.0, 200.0, 210.0])
+    v = np.array([1.0, 1.0, np.nan, 1.0, 1.0])
+
+    integral, covered = cumulative_integral(t, v, max_gap=60.0)
+
+    assert integral.tolist() == [0.0, 10.0, 10.0, 10.0, 20.0]
+    assert covered.tolist() == [0.0, 10.0, 10.0, 10.0, 20.0]
+
+
+def test_best_window_finds_the_fastest_stretch():
+    t = np.arange(0.0, 600.0)
+    v = np.where((t >= 200.0) & (t < 300.0), 8.0, 4.0)
+    integral, covered = cumulative_integral(t, v)
+
+    assert abs(best_window_average(t, integral, covered, 60.0) - 8.0) < 1e-9
+    assert best_window_average(t, integral, covered, 1000.0) is None
+
+
+def test_best_window_needs_coverage():
+    # one sample a minute apart from a 30 minute gap: not enough logged time for a 10 minute window
+    t = np.array([0.0, 60.0, 1860.0, 1920.0])
+    integral, covered = cumulative_integral(t, np.full(4, 5.0))
+
+    assert best_window_average(t, integral, covered, 600.0) is None
+
+
+def test_best_sog_from_distance_without_logged_sog():
+    # make_channels sails north at 6 kts
+    ch = make_channels(np.arange(0.0, 1200.0, 2.0))
+
+    assert abs(best_sog(ch, 600.0) - 6.0) < 0.01
+
+
+def test_get_best_efforts():
+    t = np.arange(0.0, 4000.0)
+    ch = make_channels(t, sog=np.full(len(t), 5.0), stw=np.full(len(t), 4.5), tws=np.full(len(t), 12.0))
+
+    efforts = get_best_efforts(ch, [60, 3600])
+
+    assert [e.duration_seconds for e in efforts] == [60, 3600]
+    assert all(abs(e.sog - 5.0) < 1e-9 and abs(e.stw - 4.5) < 1e-9 and abs(e.tws - 12.0) < 1e-9 for e in efforts)
+
+
+def test_best_sog_from_distance_leaves_out_gaps():
+    # 6 kts logged every 10 s, with a 300 s dropout the boat keeps sailing through
+    t = np.concatenate((np.arange(0.0, 1200.0, 10.0), np.arange(1500.0, 3000.0, 10.0)))
+
+    assert abs(best_sog(make_channels(t), 600.0) - 6.0) < 0.01
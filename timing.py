@@ -0,0 +1,192 @@
+import atexit
+import inspect
+import itertools
+import os
+import threading
+import time
+from contextlib import nullcontext
+from functools import wraps
+from typing import Optional
+
+import common as rt_args
+
+# BOAT_LOG_PROFILE=1 times each pipeline stage and prints a breakdown at exit.  BOAT_LOG_PROFILE=cprofile also writes a
+# pstats dump per stage to the profiles directory.  Unset, spans are a shared no-op and timed functions are left
+# undecorated, so instrumentation costs nothing.
+PROFILE_ENV_VAR = 'BOAT_LOG_PROFILE'
+PROFILE_MODE = os.environ.get(PROFILE_ENV_VAR, '').strip().lower()
+ENABLED = PROFILE_MODE not in ('', '0', 'false', 'off')
+CPROFILE_ENABLED = PROFILE_MODE == 'cprofile'
+PROFILE_DIR = rt_args.OUTPUT_DIR + 'profiles'
+
+# span name -> [calls, total seconds, max seconds]
+span_totals: dict[str, list] = {}
+counters: dict[str, int] = {}
+
+# spans and counts are recorded from worker threads too, such as the image renderers in ingest.py
+_totals_lock = threading.Lock()
+
+_DISABLED_SPAN = nullcontext()
+
+# only one cProfile profiler can be enabled at a time per thread, so spans nested inside a profiled span are part of
+# its profile rather than profiled on their own.  The depth is per thread since a profiler only sees its own thread.
+_profile_state = threading.local()
+
+# dumps of the same stage within a second, or from concurrent processes, each get their own file
+_dump_sequence = itertools.count()
+
+
+def start_profile(profiler=None):
+    # a profiler enabled for the outermost span, otherwise None.  profiler is reused if given.
+    depth = getattr(_profile_state, 'depth', 0) + 1
+    _profile_state.depth = depth
+    if not CPROFILE_ENABLED or depth > 1:
+        return None
+
+    if profiler is None:
+        import cProfile
+        profiler = cProfile.Profile()
+
+    profiler.enable()
+    return profiler
+
+
+def stop_profile(profiler):
+    _profile_state.depth -= 1
+    if profiler is not None:
+        profiler.disable()
+
+
+def add_span_time(name: str, elapsed: float):
+    with _totals_lock:
+        totals = span_totals.setdefault(name, [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += elapsed
+        totals[2] = max(totals[2], elapsed)
+
+
+class Span:
+    __slots__ = ('name', 'start', 'profiler')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+        self.profiler = None
+
+    def __enter__(self):
+        self.profiler = start_profile()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        add_span_time(self.name, time.perf_counter() - self.start)
+
+        stop_profile(self.profiler)
+        if self.profiler is not None:
+            dump_profile(self.name, self.profiler)
+
+        return False
+
+
+def span(name: str):
+    return Span(name) if ENABLED else _DISABLED_SPAN
+
+
+def timed(name: str, counter: Optional[str] = None):
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        if inspect.isgeneratorfunction(fn):
+            return timed_generator(name, fn, counter)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if counter:
+                count(counter)
+
+            with Span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def timed_generator(name: str, fn, counter: Optional[str] = None):
+    # calling a generator function only creates the generator, so the span covers the time spent producing items
+    # until it is exhausted or closed, and not the caller's work between them
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if counter:
+            count(counter)
+
+        gen = fn(*args, **kwargs)
+        elapsed = 0.0
+        profiler = None
+        try:
+            while True:
+                # one profile across every item, enabled only while items are produced outside any other span
+                active = start_profile(profiler)
+                profiler = active or profiler
+                start = time.perf_counter()
+                try:
+                    item = next(gen)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                    stop_profile(active)
+
+                yield item
+        finally:
+            gen.close()
+            add_span_time(name, elapsed)
+            if profiler is not None:
+                dump_profile(name, profiler)
+
+    return wrapper
+
+
+def count(name: str, n: int = 1):
+    if ENABLED:
+        with _totals_lock:
+            counters[name] = counters.get(name, 0) + n
+
+
+def dump_profile(name: str, profiler):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    file_name = '{}_{}_{}_{}.pstats'.format(name.replace(' ', '_').replace('.', '_'), time.strftime('%Y%m%d_%H%M%S'),
+                                            os.getpid(), next(_dump_sequence))
+    profiler.dump_stats(os.path.join(PROFILE_DIR, file_name))
+
+
+def report_str() -> str:
+    if not ENABLED:
+        return 'Timing is disabled.  Set ' + PROFILE_ENV_VAR + '=1 to enable it.'
+
+    with _totals_lock:
+        totals = {name: list(t) for name, t in span_totals.items()}
+        counts = dict(counters)
+
+    lines = ['{:<36} {:>7} {:>10} {:>10} {:>10}'.format('Stage', 'Calls', 'Total s', 'Mean ms', 'Max ms')]
+    for name, (calls, total, max_s) in sorted(totals.items(), key=lambda kv: kv[1][1], reverse=True):
+        lines.append('{:<36} {:>7} {:>10.3f} {:>10.2f} {:>10.2f}'.format(name, calls, total, total / calls * 1000.0,
+                                                                      max_s * 1000.0))
+
+    if counts:
+        lines.append('')
+        for name, n in sorted(counts.items()):
+            lines.append('{:<36} {:>7}'.format(name, n))
+
+    return '\n'.join(lines)
+
+
+def reset():
+    with _totals_lock:
+        span_totals.clear()
+        counters.clear()
+
+
+if ENABLED:
+    atexit.register(lambda: print(report_str()))
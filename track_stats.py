@@ -3,11 +3,13 @@ from dataclasses import dataclass
 from datetime import date, datetime, timedelta
 
 import gpxpy
+import numpy as np
 
 from gpxpy.gpx import GPXTrackSegment, GPXTrackPoint
 from gpxpy.gpx import GPX
 
 import common as rt_args
+from timing import timed
 
 from typing import Optional
 
@@ -196,6 +198,97 @@ class SegmentStats:
                                self.stopped_distance)
 
 
+@dataclass()
+class SegmentChannels:
+    # one numpy array per channel, aligned by point index.  Missing values are NaN, time is epoch seconds.
+    time: np.ndarray
+    latitude: np.ndarray
+    longitude: np.ndarray
+    sog: np.ndarray
+    stw: np.ndarray
+    cog: np.ndarray
+    twd: np.ndarray
+    tws: np.ndarray
+    awa: np.ndarray
+    aws: np.ndarray
+    depth: np.ndarray
+    speed_units: str = 'kts'
+
+    def __len__(self):
+        return len(self.time)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, c).nbytes for c in ['time', 'latitude', 'longitude'] + CHANNEL_NAMES)
+
+    def compact(self) -> 'SegmentChannels':
+        # instrument values only carry a decimal place or two, so float32 halves them without losing data.  Time and
+        # position stay float64, as float32 would round them to minutes and metres.
+        values = {c: getattr(self, c).astype(COMPACT_CHANNEL_DTYPE, copy=False) for c in CHANNEL_NAMES}
+        return SegmentChannels(self.time, self.latitude, self.longitude, speed_units=self.speed_units, **values)
+
+
+CHANNEL_NAMES = ['sog', 'stw', 'cog', 'twd', 'tws', 'awa', 'aws', 'depth']
+COMPACT_CHANNEL_DTYPE = np.float32
+
+# comment lines written by channels_to_segment, in the layout PointExtension parses
+CHANNEL_COMMENT_FMTS = [('depth', 'Depth: {:.1f} m'), ('stw', 'STW: {:.2f} {}'), ('cog', 'COG: {:.1f}°'),
+                        ('sog', 'SOG: {:.2f} {}'), ('twd', 'TWD: {:.1f}°'), ('tws', 'TWS: {:.2f} {}'),
+                        ('awa', 'AWA: {:.1f}°'), ('aws', 'AWS: {:.2f} {}')]
+
+
+@timed('segment_channels')
+def segment_channels(seg: GPXTrackSegment, p_extensions: Optional[list[PointExtension]] = None,
+                     compact: bool = False) -> SegmentChannels:
+    # without p_extensions each point's comment is decoded into the arrays and dropped, rather than first building a
+    # PointExtension, with its dict of strings, for every point in the segment
+    n = len(seg.points)
+    time = np.full(n, np.nan)
+    lat = np.full(n, np.nan)
+    lon = np.full(n, np.nan)
+    channels = {c: np.full(n, np.nan, dtype=COMPACT_CHANNEL_DTYPE if compact else np.float64) for c in CHANNEL_NAMES}
+    speed_units = 'kts'
+
+    for i, p in enumerate(seg.points):
+        pe = p_extensions[i] if p_extensions is not None else PointExtension(p)
+        if i == 0:
+            speed_units = pe.speed_units()
+
+        if p.time:
+            time[i] = p.time.timestamp()
+        lat[i] = p.latitude
+        lon[i] = p.longitude
+
+        for c, values in channels.items():
+            v = getattr(pe, c)
+            if v is not None:
+                values[i] = v
+
+    return SegmentChannels(time, lat, lon, speed_units=speed_units, **channels)
+
+
+def channels_to_segment(ch: SegmentChannels) -> GPXTrackSegment:
+    # for the places that still need gpxpy, such as rendering images or writing gpx.  Points get back their
+    # instrument values as comments, so PointExtension reads the same values from them.
+    from datetime import timezone
+
+    units = 'knots' if ch.speed_units == 'kts' else ch.speed_units
+
+    points = []
+    for i in range(len(ch)):
+        lines = []
+        for c, fmt in CHANNEL_COMMENT_FMTS:
+            v = getattr(ch, c)[i]
+            if not np.isnan(v):
+                lines.append(fmt.format(float(v), units))
+
+        t = None if np.isnan(ch.time[i]) else datetime.fromtimestamp(float(ch.time[i]), timezone.utc)
+        points.append(GPXTrackPoint(float(ch.latitude[i]), float(ch.longitude[i]), time=t,
+                                    comment='\n'.join(lines) if lines else None))
+
+    return GPXTrackSegment(points)
+
+
 def m_to_nm(m: float) -> float:
     return m * 0.0005399566666666666
 
@@ -233,10 +326,15 @@ def calculate_wind_averages(p_extensions: list[PointExtension]) -> (float, float
         return f(rads) * pe.tws
 
     ew_total = sum(map(lambda pe: spd_component(math.sin, pe), p_extensions))
-    ew_avg = (ew_total / len(p_extensions)) * -1.0
-
     ns_total = sum(map(lambda pe: spd_component(math.cos, pe), p_extensions))
-    ns_avg = (ns_total / len(p_extensions)) * -1.0
+
+    return wind_averages_from_sums(ew_total, ns_total, len(p_extensions))
+
+
+def wind_averages_from_sums(ew_total: float, ns_total: float, n: int) -> (float, float):
+    # split out of calculate_wind_averages, so the vector sums can also be accumulated a point at a time
+    ew_avg = (ew_total / n) * -1.0
+    ns_avg = (ns_total / n) * -1.0
 
     # this is a vector length average, NOT the average of the speeds.
     avg_spd = math.sqrt(ew_avg ** 2 + ns_avg ** 2)
@@ -263,7 +361,18 @@ def remove_stationary_pts(seg: GPXTrackSegment) -> GPXTrackSegment:
     return new_seg
 
 
-def get_segment_stats(seg: GPXTrackSegment, extreemes_percentile=0.05) -> SegmentStats:
+@timed('get_segment_stats')
+def get_segment_stats(seg: GPXTrackSegment, extreemes_percentile=0.05, time_weighted=False,
+                      clean=False) -> SegmentStats:
+    # with clean, GPS spikes and sensor glitches are removed by quality.clean_segment first, and no top speeds are
+    # ignored
+    p_extensions = None
+    if clean:
+        from quality import clean_segment
+
+        seg, p_extensions, _ = clean_segment(seg)
+        extreemes_percentile = 0.0
+
     t_bounds = seg.get_time_bounds()
     if t_bounds[0] is not None:
         s_date = t_bounds[0].date()
@@ -277,7 +386,8 @@ def get_segment_stats(seg: GPXTrackSegment, extreemes_percentile=0.05) -> Segmen
     m_t, s_t, moving_m, stopped_m, max_spd = \
         seg.get_moving_data(speed_extreemes_percentiles=extreemes_percentile)
 
-    p_extensions = list(map(lambda p: PointExtension(p), seg.points))
+    if p_extensions is None:
+        p_extensions = list(map(lambda p: PointExtension(p), seg.points))
     stw = list(filter(lambda s: (s is not None), (map(lambda pe: pe.stw, p_extensions))))
 
     if len(p_extensions) > 0:
@@ -314,6 +424,23 @@ def get_segment_stats(seg: GPXTrackSegment, extreemes_percentile=0.05) -> Segmen
 
         (avg_wind_dir, avg_wind_speed) = calculate_wind_averages(tw_data)
 
+        # weight each sample by the time it covers, so bursts of densely logged points don't skew the averages
+        if time_weighted:
+            from resample import time_weighted_mean, time_weighted_circular_mean
+
+            ch = segment_channels(seg, p_extensions)
+            avg_stw = time_weighted_mean(ch.time, ch.stw)
+            if avg_tws is not None:
+                tws = np.where(np.isnan(ch.twd), np.nan, ch.tws)
+                twd = np.where(np.isnan(tws), np.nan, ch.twd)
+                avg_tws = time_weighted_mean(ch.time, tws)
+                avg_wind_dir = time_weighted_circular_mean(ch.time, twd)
+
+                # still a vector length average, of the time weighted wind components
+                ew = time_weighted_mean(ch.time, tws * np.sin(np.radians(twd)))
+                ns = time_weighted_mean(ch.time, tws * np.cos(np.radians(twd)))
+                avg_wind_speed = math.hypot(ew, ns)
+
         return SegmentStats(s_date, start_t, moving_t, stopped_t, moving_d, stopped_d, num_pts, speed_units,
                             max_sog, avg_sog, max_stw, avg_stw, max_tws, avg_tws, avg_wind_dir, avg_wind_speed)
     else:
@@ -339,6 +466,32 @@ def analyze_track_segments(gpx, speed_pct_ignore):
             #     print_segment_stats(filtered_seg, speed_pct_ignore)
 
 
+def iter_logged_segments(track_refs: list[tuple[str, int]]):
+    # read only the referenced segments, each through the segment index with a seek and a parse of its own bytes.
+    # Only one segment is held in memory at a time.
+    import sqlite3
+    from segment_index import load_logged_segment
+
+    timestamps_by_file: dict[str, set[int]] = {}
+    for fn, start_timestamp in track_refs:
+        timestamps_by_file.setdefault(fn, set()).add(start_timestamp)
+
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+    try:
+        for fn, timestamps in timestamps_by_file.items():
+            for start_timestamp in sorted(timestamps):
+                try:
+                    seg = load_logged_segment(fn, start_timestamp, con)
+                except OSError:
+                    print('unable to read ' + fn)
+                    break
+
+                if seg is not None:
+                    yield seg
+    finally:
+        con.close()
+
+
 def get_speed_pct_to_ignore():
     speed_pct_ignore = int(input('Pct of top speeds to ignore (0 - 50, recommended: 5) : '))
     speed_pct_ignore = min(max(speed_pct_ignore, 0), 50) / 100.0
@@ -348,7 +501,7 @@ def get_speed_pct_to_ignore():
 # https://ocefpaf.github.io/python4oceanographers/blog/2014/08/18/gpx/
 def main():
     fn = rt_args.select_data_file()
-    gpx: GPX = gpxpy.parse(open(rt_args.get_file_loc(fn)))
+    gpx: GPX = gpxpy.parse(rt_args.open_gpx(fn))
 
     speed_pct_ignore = get_speed_pct_to_ignore()
 
@@ -0,0 +1,150 @@
+import sqlite3
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from gpxpy.gpx import GPXTrackSegment
+
+import common as rt_args
+from database import select_track_refs, select_best_effort_timestamps, add_to_database, BestEffortRecord
+from track_stats import SegmentChannels, segment_channels, iter_logged_segments
+
+BEST_EFFORT_DURATIONS = [60, 600, 3600]
+
+# a window must have logged data for at least this fraction of its duration to count
+MIN_WINDOW_COVERAGE = 0.9
+MAX_GAP_SECONDS = 60.0
+EARTH_RADIUS_NM = 3440.065
+
+
+@dataclass()
+class BestEffort:
+    duration_seconds: int
+    sog: Optional[float]
+    stw: Optional[float]
+    tws: Optional[float]
+
+    def summary_str(self) -> str:
+        def fmt(v: Optional[float]) -> str:
+            return 'n/a' if v is None else '{:.1f}'.format(v)
+
+        return '\tBest {} min: SOG {}, STW {}, sustained TWS {}'.format(self.duration_seconds // 60, fmt(self.sog),
+                                                                       fmt(self.stw), fmt(self.tws))
+
+
+def logged_intervals(t: np.ndarray, v: np.ndarray, max_gap=MAX_GAP_SECONDS) -> np.ndarray:
+    # intervals between consecutive points with v at both ends and no longer than max_gap
+    dt = np.diff(t)
+    return ~(np.isnan(v[:-1]) | np.isnan(v[1:]) | np.isnan(dt)) & (dt > 0.0) & (dt <= max_gap)
+
+
+def cumulative_integral(t: np.ndarray, v: np.ndarray, max_gap=MAX_GAP_SECONDS) -> (np.ndarray, np.ndarray):
+    # running trapezoid integral of v over time, and running total of the time actually covered by logged data.
+    # intervals with a missing value at either end, or longer than max_gap, contribute nothing.
+    dt = np.diff(t)
+    logged = logged_intervals(t, v, max_gap)
+
+    area = np.where(logged, (v[:-1] + v[1:]) / 2.0 * dt, 0.0)
+    covered = np.where(logged, dt, 0.0)
+
+    return np.concatenate(([0.0], np.cumsum(area))), np.concatenate(([0.0], np.cumsum(covered)))
+
+
+def best_window_average(t: np.ndarray, integral: np.ndarray, covered: np.ndarray, duration: float) -> Optional[float]:
+    # every point is tried as a window start; window sums come from differences of the running totals, so the
+    # cost is linear in the number of points whatever the window length.
+    if len(t) < 2:
+        return None
+
+    starts = (t + duration) <= t[-1]
+    if not np.any(starts):
+        return None
+
+    ends = t[starts] + duration
+    window_integral = np.interp(ends, t, integral) - integral[starts]
+    window_covered = np.interp(ends, t, covered) - covered[starts]
+
+    ok = window_covered >= duration * MIN_WINDOW_COVERAGE
+    if not np.any(ok):
+        return None
+
+    return float(np.max(window_integral[ok] / window_covered[ok]))
+
+
+def cumulative_distance_nm(ch: SegmentChannels, max_gap=MAX_GAP_SECONDS) -> (np.ndarray, np.ndarray):
+    # running distance along the track, and running time covered, over the same logged intervals as
+    # cumulative_integral.  A leg across a gap adds neither, so the distance sailed during a dropout isn't spread
+    # over windows that only cover its time in part.
+    lat = np.radians(ch.latitude)
+    lon = np.radians(ch.longitude)
+
+    a = (np.sin(np.diff(lat) / 2.0) ** 2 +
+         np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2.0) ** 2)
+    d = 2.0 * EARTH_RADIUS_NM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    logged = logged_intervals(ch.time, lat + lon, max_gap)
+    d = np.where(logged, d, 0.0)
+    covered = np.where(logged, np.diff(ch.time), 0.0)
+
+    return np.concatenate(([0.0], np.cumsum(d))), np.concatenate(([0.0], np.cumsum(covered)))
+
+
+def best_sog(ch: SegmentChannels, duration: float) -> Optional[float]:
+    if not np.all(np.isnan(ch.sog)):
+        integral, covered = cumulative_integral(ch.time, ch.sog)
+        return best_window_average(ch.time, integral, covered, duration)
+
+    # no logged SOG, so use distance made good along the track.  Distance is in nm, so nm / hours gives knots.
+    distance, covered = cumulative_distance_nm(ch)
+    best = best_window_average(ch.time, distance, covered, duration)
+
+    return None if best is None else best * 3600.0
+
+
+def get_best_efforts(ch: SegmentChannels, durations=None) -> list[BestEffort]:
+    if durations is None:
+        durations = BEST_EFFORT_DURATIONS
+
+    stw_integral, stw_covered = cumulative_integral(ch.time, ch.stw)
+    tws_integral, tws_covered = cumulative_integral(ch.time, ch.tws)
+
+    efforts = []
+    for d in durations:
+        efforts.append(BestEffort(int(d),
+                                  best_sog(ch, d),
+                                  best_window_average(ch.time, stw_integral, stw_covered, d),
+                                  best_window_average(ch.time, tws_integral, tws_covered, d)))
+
+    return efforts
+
+
+def get_segment_best_efforts(seg: GPXTrackSegment, durations=None) -> list[BestEffort]:
+    return get_best_efforts(segment_channels(seg), durations)
+
+
+def create_best_effort_records(start_timestamp: int, efforts: list[BestEffort]) -> list[BestEffortRecord]:
+    return [BestEffortRecord(start_timestamp, e.duration_seconds, e.sog, e.stw, e.tws) for e in efforts]
+
+
+def backfill_best_efforts():
+    # compute best efforts for every logged trip that doesn't have them yet
+    con = sqlite3.connect(rt_args.DATABASE_LOC)
+
+    try:
+        done = select_best_effort_timestamps(con)
+        track_refs = [r for r in select_track_refs(con) if r[1] not in done]
+
+        for seg in iter_logged_segments(track_refs):
+            ch = segment_channels(seg)
+            start_timestamp = int(seg.get_time_bounds().start_time.timestamp())
+
+            for rec in create_best_effort_records(start_timestamp, get_best_efforts(ch)):
+                add_to_database(rec.table_name(), rec.values_str(), con)
+
+        print('\t\tComputed best efforts for {} trips'.format(len(track_refs)))
+    finally:
+        con.close()
+
+
+if __name__ == '__main__':
+    backfill_best_efforts()